@@ -1,6 +1,64 @@
 # borrowing/admin.py
 from django.contrib import admin
-from .models import Item, Asset, Loan, ItemCategory
+from django.core.paginator import Paginator
+from django.db import connection, DatabaseError
+from django.utils.functional import cached_property
+from .models import (
+    Item, Asset, Loan, ItemCategory, LoanEvent, Job, ArchivedLoan, WaitlistEntry, RecurringReservation, LoanBundle,
+    AutoApprovalRule, QuotaPolicy, UserLoanCounter, MaintenanceWindow,
+)
+from . import services
+
+
+# ---------- Paginator สำหรับตารางใหญ่ ----------
+def _estimate_rows(model):
+    """ประมาณจำนวนแถวจากสถิติของฐานข้อมูล (ไม่สแกนตาราง) คืน None ถ้าประมาณไม่ได้"""
+    table = model._meta.db_table
+    try:
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE relname = %s", [table])
+                row = cursor.fetchone()
+                return row[0] if row and row[0] >= 0 else None
+            if connection.vendor == 'sqlite':
+                # มีหลัง ANALYZE: คอลัมน์ stat ขึ้นต้นด้วยจำนวนแถว
+                try:
+                    cursor.execute("SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1", [table])
+                    row = cursor.fetchone()
+                    if row and row[0]:
+                        return int(row[0].split()[0])
+                except DatabaseError:
+                    pass
+            # สำรอง: MAX(pk) อ่านจากปลาย index ของ primary key (O(log n))
+            pk = model._meta.pk.column
+            cursor.execute(f'SELECT MAX("{pk}") FROM "{table}"')
+            row = cursor.fetchone()
+            return row[0] if row else None
+    except DatabaseError:
+        return None
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    changelist ที่ไม่มีตัวกรอง/ค้นหา ใช้ค่าประมาณแทน COUNT(*) เมื่อตารางใหญ่เกิน ESTIMATE_THRESHOLD
+    (ถ้ามีตัวกรองยังนับจริง เพราะตัวเลขต้องตรงกับผลที่กรอง)
+    """
+    ESTIMATE_THRESHOLD = 50_000
+
+    @cached_property
+    def count(self):
+        query = getattr(self.object_list, 'query', None)
+        if query is not None and not query.where:
+            estimate = _estimate_rows(self.object_list.model)
+            if estimate and estimate > self.ESTIMATE_THRESHOLD:
+                return estimate
+        return super().count
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    paginator = EstimatedCountPaginator
+    # ไม่ต้องนับทั้งตารางซ้ำอีกรอบเพื่อแสดง "x จากทั้งหมด y"
+    show_full_result_count = False
 
 
 # ---------- ItemCategory ----------
@@ -13,30 +71,59 @@ class ItemCategoryAdmin(admin.ModelAdmin):
 
 # ---------- Item ----------
 @admin.register(Item)
-class ItemAdmin(admin.ModelAdmin):
+class ItemAdmin(LargeTableAdmin):
     # ใช้ category แทน item_type
     list_display = ("name", "organization", "category", "total_quantity", "available_quantity", "added_at")
     search_fields = ("name", "description", "category__name", "organization__name")
     list_filter = ("organization", "category", "added_at")
+    list_select_related = ("organization", "category")
+    autocomplete_fields = ("organization", "category")
     readonly_fields = ("total_quantity", "available_quantity", "added_at")
 
 
 # ---------- Asset ----------
 @admin.register(Asset)
-class AssetAdmin(admin.ModelAdmin):
+class AssetAdmin(LargeTableAdmin):
     list_display = ("item", "serial_number", "device_id", "location", "status")
     search_fields = ("item__name", "serial_number", "device_id", "location")
-    list_filter = ("status", "item__organization", "item__category", "location")
-    list_editable = ("location", "status")
+    # organization เป็นคีย์ในตารางตัวเองแล้ว; ตัด location ออก (ต้อง DISTINCT ทั้งตาราง) ใช้ค้นหาแทน
+    list_filter = ("status", "organization", "item__category")
+    list_select_related = ("item__organization",)
+    autocomplete_fields = ("item",)
+    # แก้สถานะทีละแถวจะเรียก Asset.save() นับตัวนับใหม่ทุกแถว -> ใช้ action เปลี่ยนเป็นชุดแทน
+    list_editable = ("location",)
+    actions = ["mark_available", "mark_maintenance", "mark_retired"]
+
+    def _bulk_status(self, request, queryset, status):
+        updated, skipped = services.bulk_set_asset_status(queryset, status)
+        msg = f"เปลี่ยนสถานะ {updated} ชิ้น"
+        if skipped:
+            msg += f" (ข้าม {skipped} ชิ้นที่กำลังถูกยืม)"
+        self.message_user(request, msg)
+
+    @admin.action(description="เปลี่ยนเป็น: พร้อมใช้งาน")
+    def mark_available(self, request, queryset):
+        self._bulk_status(request, queryset, 'available')
+
+    @admin.action(description="เปลี่ยนเป็น: บำรุงรักษา")
+    def mark_maintenance(self, request, queryset):
+        self._bulk_status(request, queryset, 'maintenance')
+
+    @admin.action(description="เปลี่ยนเป็น: ปลดระวาง")
+    def mark_retired(self, request, queryset):
+        self._bulk_status(request, queryset, 'retired')
 
 
 # ---------- Loan ----------
 @admin.register(Loan)
-class LoanAdmin(admin.ModelAdmin):
+class LoanAdmin(LargeTableAdmin):
     list_display = ("asset_display", "borrower", "reason", "borrow_date", "due_date", "return_date", "status")
     search_fields = ("asset__serial_number", "asset__device_id", "asset__item__name", "borrower__username", "reason")
-    list_filter = ("status", "borrow_date", "due_date", "asset__item__organization", "asset__item__category")
-    list_editable = ("status",)
+    list_filter = ("status", "borrow_date", "due_date", "organization", "asset__item__category")
+    list_select_related = ("asset__item", "borrower")
+    autocomplete_fields = ("asset", "borrower")
+    # เปลี่ยนสถานะผ่าน action (ใช้ state machine) แทนการแก้ในลิสต์ทีละแถว
+    actions = ["approve_selected", "reject_selected", "return_selected"]
 
     def asset_display(self, obj):
         if obj.asset.serial_number:
@@ -46,3 +133,159 @@ class LoanAdmin(admin.ModelAdmin):
         return f"{obj.asset.item.name} (Asset {obj.asset.id})"
 
     asset_display.short_description = "อุปกรณ์"
+
+    # แก้สถานะจากหน้าแอดมินก็เป็น transition: บันทึก LoanEvent ให้ log ครบทุกช่องทาง
+    STATUS_EVENT_KINDS = {
+        'pending': 'requested',
+        'approved': 'approved',
+        'returned': 'returned',
+        'rejected': 'rejected',
+        'overdue': 'overdue',
+    }
+
+    def save_model(self, request, obj, form, change):
+        old_status = form.initial.get('status', '') if change else ''
+        super().save_model(request, obj, form, change)
+        if obj.status != old_status:
+            services.record_event(
+                obj, self.STATUS_EVENT_KINDS[obj.status], old_status, obj.status, actor=request.user
+            )
+
+    def _bulk_transition(self, request, queryset, action, label):
+        done, failed = 0, 0
+        # ส่งเข้า engine ทีละรายการ (ต้องเช็กทับช่วง/เขียน event) แต่โหลดทั้งชุดใน query เดียว
+        for loan in queryset.select_related('asset__item'):
+            ok, _ = services.transition(loan, action, actor=request.user)
+            done += ok
+            failed += not ok
+        msg = f"{label} {done} รายการ"
+        if failed:
+            msg += f" (ทำไม่ได้ {failed} รายการ เนื่องจากสถานะ/ช่วงเวลาไม่ตรงเงื่อนไข)"
+        self.message_user(request, msg)
+
+    @admin.action(description="อนุมัติรายการที่เลือก")
+    def approve_selected(self, request, queryset):
+        self._bulk_transition(request, queryset.filter(status='pending'), 'approve', "อนุมัติ")
+
+    @admin.action(description="ปฏิเสธรายการที่เลือก")
+    def reject_selected(self, request, queryset):
+        self._bulk_transition(request, queryset.filter(status__in=['pending', 'approved']), 'reject', "ปฏิเสธ")
+
+    @admin.action(description="บันทึกคืนรายการที่เลือก")
+    def return_selected(self, request, queryset):
+        self._bulk_transition(request, queryset.filter(status__in=['approved', 'overdue']), 'return', "รับคืน")
+
+
+# ---------- LoanEvent (audit, อ่านอย่างเดียว) ----------
+@admin.register(LoanEvent)
+class LoanEventAdmin(LargeTableAdmin):
+    list_display = ("id", "loan_id", "asset_id", "organization_id", "kind", "from_status", "to_status", "actor", "created_at")
+    list_filter = ("kind",)
+    search_fields = ("=loan__id",)
+    list_select_related = ("actor",)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+# ---------- คลังรายการยืม (อ่านอย่างเดียว) ----------
+@admin.register(ArchivedLoan)
+class ArchivedLoanAdmin(LargeTableAdmin):
+    list_display = ("id", "asset_id", "borrower_id", "organization_id", "status", "borrow_date", "return_date", "archived_at")
+    list_filter = ("status",)
+    search_fields = ("=id",)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(WaitlistEntry)
+class WaitlistEntryAdmin(LargeTableAdmin):
+    list_display = ("id", "item", "user", "start_date", "due_date", "priority", "status", "created_at", "loan")
+    list_filter = ("status",)
+    list_editable = ("priority",)
+    list_select_related = ("item__organization", "user", "loan")
+    search_fields = ("item__name", "user__username")
+    autocomplete_fields = ("item", "user", "loan")
+    readonly_fields = ("promoted_at",)
+
+
+@admin.register(RecurringReservation)
+class RecurringReservationAdmin(LargeTableAdmin):
+    list_display = ("id", "asset", "borrower", "freq", "interval", "byweekday", "dtstart", "until", "status", "created_at")
+    list_filter = ("status", "freq")
+    list_select_related = ("asset__item", "borrower")
+    search_fields = ("asset__item__name", "asset__serial_number", "borrower__username")
+    autocomplete_fields = ("asset", "borrower")
+    readonly_fields = ("approved_at",)
+
+
+@admin.register(LoanBundle)
+class LoanBundleAdmin(LargeTableAdmin):
+    list_display = ("id", "borrower", "created_at")
+    list_select_related = ("borrower",)
+    search_fields = ("=id", "borrower__username")
+    autocomplete_fields = ("borrower",)
+
+
+@admin.register(AutoApprovalRule)
+class AutoApprovalRuleAdmin(admin.ModelAdmin):
+    list_display = ("name", "organization", "order", "category", "borrower_role",
+                    "max_duration_hours", "max_active_per_user", "is_active")
+    list_filter = ("is_active", "borrower_role", "organization")
+    list_editable = ("order", "is_active")
+    search_fields = ("name", "organization__name")
+
+
+@admin.register(QuotaPolicy)
+class QuotaPolicyAdmin(admin.ModelAdmin):
+    list_display = ("id", "organization", "category", "borrower_role", "max_loans", "is_active")
+    list_filter = ("is_active", "borrower_role", "organization")
+    list_editable = ("max_loans", "is_active")
+
+
+@admin.register(UserLoanCounter)
+class UserLoanCounterAdmin(LargeTableAdmin):
+    # แก้ผ่าน services / reconcile_loan_counters เท่านั้น
+    list_display = ("user", "organization", "category_key", "active")
+    list_select_related = ("user", "organization")
+    search_fields = ("user__username",)
+    readonly_fields = ("user", "organization", "category_key", "active")
+
+
+@admin.register(MaintenanceWindow)
+class MaintenanceWindowAdmin(LargeTableAdmin):
+    # สถานะเปลี่ยนผ่าน services (sweep_maintenance / cancel_maintenance) เท่านั้น
+    list_display = ("id", "asset", "organization", "start_at", "end_at", "status", "created_by")
+    list_filter = ("status",)
+    list_select_related = ("asset__item", "organization", "created_by")
+    search_fields = ("asset__item__name", "asset__serial_number")
+    autocomplete_fields = ("asset", "created_by")
+    readonly_fields = ("status", "created_at")
+
+
+# ---------- Job (คิวงานเบื้องหลัง) ----------
+@admin.register(Job)
+class JobAdmin(LargeTableAdmin):
+    list_display = ("id", "name", "status", "attempts", "max_attempts", "run_at", "finished_at")
+    list_filter = ("status", "name")
+    search_fields = ("name", "idempotency_key")
+    readonly_fields = ("locked_by", "locked_at", "last_error", "created_at", "finished_at")
+    actions = ["retry_jobs"]
+
+    @admin.action(description="ส่งกลับเข้าคิวอีกครั้ง")
+    def retry_jobs(self, request, queryset):
+        from django.utils import timezone
+        updated = queryset.exclude(status='running').update(
+            status='queued', attempts=0, run_at=timezone.now(), last_error=''
+        )
+        self.message_user(request, f"ส่งกลับเข้าคิว {updated} งาน")
@@ -4,3 +4,12 @@ from django.apps import AppConfig
 class BorrowingConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'borrowing'
+
+    def ready(self):
+        # ลงทะเบียนงานเบื้องหลังทั้งหมด (@job) ให้ worker และ enqueue() รู้จัก
+        from . import tasks  # noqa: F401
+
+        # บันทึก query ช้า + แผนการรัน (borrowing/querylog.py) ถ้าตั้ง SLOW_QUERY_MS
+        from django.db.backends.signals import connection_created
+        from .querylog import install
+        connection_created.connect(install, dispatch_uid='borrowing.querylog')
@@ -0,0 +1,89 @@
+# borrowing/archive.py
+"""
+ย้ายรายการยืมที่ปิดแล้วไปตารางเย็น (ArchivedLoan) และ API อ่านประวัติรวม hot + archive
+
+- archive_loans(): ย้ายทีละก้อน (INSERT ลงคลัง + DELETE จาก Loan ใน transaction เดียวต่อก้อน)
+  รันระหว่างระบบเปิดใช้งานได้ (`python manage.py archive_loans`)
+- loan_history(): UNION ALL ของ Loan กับ ArchivedLoan ด้วยคอลัมน์ชุดเดียวกัน กรองก่อน union ทั้งสองฝั่ง
+- hydrate(): แปลงแถวเป็น instance (Loan/ArchivedLoan) พร้อม asset/borrower ให้ template เดิมใช้ได้
+"""
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q, Value, BooleanField
+from django.utils import timezone
+
+from .models import Asset, Loan, ArchivedLoan
+
+CLOSED_STATUSES = ('returned', 'rejected')
+HISTORY_FIELDS = (
+    'id', 'asset_id', 'borrower_id', 'organization_id', 'borrow_date', 'start_date', 'due_date',
+    'start_at', 'end_at',
+    'approved_at', 'pickup_date', 'return_date', 'status', 'reason',
+    'reminder_stage', 'recurrence_id', 'bundle_id',
+)
+
+
+def archive_after_days():
+    return getattr(settings, 'LOAN_ARCHIVE_AFTER_DAYS', 180)
+
+
+def archive_loans(days=None, chunk_size=1000, pause=0.0, dry_run=False):
+    """ย้าย Loan ที่ปิดแล้วเก่ากว่า days วัน คืนจำนวนแถวที่ย้าย (dry_run: นับอย่างเดียว)"""
+    cutoff = timezone.now() - timedelta(days=archive_after_days() if days is None else days)
+    eligible = Loan.objects.filter(status__in=CLOSED_STATUSES, borrow_date__lt=cutoff).filter(
+        Q(return_date__isnull=True) | Q(return_date__lt=cutoff)
+    )
+    if dry_run:
+        return eligible.count()
+
+    total, last_pk = 0, 0
+    while True:
+        rows = list(eligible.filter(pk__gt=last_pk).order_by('pk').values(*HISTORY_FIELDS)[:chunk_size])
+        if not rows:
+            return total
+        with transaction.atomic():
+            # ignore_conflicts: ก้อนที่ค้างจากรอบก่อน (insert แล้วแต่ยังไม่ลบ) รันซ้ำได้
+            ArchivedLoan.objects.bulk_create([ArchivedLoan(**r) for r in rows], ignore_conflicts=True)
+            # ลบเฉพาะที่ยังปิดอยู่ (กันแถวที่ถูกแก้ระหว่างทาง)
+            deleted, _ = Loan.objects.filter(
+                pk__in=[r['id'] for r in rows], status__in=CLOSED_STATUSES
+            ).delete()
+        total += deleted
+        last_pk = rows[-1]['id']
+        if pause:
+            time.sleep(pause)
+
+
+def loan_history(*conditions, **filters):
+    """
+    queryset ของ values (HISTORY_FIELDS + archived) จากทั้ง Loan และ ArchivedLoan
+    เงื่อนไขต้องใช้ฟิลด์ที่มีทั้งสองตาราง; เรียง/slice ต่อได้ เช่น loan_history(organization=org).order_by('-borrow_date')
+    """
+    hot = Loan.objects.filter(*conditions, **filters).order_by().values(*HISTORY_FIELDS).annotate(
+        archived=Value(False, output_field=BooleanField())
+    )
+    cold = ArchivedLoan.objects.filter(*conditions, **filters).order_by().values(*HISTORY_FIELDS).annotate(
+        archived=Value(True, output_field=BooleanField())
+    )
+    return hot.union(cold, all=True)
+
+
+def hydrate(rows):
+    """แปลงแถวจาก loan_history() เป็น instance พร้อม asset(item) และ borrower (2 query รวม)"""
+    from users.models import CustomUser
+
+    rows = list(rows)
+    assets = Asset.objects.select_related('item').in_bulk({r['asset_id'] for r in rows})
+    users = CustomUser.objects.in_bulk({r['borrower_id'] for r in rows})
+    loans = []
+    for r in rows:
+        model = ArchivedLoan if r['archived'] else Loan
+        loan = model(**{f: r[f] for f in HISTORY_FIELDS})
+        # อุปกรณ์/ผู้ใช้ที่ถูกลบไปแล้ว (เฉพาะในคลัง) ปล่อยเป็น None
+        loan._state.fields_cache['asset'] = assets.get(r['asset_id'])
+        loan._state.fields_cache['borrower'] = users.get(r['borrower_id'])
+        loans.append(loan)
+    return loans
@@ -0,0 +1,166 @@
+# borrowing/autoapprove.py
+"""
+อนุมัติอัตโนมัติตามกฎขององค์กร (AutoApprovalRule)
+
+- กฎแต่ละข้อแปลงเป็น Q บน Loan (หมวด, ผู้ยืม, ระยะเวลา) แล้วรวมเป็น CASE WHEN เดียว:
+  query เดียวได้คำขอ pending ที่เข้ากฎพร้อม id ของกฎแรกที่ตรง
+- โควตาต่อคน: นับรายการที่อนุมัติอยู่ของผู้ยืมทั้งชุดด้วย GROUP BY ครั้งเดียว แล้วนับต่อในหน่วยความจำ
+- ทับช่วง: โหลดช่วงที่อนุมัติแล้วของทุกอุปกรณ์ในชุดด้วย query เดียวลง IntervalTree (ตัวเดียวกับจองรายชั่วโมง)
+  คำขอที่อนุมัติในชุดเดียวกันถูกใส่ลงต้นไม้ทันที จึงไม่อนุมัติสองรายการที่ทับกันเอง
+- เขียนทั้งชุดใน transaction เดียว: ขยับ version ของอุปกรณ์เรียงตาม id, UPDATE สถานะครั้งเดียว, LoanEvent เป็นชุด
+คำขอที่ไม่ผ่าน (เกินโควตา/ทับช่วง) ยังรอแอดมินตามปกติ
+"""
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Case, Count, F, IntegerField, Q, Value, When
+from django.utils import timezone
+
+from .jobs import enqueue
+from .models import Asset, AutoApprovalRule, Loan, LoanEvent
+from . import availability, intervals, quotas, services
+
+
+def batch_size():
+    return getattr(settings, 'AUTO_APPROVE_BATCH', 200)
+
+
+def compile_rule(rule: AutoApprovalRule):
+    """เงื่อนไขของกฎเป็น Q บน Loan (โควตาต่อคนตรวจแยกใน run_batch)"""
+    q = Q(organization_id=rule.organization_id)
+    if rule.category_id:
+        q &= Q(asset__item__category_id=rule.category_id)
+    if rule.borrower_role == 'member':
+        q &= Q(borrower__organization_id=F('organization_id'))
+    elif rule.borrower_role == 'admin':
+        q &= Q(borrower__organization_id=F('organization_id'), borrower__is_org_admin=True)
+    elif rule.borrower_role == 'external':
+        q &= Q(borrower__organization__isnull=True) | ~Q(borrower__organization_id=F('organization_id'))
+    if rule.max_duration_hours:
+        q &= Q(end_at__lte=F('start_at') + timedelta(hours=rule.max_duration_hours))
+    return q
+
+
+def _matching_rule(rules):
+    return Case(
+        *[When(compile_rule(rule), then=Value(rule.pk)) for rule in rules],
+        default=None, output_field=IntegerField(),
+    )
+
+
+def _select(candidates, rules_by_id):
+    """เลือกคำขอที่อนุมัติได้ (ตามลำดับที่ส่งเข้ามา) ด้วยโควตาและ interval tree ในหน่วยความจำ"""
+    usage = Counter({
+        (row['borrower_id'], row['organization_id']): row['n']
+        for row in Loan.objects.filter(
+            status__in=services.ACTIVE_STATUSES,
+            borrower_id__in={loan.borrower_id for loan in candidates},
+            organization_id__in={loan.organization_id for loan in candidates},
+        ).values('borrower_id', 'organization_id').annotate(n=Count('id'))
+    })
+
+    trees = defaultdict(intervals.IntervalTree)
+    for pk, asset_id, start_at, end_at in Loan.objects.filter(
+        asset_id__in={loan.asset_id for loan in candidates},
+        status__in=services.ACTIVE_STATUSES,
+        start_at__lt=max(loan.end_at for loan in candidates),
+        end_at__gt=min(loan.start_at for loan in candidates),
+    ).values_list('id', 'asset_id', 'start_at', 'end_at'):
+        trees[asset_id].add(int(start_at.timestamp()), int(end_at.timestamp()), pk)
+    for pk, asset_id, start_at, end_at in services._maintenance_overlapping(
+        {loan.asset_id for loan in candidates},
+        min(loan.start_at for loan in candidates), max(loan.end_at for loan in candidates),
+    ).values_list('id', 'asset_id', 'start_at', 'end_at'):
+        trees[asset_id].add(int(start_at.timestamp()), int(end_at.timestamp()), -pk)   # key ติดลบเหมือน intervals
+
+    chosen = []
+    for loan in candidates:
+        rule = rules_by_id[loan.auto_rule]
+        key = (loan.borrower_id, loan.organization_id)
+        if rule.max_active_per_user is not None and usage[key] >= rule.max_active_per_user:
+            continue
+        start, end = int(loan.start_at.timestamp()), int(loan.end_at.timestamp())
+        tree = trees[loan.asset_id]
+        if not tree.is_free(start, end):
+            continue
+        tree.add(start, end, loan.pk)
+        usage[key] += 1
+        chosen.append(loan)
+    return chosen
+
+
+def run_batch(loan_ids=None, org_ids=None, after_id=0, limit=None):
+    """
+    ประเมินคำขอ pending หนึ่งชุด (id > after_id เรียงตาม id) คืน (รายการที่อนุมัติ, id สุดท้ายที่ตรวจ)
+    loan_ids: ตรวจเฉพาะคำขอเหล่านี้ (เรียกทันทีหลังส่งคำขอ)
+    """
+    rules = AutoApprovalRule.objects.filter(is_active=True)
+    if org_ids is not None:
+        rules = rules.filter(organization_id__in=org_ids)
+    rules = list(rules.order_by('organization_id', 'order', 'id'))
+    if not rules:
+        return [], None
+    rules_by_id = {rule.pk: rule for rule in rules}
+    limit = limit or batch_size()
+
+    def attempt():
+        qs = Loan.objects.filter(
+            status='pending', start_at__isnull=False, end_at__isnull=False, id__gt=after_id,
+            organization_id__in={rule.organization_id for rule in rules},
+        )
+        if loan_ids is not None:
+            qs = qs.filter(pk__in=loan_ids)
+        scanned = list(
+            qs.annotate(auto_rule=_matching_rule(rules))
+            .select_related('asset__item', 'borrower').order_by('id')[:limit]
+        )
+        candidates = [loan for loan in scanned if loan.auto_rule is not None]
+        if candidates:   # เกินโควตาขององค์กร (QuotaPolicy) -> ให้แอดมินตัดสิน
+            over = quotas.violations(
+                {loan.borrower for loan in candidates}, {loan.organization_id for loan in candidates}
+            )
+            candidates = [loan for loan in candidates if loan.borrower_id not in over]
+        last_id = scanned[-1].pk if len(scanned) == limit else None
+        chosen = _select(candidates, rules_by_id) if candidates else []
+        if not chosen:
+            return chosen, last_id
+
+        assets = {loan.asset_id: loan.asset for loan in chosen}
+        for asset_id in sorted(assets):   # ลำดับ id คงที่ เหมือน request_bundle
+            services._cas_update(Asset, asset_id, assets[asset_id].version)
+        now = timezone.now()
+        updated = Loan.objects.filter(pk__in=[loan.pk for loan in chosen], status='pending').update(
+            status='approved', approved_at=now, version=F('version') + 1
+        )
+        if updated != len(chosen):
+            raise services.StaleVersion("Loan (auto-approve batch)")
+        for loan in chosen:
+            loan.status, loan.approved_at = 'approved', now
+            loan.version += 1
+        LoanEvent.objects.bulk_create([
+            LoanEvent(**services._event_fields(loan, 'approved', 'pending', 'approved', None, now))
+            for loan in chosen
+        ])
+        for item_id in {asset.item_id for asset in assets.values()}:
+            availability.bump_item(item_id)
+        enqueue('notifications.send_many', {'pairs': [
+            [loan.borrower_id, f'คำขอยืม "{loan.asset.item.name}" ได้รับอนุมัติอัตโนมัติแล้ว '
+                               f'({rules_by_id[loan.auto_rule].name})']
+            for loan in chosen
+        ]})
+        return chosen, last_id
+
+    result = services._with_retry(attempt)
+    if result[0] is False:   # retry หมดโควตา: รอบถัดไปของงานตามรอบจะตรวจใหม่
+        return [], None
+    return result
+
+
+def run_all(org_ids=None):
+    """ไล่คำขอ pending ทั้งหมดทีละชุด (งานตามรอบ) คืนจำนวนที่อนุมัติ"""
+    approved, after_id = 0, 0
+    while after_id is not None:
+        chosen, after_id = run_batch(org_ids=org_ids, after_id=after_id)
+        approved += len(chosen)
+    return approved
@@ -0,0 +1,196 @@
+# borrowing/availability.py
+"""
+ปฏิทินว่าง/ไม่ว่างรายวันของอุปกรณ์ (day-bucket availability matrix)
+
+- 1 query ต่อ item: ดึงอุปกรณ์ทุกชิ้น + ช่วงจองที่ทับหน้าต่างเวลา (LEFT JOIN แบบ FilteredRelation)
+  และอีก 1 query สำหรับช่วงบำรุงรักษาตามกำหนด (MaintenanceWindow) ที่ทับหน้าต่าง
+- เก็บเป็น bitset (int ของ Python) ต่ออุปกรณ์: bit i = 1 คือวันที่ start+i ถูกจอง/ใช้ไม่ได้
+- ส่งออกเป็น base64 ของ bytes แบบ little-endian (bit i อยู่ที่ byte i//8, bit i%8)
+- แคชด้วยคีย์ที่มี "stamp" ของ item; การเปลี่ยนแปลงการจอง/สถานะอุปกรณ์เรียก bump_item()
+"""
+import base64
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import FilteredRelation, Q
+from django.utils import timezone
+
+from .models import Asset, MaintenanceWindow, day_range
+
+# สถานะคำขอที่กันช่วงวัน (ตรงกับ services.BLOCKING_STATUSES)
+BLOCKING_STATUSES = ('pending', 'approved', 'overdue')
+# สถานะอุปกรณ์ที่ถือว่าไม่ว่างทั้งหน้าต่าง
+UNAVAILABLE_ASSET_STATUSES = ('maintenance', 'retired')
+# ช่วงบำรุงรักษาที่กันวัน (ตรงกับ services.MAINTENANCE_BLOCKING)
+MAINTENANCE_BLOCKING = ('scheduled', 'active')
+
+MAX_DAYS = 366
+
+
+def default_days():
+    return getattr(settings, 'AVAILABILITY_DAYS', 60)
+
+
+def _cache_timeout():
+    return getattr(settings, 'AVAILABILITY_CACHE_SECONDS', 300)
+
+
+# -------------------------------------------------------------------
+# stamp สำหรับล้างแคช (เพิ่มเลขทุกครั้งที่การจองของ item เปลี่ยน)
+# -------------------------------------------------------------------
+def _stamp_key(item_id):
+    return f"availability:stamp:{item_id}"
+
+
+def item_stamp(item_id):
+    stamp = cache.get(_stamp_key(item_id))
+    if stamp is None:
+        stamp = 1
+        cache.add(_stamp_key(item_id), stamp, None)
+    return stamp
+
+
+def item_stamps(item_ids):
+    """stamp ของหลาย item ด้วย get_many ครั้งเดียว (ตัวที่ยังไม่มีเริ่มที่ 1 เหมือน item_stamp)"""
+    keys = {_stamp_key(item_id): item_id for item_id in item_ids}
+    found = cache.get_many(list(keys))
+    stamps = {}
+    for key, item_id in keys.items():
+        if key not in found:
+            cache.add(key, 1, None)
+        stamps[item_id] = found.get(key, 1)
+    return stamps
+
+
+def bump_item(item_id):
+    """ทำให้แคชปฏิทินของ item เก่า (เรียกหลัง commit เพื่อไม่ให้คนอื่นแคชข้อมูลก่อน commit)"""
+    def _bump():
+        try:
+            cache.incr(_stamp_key(item_id))
+        except ValueError:
+            cache.set(_stamp_key(item_id), 2, None)
+    transaction.on_commit(_bump)
+
+
+# -------------------------------------------------------------------
+# bitset
+# -------------------------------------------------------------------
+def range_mask(window_start, days, first, last):
+    """mask ของช่วง [first, last] (DateField รวมปลาย) ตัดให้อยู่ในหน้าต่าง"""
+    a = max((first - window_start).days, 0)
+    b = min((last - window_start).days, days - 1)
+    if b < a:
+        return 0
+    return ((1 << (b - a + 1)) - 1) << a
+
+
+def encode(mask, days):
+    return base64.b64encode(mask.to_bytes((days + 7) // 8, 'little')).decode('ascii')
+
+
+def is_range_free(mask, window_start, days, first, last):
+    """ช่วง [first, last] ว่างทั้งหมดตาม bitset หรือไม่ (นอกหน้าต่างถือว่าไม่รู้ -> คืน None)"""
+    if first < window_start or (last - window_start).days >= days:
+        return None
+    return not (mask & range_mask(window_start, days, first, last))
+
+
+def _local_days(start_at, end_at, tz):
+    """ช่วงเวลาครึ่งเปิด [start_at, end_at) -> (วันแรก, วันสุดท้าย) ตามเวลาท้องถิ่น (end_at 00:00 พอดีไม่นับวันนั้น)"""
+    return timezone.localtime(start_at, tz).date(), (timezone.localtime(end_at, tz) - timedelta(microseconds=1)).date()
+
+
+def _build(item_id, window_start, days):
+    window_end = window_start + timedelta(days=days - 1)
+    full = (1 << days) - 1
+    today = timezone.localdate()
+    tz = timezone.get_current_timezone()
+    window_lo, window_hi = day_range(window_start, window_end)
+
+    # เทียบด้วย start_at/end_at ให้ตรงกับ index (asset, status, start_at, end_at) และการตรวจทับช่วงใน services
+    rows = (
+        Asset.objects.filter(item_id=item_id)
+        .annotate(window=FilteredRelation(
+            'loans',
+            condition=Q(
+                loans__status__in=BLOCKING_STATUSES,
+                loans__start_at__lt=window_hi,
+                loans__end_at__gt=window_lo,
+            ) | Q(
+                # overdue ยังไม่คืน: กันไปจนกว่าจะคืนจริง ไม่ว่ากำหนดคืนเดิมจะผ่านไปแล้วหรือไม่
+                loans__status='overdue',
+                loans__start_at__lt=window_hi,
+            ),
+        ))
+        .values_list('id', 'status', 'window__start_at', 'window__end_at', 'window__status')
+        .order_by('id')
+    )
+
+    # ช่วงบำรุงรักษาตามกำหนด: กันเฉพาะวันของช่วง (อุปกรณ์ที่ sweep เปลี่ยนเป็น maintenance ไม่นับว่าไม่ว่างทั้งหน้าต่าง)
+    maintenance, swept_assets = {}, set()
+    for asset_id, status, start_at, end_at in MaintenanceWindow.objects.filter(
+        asset__item_id=item_id, status__in=MAINTENANCE_BLOCKING, start_at__lt=window_hi, end_at__gt=window_lo,
+    ).values_list('asset_id', 'status', 'start_at', 'end_at'):
+        first, last = _local_days(start_at, end_at, tz)
+        maintenance[asset_id] = maintenance.get(asset_id, 0) | range_mask(window_start, days, first, last)
+        if status == 'active':
+            swept_assets.add(asset_id)
+
+    masks = {}
+    for asset_id, asset_status, start_at, end_at, loan_status in rows:
+        mask = masks.get(asset_id, maintenance.get(asset_id, 0))
+        if asset_status in UNAVAILABLE_ASSET_STATUSES and not (
+            asset_status == 'maintenance' and asset_id in swept_assets
+        ):
+            mask = full
+        elif start_at and end_at:
+            start, due = _local_days(start_at, end_at, tz)
+            if loan_status == 'overdue':
+                due = max(due, today)
+            mask |= range_mask(window_start, days, start, due)
+        masks[asset_id] = mask
+    return masks
+
+
+def item_calendar(item_id, days=None, start=None):
+    """
+    คืน dict: start, days, assets={asset_id: bitset(int)}, item=bitset ของวันที่ "ไม่มีชิ้นไหนว่างเลย"
+    ผลลัพธ์ถูกแคชตาม (item, stamp, start, days)
+    """
+    days = max(1, min(days or default_days(), MAX_DAYS))
+    start = start or timezone.localdate()
+    key = f"availability:item:{item_id}:{item_stamp(item_id)}:{start.isoformat()}:{days}"
+    masks = cache.get(key)
+    if masks is None:
+        masks = _build(item_id, start, days)
+        cache.set(key, masks, _cache_timeout())
+
+    all_booked = (1 << days) - 1 if masks else 0
+    for mask in masks.values():
+        all_booked &= mask
+    return {'start': start, 'days': days, 'assets': masks, 'item': all_booked}
+
+
+def asset_is_free(asset, first, last):
+    """เช็กเร็วจากแคช: True=ว่าง, False=ไม่ว่าง, None=ตอบไม่ได้ (ให้ไปเช็กกับฐานข้อมูล)"""
+    cal = item_calendar(asset.item_id)
+    mask = cal['assets'].get(asset.pk)
+    if mask is None:
+        return None
+    return is_range_free(mask, cal['start'], cal['days'], first, last)
+
+
+def serialize(cal, asset_ids=None):
+    """แปลงเป็น JSON ที่เล็กที่สุด: bitset -> base64"""
+    assets = cal['assets']
+    if asset_ids is not None:
+        assets = {a: m for a, m in assets.items() if a in asset_ids}
+    return {
+        'start': cal['start'].isoformat(),
+        'days': cal['days'],
+        'encoding': 'base64-bitset-le',
+        'item': encode(cal['item'], cal['days']),
+        'assets': {str(a): encode(m, cal['days']) for a, m in assets.items()},
+    }
@@ -0,0 +1,175 @@
+# borrowing/catalog.py
+"""
+แคตตาล็อกรวมทุกองค์กร: ค้นหา/กรองข้ามองค์กรในหน้าเดียว ไม่ต้องสลับ current_org ทีละองค์กร
+
+- shard ต่อองค์กร: item ทั้งองค์กรแบบย่อ (Entry) แคชไว้พร้อม stamp ที่เห็นตอนสร้าง
+  ใช้ได้เมื่อ stamp ขององค์กร (item เพิ่ม/แก้/ลบ) และ stamp ของทุก item ในนั้น
+  (availability.item_stamp: ตัวนับ/สถานะอุปกรณ์เปลี่ยน) ยังเท่าเดิม
+- ตรวจทุก shard ด้วย get_many (stamp องค์กร, shard, stamp item) ไม่แตะฐานข้อมูล
+  shard ที่หาย/เก่าสร้างใหม่พร้อมกันด้วย query เดียว (organization_id IN ...)
+- ค้นหา/กรองในหน่วยความจำ แต่ละ shard เรียงตามคะแนนแล้วรวมแบบ k-way ด้วย heapq.merge
+  (lazy) ตัดเฉพาะหน้าที่ขอ
+- ชื่อหมวด (ItemCategory) ที่เปลี่ยนจะเห็นเมื่อ shard หมดอายุ (CATALOG_CACHE_SECONDS)
+"""
+import heapq
+from collections import defaultdict, namedtuple
+from itertools import islice
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Min, Q
+
+from .models import Item
+from . import availability
+
+Entry = namedtuple('Entry', [
+    'item_id', 'organization_id', 'name', 'description', 'category_id', 'category_name',
+    'image', 'available', 'total', 'asset_id',
+])
+
+
+def _cache_timeout():
+    return getattr(settings, 'CATALOG_CACHE_SECONDS', 600)
+
+
+def page_size():
+    return getattr(settings, 'CATALOG_PAGE_SIZE', 24)
+
+
+# -------------------------------------------------------------------
+# stamp ต่อองค์กร (เพิ่มเลขเมื่อรายการ item ขององค์กรเปลี่ยน)
+# -------------------------------------------------------------------
+def _org_stamp_key(org_id):
+    return f"catalog:stamp:{org_id}"
+
+
+def _shard_key(org_id):
+    return f"catalog:shard:{org_id}"
+
+
+def _org_stamps(org_ids):
+    keys = {_org_stamp_key(org_id): org_id for org_id in org_ids}
+    found = cache.get_many(list(keys))
+    stamps = {}
+    for key, org_id in keys.items():
+        if key not in found:
+            cache.add(key, 1, None)
+        stamps[org_id] = found.get(key, 1)
+    return stamps
+
+
+def bump_org(org_id):
+    """ทำให้ shard ขององค์กรเก่า (เรียกหลัง commit เหมือน availability.bump_item)"""
+    def _bump():
+        try:
+            cache.incr(_org_stamp_key(org_id))
+        except ValueError:
+            cache.set(_org_stamp_key(org_id), 2, None)
+    transaction.on_commit(_bump)
+
+
+# -------------------------------------------------------------------
+# shard
+# -------------------------------------------------------------------
+def _build(org_ids):
+    """item ของหลายองค์กรด้วย query เดียว: {org_id: [Entry]}
+    asset_id = ชิ้นที่ว่างชิ้นแรก (ถ้าไม่มี ชิ้นแรกของ item ให้เข้าคิวรอได้) สำหรับลิงก์ไปหน้ายืม"""
+    rows = (
+        Item.objects.filter(organization_id__in=org_ids)
+        .annotate(
+            first_available=Min('assets__id', filter=Q(assets__status='available')),
+            first_asset=Min('assets__id'),
+        )
+        .values_list(
+            'id', 'organization_id', 'name', 'description', 'category_id', 'category__name',
+            'image', 'available_quantity', 'total_quantity', 'first_available', 'first_asset',
+        )
+    )
+    shards = {org_id: [] for org_id in org_ids}
+    for *fields, first_available, first_asset in rows:
+        shards[fields[1]].append(Entry(*fields, first_available or first_asset))
+    return shards
+
+
+def shards(org_ids):
+    """{org_id: [Entry]} จากแคช สร้างใหม่เฉพาะองค์กรที่ shard หาย/เก่า"""
+    org_stamps = _org_stamps(org_ids)
+    cached = cache.get_many([_shard_key(org_id) for org_id in org_ids])
+    item_stamps = availability.item_stamps([
+        entry.item_id for shard in cached.values() for entry in shard[2]
+    ])
+
+    result, stale = {}, []
+    for org_id in org_ids:
+        shard = cached.get(_shard_key(org_id))
+        if shard and shard[0] == org_stamps[org_id] and all(
+            item_stamps.get(item_id) == stamp for item_id, stamp in shard[1].items()
+        ):
+            result[org_id] = shard[2]
+        else:
+            stale.append(org_id)
+
+    if stale:
+        # อ่าน stamp ของ item ก่อนโหลด: การเปลี่ยนแปลงที่ commit ระหว่างนี้ทำให้ stamp ไม่ตรง แล้วสร้างใหม่รอบหน้า
+        stamps = availability.item_stamps(
+            Item.objects.filter(organization_id__in=stale).values_list('id', flat=True)
+        )
+        built = _build(stale)
+        cache.set_many({
+            _shard_key(org_id): (
+                org_stamps[org_id], {entry.item_id: stamps.get(entry.item_id) for entry in built[org_id]}, built[org_id],
+            )
+            for org_id in stale
+        }, _cache_timeout())
+        result.update(built)
+    return result
+
+
+# -------------------------------------------------------------------
+# ค้นหา + รวมผลแบบ k-way
+# -------------------------------------------------------------------
+def _rank(entry, needle):
+    """คะแนนเรียง (น้อย = ดี) หรือ None ถ้าไม่ตรงคำค้น: ชื่อตรง > ขึ้นต้น > มีในชื่อ > หมวด > รายละเอียด"""
+    name = entry.name.lower()
+    if not needle:
+        tier = 0
+    elif name == needle:
+        tier = 0
+    elif name.startswith(needle):
+        tier = 1
+    elif needle in name:
+        tier = 2
+    elif needle in (entry.category_name or '').lower():
+        tier = 3
+    elif needle in (entry.description or '').lower():
+        tier = 4
+    else:
+        return None
+    # ในระดับเดียวกัน: มีของว่างก่อน แล้วตามชื่อ (id ท้ายสุดให้ลำดับคงที่ข้ามองค์กร)
+    return (tier, 0 if entry.available else 1, name, entry.item_id)
+
+
+def search(org_ids, query='', category_id=None, available_only=False, offset=0, limit=None):
+    """
+    ค้นหาข้ามองค์กร คืน (list ของ Entry ในหน้านั้น, มีหน้าถัดไปหรือไม่)
+    แต่ละ shard ถูกกรอง/เรียงแยกกัน แล้ว heapq.merge อ่านเท่าที่ต้องใช้ (offset + limit + 1)
+    """
+    limit = limit or page_size()
+    needle = query.strip().lower()
+    ranked = defaultdict(list)
+    for org_id, entries in shards(org_ids).items():
+        for entry in entries:
+            if category_id and entry.category_id != category_id:
+                continue
+            if available_only and not entry.available:
+                continue
+            key = _rank(entry, needle)
+            if key is not None:
+                ranked[org_id].append((key, entry))
+    for rows in ranked.values():
+        rows.sort(key=lambda row: row[0])
+
+    merged = heapq.merge(*ranked.values(), key=lambda row: row[0])
+    page = [entry for _, entry in islice(merged, offset, offset + limit + 1)]
+    return page[:limit], len(page) > limit
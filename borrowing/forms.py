@@ -1,9 +1,18 @@
 # borrowing/forms.py
+import re
+from datetime import datetime
+
 from django import forms
+from django.conf import settings
+from django.db.models import Q
 from django.utils import timezone
 from django.forms import BaseInlineFormSet, inlineformset_factory
 
-from .models import Item, Asset, Loan, ItemCategory
+from .models import (
+    Item, Asset, Loan, ItemCategory, RecurringReservation, AutoApprovalRule, QuotaPolicy,
+    MaintenanceWindow,
+)
+from . import intervals
 
 
 # ───────────────────────── Item / Category ─────────────────────────
@@ -113,8 +122,8 @@ class AssetCreateForm(forms.ModelForm):
         user = kwargs.pop('user', None)
         super().__init__(*args, **kwargs)
         if user and getattr(user, 'organization_id', None):
-            self.fields['item'].queryset = Item.objects.filter(
-                organization=user.organization
+            self.fields['item'].queryset = Item.objects.for_org(
+                user.organization
             ).order_by('name')
         else:
             self.fields['item'].queryset = Item.objects.none()
@@ -200,6 +209,137 @@ AssetFormSet = inlineformset_factory(
 )
 
 
+
+# ───────────── ตารางอุปกรณ์ทีละหน้า (หน้าแก้ไข item ที่มีอุปกรณ์จำนวนมาก) ─────────────
+
+class AssetGridRowForm(forms.Form):
+    """หนึ่งแถวในตาราง (ไม่ใช่ ModelForm: ไม่ตรวจ unique/constraint ทีละแถว ตรวจทั้งชุดใน AssetGrid)"""
+    serial_number = forms.CharField(max_length=255, required=False, label="หมายเลขซีเรียล (SN)")
+    device_id = forms.CharField(max_length=255, required=False, label="ID อุปกรณ์/ครุภัณฑ์")
+    location = forms.CharField(max_length=255, required=False, label="ตำแหน่งปัจจุบัน")
+    status = forms.ChoiceField(choices=Asset.STATUS_CHOICES, label="สถานะ")
+    version = forms.IntegerField(required=False, widget=forms.HiddenInput)
+    DELETE = forms.BooleanField(required=False, label="ลบ")
+
+    def clean(self):
+        cleaned = super().clean()
+        if cleaned.get('DELETE'):
+            return cleaned
+        for field in ('serial_number', 'device_id', 'location'):
+            cleaned[field] = (cleaned.get(field) or '').strip() or None
+        if not cleaned['serial_number'] and not cleaned['device_id']:
+            raise forms.ValidationError("ต้องระบุอย่างน้อย 1 ช่อง ระหว่าง Serial Number หรือ Device ID")
+        return cleaned
+
+
+class AssetGrid:
+    """
+    ตารางแก้อุปกรณ์ของ item ทีละหน้า รับเฉพาะแถวที่ส่งมา (ช่อง asset-<id>-<field>, แถวใหม่ new-<n>-<field>)
+    - แถวที่ค่าไม่เปลี่ยน (has_changed) ไม่ถูกบันทึก แม้เบราว์เซอร์ส่งมาทั้งหน้า
+    - SN/Device ID ซ้ำ: ตรวจกันเองในชุดในหน่วยความจำ และกับฐานข้อมูลด้วย query เดียว
+    - บันทึกจริงใน services.save_asset_grid (bulk_update + นับตัวนับ item ครั้งเดียว)
+    """
+    ROW_KEY = re.compile(r'^(asset|new)-(\d+)-')
+    FIELDS = ('serial_number', 'device_id', 'location', 'status')
+
+    def __init__(self, item, assets, data=None):
+        self.item = item
+        self.data = data
+        submitted, new_keys = set(), set()
+        for key in (data or {}):
+            match = self.ROW_KEY.match(key)
+            if match:
+                (submitted if match.group(1) == 'asset' else new_keys).add(int(match.group(2)))
+
+        assets = list(assets)
+        shown = {asset.pk for asset in assets}
+        if submitted - shown:   # แถวที่แก้ค้างไว้แต่ไม่อยู่ในหน้านี้แล้ว (ตัวกรองเปลี่ยน) ยังต้องบันทึก/แสดง error
+            assets += list(Asset.objects.filter(item=item, pk__in=submitted - shown).order_by('id'))
+        self.rows = [(asset, self._row_form(asset, asset.pk in submitted)) for asset in assets]
+        self.new_rows = [
+            AssetGridRowForm(data, prefix=f'new-{n}', initial={'status': 'available'}) for n in sorted(new_keys)
+        ]
+        self.next_new = max(new_keys, default=-1) + 1   # ลำดับแถวใหม่ถัดไปที่ JS ใช้
+
+    @property
+    def empty_form(self):
+        return AssetGridRowForm(prefix='new-__prefix__', initial={'status': 'available'})
+
+    def _row_form(self, asset, bound):
+        initial = {field: getattr(asset, field) for field in self.FIELDS}
+        initial['version'] = asset.version
+        return AssetGridRowForm(self.data if bound else None, prefix=f'asset-{asset.pk}', initial=initial)
+
+    def _changed_fields(self, form):
+        return [field for field in form.changed_data if field != 'version']
+
+    @property
+    def updated(self):
+        """[(asset, cleaned_data)] ของแถวเดิมที่แก้ค่า (ไม่รวมที่ติ๊กลบ)"""
+        return [
+            (asset, form.cleaned_data) for asset, form in self.rows
+            if form.is_bound and not form.cleaned_data.get('DELETE') and self._changed_fields(form)
+        ]
+
+    @property
+    def deleted(self):
+        return [(asset, form.cleaned_data) for asset, form in self.rows if form.is_bound and form.cleaned_data.get('DELETE')]
+
+    @property
+    def created(self):
+        """cleaned_data ของแถวใหม่ที่กรอกจริง (แถวว่างข้าม)"""
+        return [form.cleaned_data for form in self.new_rows if form.has_changed() and not form.cleaned_data.get('DELETE')]
+
+    def has_changes(self):
+        return bool(self.updated or self.deleted or self.created)
+
+    def is_valid(self):
+        checked_forms = [form for _, form in self.rows if form.is_bound]
+        checked_forms += [form for form in self.new_rows if form.has_changed()]
+        if not all([form.is_valid() for form in checked_forms]):
+            return False
+        for asset, form in self.rows:
+            if not form.is_bound or form.cleaned_data.get('DELETE'):
+                continue
+            if 'status' in form.changed_data and 'on_loan' in (asset.status, form.cleaned_data['status']):
+                form.add_error('status', "สถานะ \"กำลังถูกยืม\" เปลี่ยนผ่านการรับ/คืนอุปกรณ์เท่านั้น")
+        self._check_unique()
+        return all(not form.errors for form in checked_forms)
+
+    def _check_unique(self):
+        rows = [(asset, form) for asset, form in self.rows if form.is_bound and not form.cleaned_data.get('DELETE')]
+        rows += [(None, form) for form in self.new_rows if form.has_changed() and not form.cleaned_data.get('DELETE')]
+        # ค่าที่ส่งมาแต่ไม่เปลี่ยนเป็นของแถวนั้นเองอยู่แล้ว: ตรวจกับฐานข้อมูลเฉพาะค่าที่เปลี่ยน
+        wanted = {field: {} for field in ('serial_number', 'device_id')}
+        for asset, form in rows:
+            for field in wanted:
+                value = form.cleaned_data.get(field)
+                if not value:
+                    continue
+                if value in wanted[field]:
+                    form.add_error(field, "ค่านี้ซ้ำกับรายการอื่นในชุดนี้")
+                else:
+                    wanted[field][value] = form
+        checked = {
+            field: {value for value, form in values.items() if field in form.changed_data}
+            for field, values in wanted.items()
+        }
+        if not (checked['serial_number'] or checked['device_id']):
+            return
+        # แถวที่ถูกแก้/ลบในชุดนี้ปล่อยค่าเดิมของตัวเอง จึงไม่นับว่าชน
+        released = [asset.pk for asset, form in self.rows if form.is_bound]
+        taken = (
+            Asset.objects.filter(
+                Q(serial_number__in=checked['serial_number']) | Q(device_id__in=checked['device_id'])
+            ).exclude(pk__in=released).values_list('serial_number', 'device_id')
+        )
+        for serial_number, device_id in taken:
+            if serial_number in checked['serial_number']:
+                wanted['serial_number'][serial_number].add_error('serial_number', "หมายเลขซีเรียลนี้มีอยู่แล้วในระบบ")
+            if device_id in checked['device_id']:
+                wanted['device_id'][device_id].add_error('device_id', "Device ID นี้มีอยู่แล้วในระบบ")
+
+
 # ───────────────────────── Loan ─────────────────────────
 
 class LoanRequestForm(forms.ModelForm):
@@ -213,6 +353,15 @@ class LoanRequestForm(forms.ModelForm):
         widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control'}),
         help_text="วันที่ครบกำหนดคืน (ไม่เกิน 30 วันนับจากวันเริ่มยืม)"
     )
+    # จองรายชั่วโมง (เช่น โปรเจกเตอร์สำหรับคาบเรียน): กรอกทั้งสองช่อง; เว้นว่าง = จองทั้งวัน
+    start_time = forms.TimeField(
+        label="เวลาเริ่ม (ถ้าจองรายชั่วโมง)", required=False,
+        widget=forms.TimeInput(attrs={'type': 'time', 'class': 'form-control'}),
+    )
+    end_time = forms.TimeField(
+        label="เวลาสิ้นสุด (ถ้าจองรายชั่วโมง)", required=False,
+        widget=forms.TimeInput(attrs={'type': 'time', 'class': 'form-control'}),
+    )
 
     class Meta:
         model = Loan
@@ -242,8 +391,12 @@ class LoanRequestForm(forms.ModelForm):
         if start_date < today:
             self.add_error('start_date', "วันเริ่มยืมต้องเป็นวันนี้หรืออนาคต")
 
-        # กำหนดคืนต้อง > เริ่มยืม อย่างน้อย 1 วัน
-        if due_date <= start_date:
+        start_time, end_time = cleaned.get('start_time'), cleaned.get('end_time')
+        cleaned['start_at'] = cleaned['end_at'] = None
+        if start_time or end_time:
+            self._clean_hourly(cleaned, start_date, due_date, start_time, end_time)
+        # กำหนดคืนต้อง > เริ่มยืม อย่างน้อย 1 วัน (ยกเว้นจองรายชั่วโมง)
+        elif due_date <= start_date:
             self.add_error('due_date', "วันครบกำหนดต้องหลังวันเริ่มยืมอย่างน้อย 1 วัน")
 
         # จำกัดสูงสุด 30 วัน
@@ -251,3 +404,116 @@ class LoanRequestForm(forms.ModelForm):
             self.add_error('due_date', "ระยะเวลายืมต้องไม่เกิน 30 วัน")
 
         return cleaned
+
+    def _clean_hourly(self, cleaned, start_date, due_date, start_time, end_time):
+        if not (start_time and end_time):
+            self.add_error('end_time' if start_time else 'start_time', "จองรายชั่วโมงต้องระบุทั้งเวลาเริ่มและเวลาสิ้นสุด")
+            return
+        tz = timezone.get_current_timezone()
+        start_at = timezone.make_aware(datetime.combine(start_date, start_time), tz)
+        end_at = timezone.make_aware(datetime.combine(due_date, end_time), tz)
+        minutes = intervals.slot_minutes()
+        if end_at <= start_at:
+            self.add_error('end_time', "เวลาสิ้นสุดต้องหลังเวลาเริ่ม")
+        elif not (intervals.aligned(start_at) and intervals.aligned(end_at)):
+            self.add_error('start_time', f"เวลาต้องตรงช่วงละ {minutes} นาที (เช่น 09:00, 10:00)")
+        elif start_at < timezone.now():
+            self.add_error('start_time', "เวลาเริ่มต้องเป็นเวลาในอนาคต")
+        else:
+            cleaned['start_at'], cleaned['end_at'] = start_at, end_at
+
+
+WEEKDAY_CHOICES = [
+    ('0', 'จันทร์'), ('1', 'อังคาร'), ('2', 'พุธ'), ('3', 'พฤหัสบดี'),
+    ('4', 'ศุกร์'), ('5', 'เสาร์'), ('6', 'อาทิตย์'),
+]
+
+
+class RecurringReservationForm(forms.ModelForm):
+    weekdays = forms.MultipleChoiceField(
+        label="วันในสัปดาห์", choices=WEEKDAY_CHOICES, required=False,
+        widget=forms.CheckboxSelectMultiple,
+        help_text="ใช้กับการจองทุกสัปดาห์ (ไม่เลือก = วันเดียวกับวันเริ่ม)"
+    )
+    skip_conflicts = forms.BooleanField(
+        label="ข้ามวันที่ถูกจองแล้ว", required=False,
+        help_text="ถ้าบางครั้งชนกับการจองเดิม ให้ข้ามวันนั้นแทนการส่งไม่ได้ทั้งชุด"
+    )
+
+    class Meta:
+        model = RecurringReservation
+        fields = ['dtstart', 'until', 'freq', 'interval', 'start_time', 'end_time', 'reason']
+        widgets = {
+            'dtstart': forms.DateInput(attrs={'type': 'date', 'class': 'form-control'}),
+            'until': forms.DateInput(attrs={'type': 'date', 'class': 'form-control'}),
+            'start_time': forms.TimeInput(attrs={'type': 'time', 'class': 'form-control'}),
+            'end_time': forms.TimeInput(attrs={'type': 'time', 'class': 'form-control'}),
+            'reason': forms.Textarea(attrs={'rows': 3}),
+        }
+
+    def clean(self):
+        cleaned = super().clean()
+        dtstart, until = cleaned.get('dtstart'), cleaned.get('until')
+        if not dtstart or not until:
+            return cleaned
+
+        if dtstart < timezone.now().date():
+            self.add_error('dtstart', "วันเริ่มต้องเป็นวันนี้หรืออนาคต")
+        if until < dtstart:
+            self.add_error('until', "วันสิ้นสุดต้องไม่ก่อนวันเริ่ม")
+        elif (until - dtstart).days > getattr(settings, 'RECURRING_MAX_DAYS', 200):
+            self.add_error('until', "ช่วงการจองซ้ำยาวเกินกำหนด")
+
+        start_time, end_time = cleaned.get('start_time'), cleaned.get('end_time')
+        if bool(start_time) != bool(end_time):
+            self.add_error('end_time', "จองรายชั่วโมงต้องระบุทั้งเวลาเริ่มและเวลาสิ้นสุด")
+        elif start_time and end_time:
+            if end_time <= start_time:
+                self.add_error('end_time', "เวลาสิ้นสุดต้องหลังเวลาเริ่ม")
+            elif not (intervals.aligned(start_time) and intervals.aligned(end_time)):
+                self.add_error('start_time', f"เวลาต้องตรงช่วงละ {intervals.slot_minutes()} นาที")
+
+        self.instance.byweekday = ','.join(cleaned.get('weekdays') or [])
+        return cleaned
+
+
+class AutoApprovalRuleForm(forms.ModelForm):
+    class Meta:
+        model = AutoApprovalRule
+        fields = ['name', 'order', 'category', 'borrower_role', 'max_duration_hours', 'max_active_per_user', 'is_active']
+        help_texts = {
+            'category': "เว้นว่าง = ทุกหมวด",
+            'max_duration_hours': "เว้นว่าง = ไม่จำกัด (ยืมทั้งวัน 1 วัน = 24 ชั่วโมง)",
+            'max_active_per_user': "นับรายการที่อนุมัติแล้วและยังไม่คืนของผู้ยืมในองค์กรนี้ เว้นว่าง = ไม่จำกัด",
+            'order': "กฎที่ลำดับน้อยกว่าถูกตรวจก่อน",
+        }
+
+
+class QuotaPolicyForm(forms.ModelForm):
+    class Meta:
+        model = QuotaPolicy
+        fields = ['category', 'borrower_role', 'max_loans', 'is_active']
+        help_texts = {
+            'category': "เว้นว่าง = นับรวมทุกหมวด",
+            'max_loans': "นับรายการที่รอดำเนินการ อนุมัติแล้ว และเกินกำหนดของผู้ยืมในองค์กรนี้",
+        }
+
+
+class MaintenanceWindowForm(forms.ModelForm):
+    class Meta:
+        model = MaintenanceWindow
+        fields = ['start_at', 'end_at', 'reason']
+        widgets = {
+            'start_at': forms.DateTimeInput(attrs={'type': 'datetime-local'}, format='%Y-%m-%dT%H:%M'),
+            'end_at': forms.DateTimeInput(attrs={'type': 'datetime-local'}, format='%Y-%m-%dT%H:%M'),
+        }
+
+    def clean(self):
+        cleaned = super().clean()
+        start_at, end_at = cleaned.get('start_at'), cleaned.get('end_at')
+        if start_at and end_at:
+            if end_at <= start_at:
+                self.add_error('end_at', "เวลาสิ้นสุดต้องหลังเวลาเริ่ม")
+            elif end_at <= timezone.now():
+                self.add_error('end_at', "ช่วงบำรุงรักษาต้องยังไม่สิ้นสุด")
+        return cleaned
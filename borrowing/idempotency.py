@@ -0,0 +1,126 @@
+# borrowing/idempotency.py
+"""
+กันการส่งคำขอซ้ำ (ดับเบิลคลิก / เบราว์เซอร์ส่ง POST ซ้ำ) ด้วย idempotency key บนแคช
+
+- คีย์มาจาก header Idempotency-Key, ช่อง idempotency_key ในฟอร์ม หรือ query string
+  ถ้าไม่มี ใช้ลายนิ้วมือของ (method, path, body) แทน
+- ครั้งแรก: cache.add() เป็นล็อก แล้วรัน view; ถ้า view ตอบเป็น redirect ที่ทำเครื่องหมายด้วย succeeded()
+  (รูปแบบ PRG ของหน้าเหล่านี้) เก็บ Location ไว้ IDEMPOTENCY_TTL วินาที
+- ครั้งถัดไป: ตอบ redirect เดิมจากแคชทันที ไม่เปิด transaction / ไม่ query ตรวจชน
+- ผลอื่นไม่เก็บ ส่งใหม่ได้ตามปกติ: ฟอร์มมี error, 4xx/5xx, exception และ redirect หลัง messages.error
+  (ลิงก์ GET ของแอดมินไม่มีคีย์จาก client ถ้าเก็บ redirect ที่ล้มเหลวไว้ กดใหม่หลังแก้สาเหตุจะได้แค่ "ดำเนินการไปแล้ว")
+"""
+import hashlib
+import time
+import uuid
+from functools import wraps
+
+from django.conf import settings
+from django.contrib import messages
+from django.core.cache import cache
+from django.http import HttpResponse, HttpResponseRedirect
+
+FIELD_NAME = 'idempotency_key'
+HEADER = 'HTTP_IDEMPOTENCY_KEY'
+IN_PROGRESS = '__in_progress__'
+POLL_INTERVAL = 0.1
+# ล็อกระหว่างทำงานหมดอายุเร็ว: โปรเซสตายกลางคันก็ไม่ค้างคีย์ไว้ทั้ง TTL
+LOCK_SECONDS = 30
+IGNORED_FIELDS = ('csrfmiddlewaretoken', FIELD_NAME)
+SUCCESS_ATTR = 'idempotent_success'
+
+
+def new_key():
+    """คีย์ใหม่สำหรับฝังในฟอร์ม (หนึ่งคีย์ต่อการแสดงฟอร์มหนึ่งครั้ง)"""
+    return uuid.uuid4().hex
+
+
+def succeeded(response):
+    """ทำเครื่องหมายว่า redirect นี้คือผลสำเร็จ ให้ @idempotent เก็บไว้ตอบคำขอซ้ำ"""
+    setattr(response, SUCCESS_ATTR, True)
+    return response
+
+
+def _ttl():
+    return getattr(settings, 'IDEMPOTENCY_TTL', 600)
+
+
+def _wait_seconds():
+    return getattr(settings, 'IDEMPOTENCY_WAIT_SECONDS', 5)
+
+
+def _client_key(request):
+    return (
+        request.META.get(HEADER)
+        or request.POST.get(FIELD_NAME)
+        or request.GET.get(FIELD_NAME)
+    )
+
+
+def _fingerprint(request):
+    """ไม่มีคีย์จาก client: ใช้ method + path + ค่าในฟอร์ม (ไม่รวม csrf token)"""
+    body = sorted(
+        (k, v) for k in request.POST if k not in IGNORED_FIELDS for v in request.POST.getlist(k)
+    )
+    return f"{request.method}:{request.get_full_path()}:{body!r}"
+
+
+def cache_key(request):
+    raw = _client_key(request) or _fingerprint(request)
+    digest = hashlib.sha1(f"{request.path}:{raw}".encode('utf-8')).hexdigest()
+    return f"idem:{request.user.pk}:{digest}"
+
+
+def _replay(request, stored):
+    messages.info(request, 'คำขอนี้ถูกดำเนินการไปแล้ว')
+    response = HttpResponseRedirect(stored['location'])
+    response['Idempotent-Replay'] = 'true'
+    return response
+
+
+def _wait_for(key):
+    """คำขอแรกยังทำงานอยู่: รอผลจากแคชสั้น ๆ (ไม่แตะฐานข้อมูล)"""
+    deadline = time.monotonic() + _wait_seconds()
+    while time.monotonic() < deadline:
+        time.sleep(POLL_INTERVAL)
+        stored = cache.get(key)
+        if stored != IN_PROGRESS:
+            return stored
+    return IN_PROGRESS
+
+
+def idempotent(methods=('POST',)):
+    """
+    ใช้ต่อจาก @login_required กับ view ที่เปลี่ยนสถานะแล้ว redirect
+    methods: method ที่ถือเป็นการสั่งงาน (ปุ่มอนุมัติ/ปฏิเสธเป็นลิงก์ GET จึงต้องระบุ GET ด้วย)
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def _wrapped(request, *args, **kwargs):
+            if request.method not in methods:
+                return view_func(request, *args, **kwargs)
+
+            key = cache_key(request)
+            if not cache.add(key, IN_PROGRESS, LOCK_SECONDS):
+                stored = cache.get(key)
+                if stored == IN_PROGRESS:
+                    stored = _wait_for(key)
+                if isinstance(stored, dict):
+                    return _replay(request, stored)
+                if stored == IN_PROGRESS:
+                    return HttpResponse('คำขอเดียวกันกำลังดำเนินการอยู่', status=409)
+                cache.add(key, IN_PROGRESS, LOCK_SECONDS)   # คีย์หมดอายุ/ถูกปล่อยระหว่างรอ: ทำใหม่
+
+            try:
+                response = view_func(request, *args, **kwargs)
+            except Exception:
+                cache.delete(key)
+                raise
+            if getattr(response, SUCCESS_ATTR, False) and response.status_code in (301, 302, 303, 307, 308):
+                cache.set(key, {'location': response['Location']}, _ttl())
+            else:
+                cache.delete(key)
+            return response
+
+        return _wrapped
+    return decorator
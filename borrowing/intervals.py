@@ -0,0 +1,249 @@
+# borrowing/intervals.py
+"""
+ดัชนีช่วงเวลาที่ถูกจองต่ออุปกรณ์ (interval tree ในหน่วยความจำ) สำหรับจองรายชั่วโมง
+
+- IntervalTree: treap ที่เรียงตามเวลาเริ่ม และเก็บ max(end) ของ subtree
+  ถามว่าทับช่วงไหม/ช่วงไหนทับ ได้ O(log n + k) เพิ่ม/ลบทีละช่วงได้ O(log n)
+- asset_tree(): โหลดจากแคช แล้วตามเหตุการณ์ใหม่ใน LoanEvent (asset, id > ล่าสุด) มาอัปเดตทีละช่วง
+  ไม่ต้องสร้างใหม่ทั้งต้นทุกครั้งที่มีการจอง; สร้างใหม่จาก Loan เมื่อไม่มีในแคช/หมดอายุ
+- ใช้เป็นการตรวจล่วงหน้าและหาช่องว่าง (free_slots) เท่านั้น การตรวจจริงตอนสร้างคำขออยู่ใน services
+- เวลาในต้นไม้เป็นวินาที epoch (int) ช่วงแบบครึ่งเปิด [start, end)
+- ช่วงบำรุงรักษา (MaintenanceWindow) อยู่ในต้นไม้ด้วย key ติดลบ (-id) ไม่มี LoanEvent จึงล้างแคชด้วย invalidate()
+  เช่นเดียวกับ Loan ที่ถูกแก้ช่วง/สถานะผ่าน Loan.save() (หน้าแอดมิน ฯลฯ)
+"""
+import random
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Loan, LoanEvent, MaintenanceWindow, day_range
+
+BLOCKING_STATUSES = ('pending', 'approved', 'overdue')
+MAINTENANCE_BLOCKING = ('scheduled', 'active')
+INSERT_KINDS = ('requested',)
+REMOVE_KINDS = ('rejected', 'returned')
+# ไม่โหลดช่วงที่จบไปนานแล้ว (ไม่มีทางทับกับคำถามเรื่องอนาคต)
+HISTORY_MARGIN = timedelta(days=1)
+
+
+def slot_minutes():
+    return getattr(settings, 'RESERVATION_SLOT_MINUTES', 60)
+
+
+def _cache_timeout():
+    return getattr(settings, 'SLOT_TREE_CACHE_SECONDS', 3600)
+
+
+def _ts(value):
+    return int(value.timestamp())
+
+
+def _dt(ts):
+    return timezone.localtime(datetime.fromtimestamp(ts, tz=dt_timezone.utc))
+
+
+# -------------------------------------------------------------------
+# Treap-based interval tree
+# -------------------------------------------------------------------
+class _Node:
+    __slots__ = ('start', 'end', 'key', 'prio', 'max_end', 'left', 'right')
+
+    def __init__(self, start, end, key):
+        self.start, self.end, self.key = start, end, key
+        self.prio = random.random()
+        self.max_end = end
+        self.left = self.right = None
+
+
+def _fix(node):
+    node.max_end = max(
+        node.end,
+        node.left.max_end if node.left else node.end,
+        node.right.max_end if node.right else node.end,
+    )
+    return node
+
+
+def _split(node, order):
+    """แยกเป็น (< order, >= order) โดย order = (start, key)"""
+    if node is None:
+        return None, None
+    if (node.start, node.key) < order:
+        left, right = _split(node.right, order)
+        node.right = left
+        return _fix(node), right
+    left, right = _split(node.left, order)
+    node.left = right
+    return left, _fix(node)
+
+
+def _merge(left, right):
+    if left is None or right is None:
+        return left or right
+    if left.prio > right.prio:
+        left.right = _merge(left.right, right)
+        return _fix(left)
+    right.left = _merge(left, right.left)
+    return _fix(right)
+
+
+class IntervalTree:
+    """ช่วง [start, end) พร้อม key (loan id) ไม่ซ้ำ"""
+
+    def __init__(self):
+        self.root = None
+        self.starts = {}   # key -> start (ใช้หาโหนดตอนลบ)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __contains__(self, key):
+        return key in self.starts
+
+    def add(self, start, end, key):
+        if key in self.starts:
+            self.discard(key)
+        left, right = _split(self.root, (start, key))
+        self.root = _merge(_merge(left, _Node(start, end, key)), right)
+        self.starts[key] = start
+
+    def discard(self, key):
+        start = self.starts.pop(key, None)
+        if start is None:
+            return
+        left, rest = _split(self.root, (start, key))
+        _, right = _split(rest, (start, key + 1))   # ตัดโหนดเดียวที่ (start, key) ออก
+        self.root = _merge(left, right)
+
+    def overlapping(self, start, end):
+        """ช่วงที่ทับ [start, end) เรียงตามเวลาเริ่ม: list ของ (start, end, key)"""
+        found, stack = [], []
+        node = self.root
+        # in-order แบบวนซ้ำ ตัด subtree ที่ max_end <= start และฝั่งขวาเมื่อ node.start >= end
+        while stack or node:
+            while node and node.max_end > start:
+                stack.append(node)
+                node = node.left
+            if not stack:
+                break
+            node = stack.pop()
+            if node.start >= end:
+                break
+            if node.end > start:
+                found.append((node.start, node.end, node.key))
+            node = node.right
+        return found
+
+    def is_free(self, start, end):
+        return not self.overlapping(start, end)
+
+
+# -------------------------------------------------------------------
+# แคชต่ออุปกรณ์ + อัปเดตจาก LoanEvent
+# -------------------------------------------------------------------
+def _cache_key(asset_id):
+    return f"intervals:asset:{asset_id}"
+
+
+def _event_range(payload):
+    if payload.get('start_at') and payload.get('end_at'):
+        return (_ts(datetime.fromisoformat(payload['start_at'])),
+                _ts(datetime.fromisoformat(payload['end_at'])))
+    if payload.get('start_date') and payload.get('due_date'):   # เหตุการณ์ก่อนมีคอลัมน์เวลา
+        start_at, end_at = day_range(
+            datetime.fromisoformat(payload['start_date']).date(),
+            datetime.fromisoformat(payload['due_date']).date(),
+        )
+        return _ts(start_at), _ts(end_at)
+    return None
+
+
+def _build(asset_id):
+    # อ่าน id เหตุการณ์ล่าสุดก่อนโหลด Loan: เหตุการณ์ที่เกิดระหว่างนี้จะถูกตามซ้ำ (add/discard ซ้ำได้ผลเดิม)
+    last_event = LoanEvent.objects.filter(asset_id=asset_id).order_by('-id').values_list('id', flat=True).first() or 0
+    tree = IntervalTree()
+    # รายการที่ยังไม่คืน (overdue / รับของไปแล้ว) อยู่ในต้นไม้จนกว่าจะมีเหตุการณ์ returned เหมือนตอนตามเหตุการณ์
+    # จึงโหลดมาด้วยไม่ว่า end_at จะผ่านไปนานแค่ไหน ต้นไม้ที่สร้างใหม่กับที่ตามเหตุการณ์มาจะได้ตรงกัน
+    rows = Loan.objects.filter(
+        Q(end_at__gt=timezone.now() - HISTORY_MARGIN) | Q(status='overdue') | Q(status='approved', pickup_date__isnull=False),
+        asset_id=asset_id, status__in=BLOCKING_STATUSES, start_at__isnull=False,
+    ).values_list('id', 'start_at', 'end_at')
+    for pk, start_at, end_at in rows:
+        tree.add(_ts(start_at), _ts(end_at), pk)
+    for pk, start_at, end_at in MaintenanceWindow.objects.filter(
+        asset_id=asset_id, status__in=MAINTENANCE_BLOCKING, end_at__gt=timezone.now() - HISTORY_MARGIN,
+    ).values_list('id', 'start_at', 'end_at'):
+        tree.add(_ts(start_at), _ts(end_at), -pk)
+    return tree, last_event
+
+
+def invalidate(asset_id):
+    """ทิ้งต้นไม้ที่แคชไว้หลัง commit (ช่วงบำรุงรักษาเปลี่ยน / Loan ถูกแก้นอก services) ครั้งถัดไปสร้างใหม่จากฐานข้อมูล"""
+    transaction.on_commit(lambda: cache.delete(_cache_key(asset_id)))
+
+
+def asset_tree(asset_id):
+    """IntervalTree ของการจองที่ยังกันช่วงอยู่ของอุปกรณ์ (แคช + ตามเหตุการณ์ใหม่)"""
+    cached = cache.get(_cache_key(asset_id))
+    if cached is None:
+        tree, last_event = _build(asset_id)
+        changed = True
+    else:
+        tree, last_event = cached
+        changed = False
+
+    for event_id, loan_id, kind, payload in (
+        LoanEvent.objects.filter(asset_id=asset_id, id__gt=last_event)
+        .order_by('id').values_list('id', 'loan_id', 'kind', 'payload')
+    ):
+        if kind in INSERT_KINDS:
+            rng = _event_range(payload or {})
+            if rng:
+                tree.add(rng[0], rng[1], loan_id)
+        elif kind in REMOVE_KINDS:
+            tree.discard(loan_id)
+        last_event, changed = event_id, True
+
+    if changed:
+        cache.set(_cache_key(asset_id), (tree, last_event), _cache_timeout())
+    return tree
+
+
+def is_free(asset_id, start_at, end_at):
+    return asset_tree(asset_id).is_free(_ts(start_at), _ts(end_at))
+
+
+def busy(asset_id, start_at, end_at):
+    """ช่วงที่ถูกจองในหน้าต่างเวลา: list ของ (start_at, end_at, loan_id) เป็น datetime"""
+    return [(_dt(s), _dt(e), key) for s, e, key in asset_tree(asset_id).overlapping(_ts(start_at), _ts(end_at))]
+
+
+def aligned(value, minutes=None):
+    """เวลาตรงขอบช่อง (นับจากเที่ยงคืนตามเวลาท้องถิ่น) หรือไม่"""
+    minutes = minutes or slot_minutes()
+    local = timezone.localtime(value) if timezone.is_aware(value) else value
+    return local.second == 0 and local.microsecond == 0 and (local.hour * 60 + local.minute) % minutes == 0
+
+
+def free_slots(asset_id, start_at, end_at, minutes=None):
+    """
+    ช่วงว่างในหน้าต่าง [start_at, end_at) ปัดเข้าขอบช่อง (RESERVATION_SLOT_MINUTES)
+    ช่องที่ติดกันรวมเป็นช่วงเดียว: list ของ (start, end) เป็น datetime
+    """
+    step = (minutes or slot_minutes()) * 60
+    window_start, window_end = _ts(start_at), _ts(end_at)
+    free, cursor = [], window_start
+    for s, e, _ in asset_tree(asset_id).overlapping(window_start, window_end) + [(window_end, window_end, None)]:
+        gap_start = cursor
+        gap_end = min(s, window_end)
+        # ปัดขึ้น/ลงให้ตรงขอบช่อง (วัดจากต้นหน้าต่างซึ่งควรอยู่ที่ขอบช่องอยู่แล้ว)
+        gap_start = window_start + -(-(gap_start - window_start) // step) * step
+        gap_end = window_start + ((gap_end - window_start) // step) * step
+        if gap_end > gap_start:
+            free.append((_dt(gap_start), _dt(gap_end)))
+        cursor = max(cursor, e)
+    return free
@@ -0,0 +1,218 @@
+# borrowing/jobs.py
+"""
+คิวงานเบื้องหลังแบบเก็บในฐานข้อมูล (ไม่ต้องมี broker ภายนอก)
+
+- view เรียก enqueue() แล้วตอบกลับทันที งานจริงไปทำใน worker (`manage.py run_jobs`)
+- งานลงทะเบียนด้วย @job('ชื่องาน') ดูตัวอย่างใน borrowing/tasks.py
+- ลองใหม่อัตโนมัติแบบ exponential backoff จนครบ max_attempts
+- งานตามรอบ (periodic) ใช้ @job(..., every=timedelta(...)) worker จะตั้งคิวให้เองรอบละครั้ง
+- idempotency_key กันงานซ้ำ (เช่น กดซ้ำ หรือหลาย worker ตั้งคิวรอบเดียวกัน)
+- งานรันใน transaction เดียวโดยปริยาย; งานที่ทำ I/O นาน (ส่งอีเมล) ใช้ @job(..., atomic=False)
+  แล้วจัดการ transaction สั้น ๆ เอง ไม่ให้ถือ write lock ค้างและไม่ย้อนสิ่งที่ทำไปแล้วตอน error
+"""
+import logging
+import random
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+_registry = {}   # name -> JobSpec
+
+
+class JobSpec:
+    def __init__(self, name, func, max_attempts=5, every=None, atomic=True):
+        self.name = name
+        self.func = func
+        self.max_attempts = max_attempts
+        self.every = every
+        self.atomic = atomic
+
+    def interval(self):
+        # ปรับรอบได้จาก settings.JOB_SCHEDULE = {'ชื่องาน': วินาที}
+        override = getattr(settings, 'JOB_SCHEDULE', {}).get(self.name)
+        if override:
+            return timedelta(seconds=override)
+        return self.every
+
+
+def job(name, *, max_attempts=5, every=None, atomic=True):
+    """ลงทะเบียนฟังก์ชันเป็นงานเบื้องหลัง (payload ส่งเข้าเป็น keyword arguments)"""
+    def decorator(func):
+        _registry[name] = JobSpec(name, func, max_attempts=max_attempts, every=every, atomic=atomic)
+        return func
+    return decorator
+
+
+def enqueue(name, payload=None, *, run_at=None, idempotency_key=None, max_attempts=None):
+    """
+    ตั้งคิวงาน คืนค่า Job
+    - ถ้าอยู่ใน transaction งานจะถูก commit พร้อมข้อมูลหลัก (worker มองไม่เห็นจนกว่าจะ commit)
+    - ถ้ามี idempotency_key เดิมอยู่แล้ว จะคืนงานเดิมโดยไม่สร้างใหม่
+    """
+    spec = _registry.get(name)
+    if spec is None:
+        raise KeyError(f"ไม่รู้จักงาน '{name}'")
+
+    fields = dict(
+        name=name,
+        payload=payload or {},
+        run_at=run_at or timezone.now(),
+        max_attempts=max_attempts or spec.max_attempts,
+        idempotency_key=idempotency_key,
+    )
+    if idempotency_key:
+        existing = Job.objects.filter(idempotency_key=idempotency_key).first()
+        if existing:
+            return existing
+        try:
+            with transaction.atomic():
+                new_job = Job.objects.create(**fields)
+        except IntegrityError:
+            # worker/คำขออื่นตั้งคิวด้วยคีย์เดียวกันไปก่อนหน้าเสี้ยววินาที
+            return Job.objects.get(idempotency_key=idempotency_key)
+    else:
+        new_job = Job.objects.create(**fields)
+
+    # โหมดพัฒนา/ทดสอบ: ทำงานทันทีหลัง commit โดยไม่ต้องเปิด worker
+    if getattr(settings, 'JOBS_EAGER', False):
+        transaction.on_commit(lambda: run_job_by_id(new_job.pk, worker_id='eager'))
+    return new_job
+
+
+# -------------------------------------------------------------------
+# ฝั่ง worker
+# -------------------------------------------------------------------
+def backoff_delay(attempts):
+    """หน่วงก่อนลองใหม่: base * 2^(n-1) (มีเพดาน) + jitter เล็กน้อยกันชนพร้อมกัน"""
+    base = getattr(settings, 'JOB_RETRY_BASE_SECONDS', 10)
+    cap = getattr(settings, 'JOB_RETRY_MAX_SECONDS', 3600)
+    delay = min(cap, base * (2 ** max(attempts - 1, 0)))
+    return timedelta(seconds=delay + random.uniform(0, base))
+
+
+def claim_next(worker_id, batch=10):
+    """
+    หยิบงานที่ถึงเวลา 1 งาน ด้วย conditional UPDATE (ใช้ได้กับ SQLite ที่ไม่มี SKIP LOCKED)
+    ถ้า worker อื่นแย่งไปก่อน UPDATE จะได้ 0 แถว แล้วลองตัวถัดไป
+    """
+    now = timezone.now()
+    candidate_ids = list(
+        Job.objects.filter(status='queued', run_at__lte=now)
+        .order_by('run_at', 'id')
+        .values_list('id', flat=True)[:batch]
+    )
+    for job_id in candidate_ids:
+        claimed = Job.objects.filter(pk=job_id, status='queued').update(
+            status='running',
+            locked_by=worker_id,
+            locked_at=now,
+            attempts=F('attempts') + 1,
+        )
+        if claimed:
+            return Job.objects.get(pk=job_id)
+    return None
+
+
+def run_job(job_obj):
+    """รันงานที่หยิบมาแล้ว คืน True ถ้าสำเร็จ"""
+    spec = _registry.get(job_obj.name)
+    now = timezone.now()
+    if spec is None:
+        Job.objects.filter(pk=job_obj.pk).update(
+            status='failed', finished_at=now, last_error=f"ไม่รู้จักงาน '{job_obj.name}'"
+        )
+        return False
+
+    try:
+        if spec.atomic:
+            with transaction.atomic():
+                spec.func(**(job_obj.payload or {}))
+        else:
+            spec.func(**(job_obj.payload or {}))
+    except Exception:
+        error = traceback.format_exc()
+        logger.warning("Job #%s %s failed (attempt %s/%s)",
+                       job_obj.pk, job_obj.name, job_obj.attempts, job_obj.max_attempts)
+        if job_obj.attempts >= job_obj.max_attempts:
+            Job.objects.filter(pk=job_obj.pk).update(
+                status='failed', finished_at=timezone.now(), last_error=error, locked_by=''
+            )
+        else:
+            Job.objects.filter(pk=job_obj.pk).update(
+                status='queued',
+                run_at=timezone.now() + backoff_delay(job_obj.attempts),
+                last_error=error,
+                locked_by='',
+                locked_at=None,
+            )
+        return False
+
+    Job.objects.filter(pk=job_obj.pk).update(
+        status='done', finished_at=timezone.now(), last_error='', locked_by=''
+    )
+    return True
+
+
+def run_job_by_id(job_id, worker_id='inline'):
+    """รันงานตาม id ทันที (ใช้ในโหมด JOBS_EAGER)"""
+    claimed = Job.objects.filter(pk=job_id, status='queued').update(
+        status='running', locked_by=worker_id, locked_at=timezone.now(), attempts=F('attempts') + 1,
+    )
+    if claimed:
+        run_job(Job.objects.get(pk=job_id))
+
+
+def schedule_periodic(now=None):
+    """
+    ตั้งคิวงานตามรอบ: 1 งานต่อ 1 ช่วงเวลา (slot) ใช้ idempotency_key กันหลาย worker ตั้งซ้ำ
+    คืนจำนวนงานที่ตรวจ
+    """
+    now = now or timezone.now()
+    count = 0
+    for spec in _registry.values():
+        interval = spec.interval()
+        if not interval:
+            continue
+        seconds = int(interval.total_seconds())
+        slot = int(now.timestamp()) // seconds
+        enqueue(spec.name, idempotency_key=f"periodic:{spec.name}:{slot}")
+        count += 1
+    return count
+
+
+def requeue_stale(now=None):
+    """คืนงานที่ค้าง running นานเกินไป (worker ตาย) กลับเข้าคิว"""
+    now = now or timezone.now()
+    timeout = getattr(settings, 'JOB_LOCK_TIMEOUT_SECONDS', 600)
+    return Job.objects.filter(
+        status='running', locked_at__lt=now - timedelta(seconds=timeout)
+    ).update(status='queued', locked_by='', locked_at=None, run_at=now)
+
+
+def queue_lag(now=None):
+    """
+    งานที่ถึงเวลาแล้วแต่ยังไม่ถูกหยิบค้างมานานแค่ไหน (timedelta ของงานเก่าสุด, None ถ้าไม่มี)
+    ค่าโตเรื่อย ๆ แปลว่าไม่มี worker `run_jobs` ทำงานอยู่ (ใช้ index status, run_at)
+    """
+    now = now or timezone.now()
+    oldest = (
+        Job.objects.filter(status='queued', run_at__lte=now)
+        .order_by('run_at').values_list('run_at', flat=True).first()
+    )
+    return now - oldest if oldest else None
+
+
+def stalled_minutes():
+    """จำนวนนาทีที่คิวค้าง เมื่อเกิน JOBS_STALL_WARNING_SECONDS (ให้แดชบอร์ดแสดงคำเตือน) ไม่เกินคืน None"""
+    lag = queue_lag()
+    if lag is None or lag.total_seconds() < getattr(settings, 'JOBS_STALL_WARNING_SECONDS', 300):
+        return None
+    return int(lag.total_seconds() // 60)
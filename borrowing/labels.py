@@ -0,0 +1,308 @@
+# borrowing/labels.py
+"""
+สร้างป้าย QR/บาร์โค้ด (Code128) ของอุปกรณ์เป็นแผ่นพิมพ์ PDF หรือ SVG
+
+- สตรีมทีละหน้า: ดึงอุปกรณ์ด้วย iterator() แล้ว yield bytes ของแต่ละหน้า ไม่ถือทั้งชุดไว้ในหน่วยความจำ
+- "glyph" (รูปบาร์โค้ด/QR เป็นชุดสี่เหลี่ยม) แคชด้วย hash ของเนื้อหา: ป้ายที่รหัสเดิมไม่ต้องวาดใหม่
+- Code128 เขียนเอง (ไม่พึ่งไลบรารี); QR ใช้แพ็กเกจ `qrcode` ถ้าติดตั้งไว้ (pip install qrcode)
+"""
+import hashlib
+from itertools import islice
+
+from django.core.cache import cache
+
+try:
+    import qrcode
+except ImportError:   # ไม่บังคับติดตั้ง: ถ้าไม่มี ใช้ได้เฉพาะ Code128
+    qrcode = None
+
+SYMBOLOGIES = ('code128', 'qr') if qrcode else ('code128',)
+FORMATS = ('pdf', 'svg')
+
+# เปลี่ยนเมื่อวิธีวาด glyph เปลี่ยน เพื่อไม่ให้ใช้แคชรูปแบบเก่า
+GLYPH_VERSION = 1
+GLYPH_CACHE_SECONDS = 60 * 60 * 24 * 30
+
+# A4 หน่วย point (1/72 นิ้ว)
+PAGE_WIDTH, PAGE_HEIGHT = 595, 842
+MM = 72 / 25.4
+
+
+class LabelError(ValueError):
+    """รหัสที่เข้ารหัสเป็นป้ายไม่ได้ (เช่น อักขระนอก ASCII ใน Code128)"""
+
+
+# -------------------------------------------------------------------
+# Code128 (ชุด B สำหรับข้อความทั่วไป, ชุด C สำหรับตัวเลขล้วนความยาวคู่)
+# -------------------------------------------------------------------
+# ความกว้าง bar/space ของแต่ละค่า 0..105 (แต่ละค่า = 11 module), 106 = stop (13 module)
+_CODE128 = (
+    '212222 222122 222221 121223 121322 131222 122213 122312 132212 221213 '
+    '221312 231212 112232 122132 122231 113222 123122 123221 223211 221132 '
+    '221231 213212 223112 312131 311222 321122 321221 312212 322112 322211 '
+    '212123 212321 232121 111323 131123 131321 112313 132113 132311 211313 '
+    '231113 231311 112133 112331 132131 113123 113321 133121 313121 211331 '
+    '231131 213113 213311 213131 311123 311321 331121 312113 312311 332111 '
+    '314111 221411 431111 111224 111422 121124 121421 141122 141221 112214 '
+    '112412 122114 122411 142112 142211 241211 221114 413111 241112 134111 '
+    '111242 121142 121241 114212 124112 124211 411212 421112 421211 212141 '
+    '214121 412121 111143 111341 131141 114113 114311 411113 411311 113141 '
+    '114131 311141 411131 211412 211214 211232 2331112'
+).split()
+_START_B, _START_C, _STOP = 104, 105, 106
+QUIET_MODULES = 10
+
+
+def code128_values(text):
+    """แปลงข้อความเป็นลำดับค่า Code128 (รวม start, checksum, stop)"""
+    if not text:
+        raise LabelError("รหัสว่าง")
+    if text.isdigit() and len(text) % 2 == 0 and len(text) >= 4:
+        values = [_START_C] + [int(text[i:i + 2]) for i in range(0, len(text), 2)]
+    else:
+        if any(not 32 <= ord(ch) <= 126 for ch in text):
+            raise LabelError(f"Code128 รองรับเฉพาะอักขระ ASCII: {text!r}")
+        values = [_START_B] + [ord(ch) - 32 for ch in text]
+    checksum = (values[0] + sum(i * v for i, v in enumerate(values[1:], 1))) % 103
+    return values + [checksum, _STOP]
+
+
+def _code128_glyph(text):
+    """สี่เหลี่ยมของแท่งบาร์ (หน่วย module, สูง 1 หน่วย) และความกว้างรวม"""
+    rects, x = [], QUIET_MODULES
+    for value in code128_values(text):
+        for i, width in enumerate(_CODE128[value]):
+            width = int(width)
+            if i % 2 == 0:   # ตำแหน่งคู่เป็นแท่งดำ
+                rects.append((x, 0, width, 1))
+            x += width
+    return {'w': x + QUIET_MODULES, 'h': 1, 'rects': rects}
+
+
+def _qr_glyph(text):
+    """สี่เหลี่ยมของ QR (รวม module ดำที่ติดกันในแถวเดียวเป็นสี่เหลี่ยมเดียว)"""
+    if qrcode is None:
+        raise LabelError("ยังไม่ได้ติดตั้งแพ็กเกจ qrcode")
+    qr = qrcode.QRCode(border=2, error_correction=qrcode.constants.ERROR_CORRECT_M)
+    qr.add_data(text)
+    qr.make(fit=True)
+    matrix = qr.get_matrix()
+    rects = []
+    for y, row in enumerate(matrix):
+        x = 0
+        while x < len(row):
+            if row[x]:
+                start = x
+                while x < len(row) and row[x]:
+                    x += 1
+                rects.append((start, y, x - start, 1))
+            else:
+                x += 1
+    size = len(matrix)
+    return {'w': size, 'h': size, 'rects': rects}
+
+
+_BUILDERS = {'code128': _code128_glyph, 'qr': _qr_glyph}
+
+
+def _render(glyph):
+    """แปลง glyph เป็นคำสั่งวาด PDF และ path ของ SVG (หน่วย module) เก็บไว้ในแคชพร้อมกัน"""
+    pdf = ''.join(f'{x} {y} {w} {h} re\n' for x, y, w, h in glyph['rects']) + 'f\n'
+    svg = ''.join(f'M{x} {y}h{w}v{h}h-{w}z' for x, y, w, h in glyph['rects'])
+    return {'w': glyph['w'], 'h': glyph['h'], 'pdf': pdf, 'svg': svg}
+
+
+def glyph_key(symbology, code):
+    digest = hashlib.sha1(f"{GLYPH_VERSION}:{symbology}:{code}".encode('utf-8')).hexdigest()
+    return f"labels:glyph:{digest}"
+
+
+def get_glyphs(symbology, codes):
+    """คืน {code: glyph} อ่านแคชทีละหน้าด้วย get_many แล้ววาดเฉพาะที่ขาด (รหัสที่ผิดรูปคืนค่า None)"""
+    if symbology not in _BUILDERS:
+        raise LabelError(f"ไม่รู้จักชนิดป้าย '{symbology}'")
+    keys = {glyph_key(symbology, c): c for c in set(codes)}
+    cached = cache.get_many(keys)
+    glyphs = {keys[k]: g for k, g in cached.items()}
+    fresh = {}
+    for key, code in keys.items():
+        if code in glyphs:
+            continue
+        try:
+            glyphs[code] = fresh[key] = _render(_BUILDERS[symbology](code))
+        except LabelError:
+            glyphs[code] = None
+    if fresh:
+        cache.set_many(fresh, GLYPH_CACHE_SECONDS)
+    return glyphs
+
+
+# -------------------------------------------------------------------
+# เลย์เอาต์แผ่นป้าย
+# -------------------------------------------------------------------
+class Sheet:
+    """ตารางป้ายบนหน้า A4 (หน่วย point)"""
+
+    def __init__(self, columns=3, rows=8, margin_mm=10, gap_mm=3):
+        self.columns, self.rows = columns, rows
+        self.margin, self.gap = margin_mm * MM, gap_mm * MM
+        self.label_w = (PAGE_WIDTH - 2 * self.margin - (columns - 1) * self.gap) / columns
+        self.label_h = (PAGE_HEIGHT - 2 * self.margin - (rows - 1) * self.gap) / rows
+
+    @property
+    def per_page(self):
+        return self.columns * self.rows
+
+    def cell(self, index):
+        """มุมซ้ายบนของช่องที่ index (นับจากซ้ายบน ตามแนวแถว)"""
+        row, col = divmod(index, self.columns)
+        return (self.margin + col * (self.label_w + self.gap),
+                self.margin + row * (self.label_h + self.gap))
+
+    def fit(self, glyph, symbology):
+        """ขนาดรูปในช่อง (เว้นที่ด้านล่างไว้พิมพ์ข้อความ)"""
+        box_w, box_h = self.label_w - 6, self.label_h - 18
+        if symbology == 'qr':
+            side = min(box_w, box_h)
+            return side / glyph['w'], side / glyph['h'], side, side
+        return box_w / glyph['w'], box_h, box_w, box_h
+
+
+def label_rows(assets, chunk_size=2000):
+    """(code, ป้ายข้อความ) ของอุปกรณ์แต่ละชิ้น อ่านเป็นก้อนด้วย iterator()"""
+    rows = (
+        assets.order_by('item__name', 'id')
+        .values_list('serial_number', 'device_id', 'item__name')
+        .iterator(chunk_size=chunk_size)
+    )
+    for serial_number, device_id, item_name in rows:
+        code = serial_number or device_id
+        if code:
+            yield code, item_name
+
+
+def _pages(rows, per_page):
+    rows = iter(rows)
+    while True:
+        page = list(islice(rows, per_page))
+        if not page:
+            return
+        yield page
+
+
+# -------------------------------------------------------------------
+# PDF (เขียนโครงสร้างไฟล์เอง: object ต่อหน้า + xref ตอนท้าย)
+# -------------------------------------------------------------------
+def _pdf_text(value):
+    # ฟอนต์มาตรฐาน Helvetica ไม่มีอักษรไทย: ใน PDF จึงพิมพ์เฉพาะรหัส (ASCII)
+    value = value.encode('latin-1', 'replace').decode('latin-1')
+    return value.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+
+def _pdf_page_stream(page, glyphs, sheet, symbology):
+    out = []
+    for index, (code, _name) in enumerate(page):
+        x, top = sheet.cell(index)
+        glyph = glyphs.get(code)
+        if glyph:
+            sx, sy, w, h = sheet.fit(glyph, symbology)
+            gx = x + (sheet.label_w - w) / 2
+            gy = PAGE_HEIGHT - top - 3   # แกน y ของ PDF ชี้ขึ้น: พลิกด้วย scale ติดลบ
+            out.append(f'q {sx:.4f} 0 0 {-sy:.4f} {gx:.2f} {gy:.2f} cm\n{glyph["pdf"]}Q\n')
+        text_y = PAGE_HEIGHT - top - sheet.label_h + 4
+        out.append(f'BT /F1 8 Tf {x + 3:.2f} {text_y:.2f} Td ({_pdf_text(code)}) Tj ET\n')
+    return ''.join(out).encode('latin-1')
+
+
+def stream_pdf(rows, symbology='code128', sheet=None):
+    """yield bytes ของไฟล์ PDF ทีละหน้า"""
+    sheet = sheet or Sheet()
+    offsets = {}
+    position = 0
+
+    def emit(chunk):
+        nonlocal position
+        position += len(chunk)
+        return chunk
+
+    def obj(num, body):
+        offsets[num] = position
+        return emit(f'{num} 0 obj\n'.encode() + body + b'\nendobj\n')
+
+    # 1 = catalog, 2 = pages (เขียนตอนท้ายเมื่อรู้จำนวนหน้า), 3 = font, หน้าเริ่มที่ 4
+    yield emit(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+    yield obj(1, b'<< /Type /Catalog /Pages 2 0 R >>')
+    yield obj(3, b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>')
+
+    kids, next_num = [], 4
+    for page in _pages(rows, sheet.per_page):
+        glyphs = get_glyphs(symbology, [code for code, _ in page])
+        content = _pdf_page_stream(page, glyphs, sheet, symbology)
+        page_num, content_num = next_num, next_num + 1
+        next_num += 2
+        kids.append(page_num)
+        yield obj(page_num, (
+            f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {PAGE_WIDTH} {PAGE_HEIGHT}] '
+            f'/Resources << /Font << /F1 3 0 R >> >> /Contents {content_num} 0 R >>'
+        ).encode())
+        yield obj(content_num, f'<< /Length {len(content)} >>\nstream\n'.encode() + content + b'\nendstream')
+
+    kid_refs = ' '.join(f'{k} 0 R' for k in kids)
+    yield obj(2, f'<< /Type /Pages /Kids [{kid_refs}] /Count {len(kids)} >>'.encode())
+
+    xref_at = position
+    lines = [f'xref\n0 {next_num}\n', '0000000000 65535 f \n']
+    for num in range(1, next_num):
+        lines.append(f'{offsets[num]:010d} 00000 n \n')
+    lines.append(f'trailer\n<< /Size {next_num} /Root 1 0 R >>\nstartxref\n{xref_at}\n%%EOF\n')
+    yield emit(''.join(lines).encode())
+
+
+# -------------------------------------------------------------------
+# SVG (หน้า HTML ที่มี <svg> ต่อหน้า พิมพ์จากเบราว์เซอร์ได้ และแสดงชื่อภาษาไทยได้)
+# -------------------------------------------------------------------
+def _xml(value):
+    return (value.replace('&', '&amp;').replace('<', '&lt;')
+            .replace('>', '&gt;').replace('"', '&quot;'))
+
+
+def stream_svg(rows, symbology='code128', sheet=None):
+    """yield HTML ทีละหน้า (แต่ละหน้าเป็น <svg> ขนาด A4 ตัดหน้าด้วย CSS)"""
+    sheet = sheet or Sheet()
+    yield (
+        '<!DOCTYPE html>\n<html><head><meta charset="utf-8"><title>Asset labels</title>'
+        '<style>@page{size:A4;margin:0}body{margin:0}'
+        'svg{display:block;width:210mm;height:297mm;page-break-after:always}</style>'
+        '</head><body>\n'
+    ).encode()
+    for page in _pages(rows, sheet.per_page):
+        glyphs = get_glyphs(symbology, [code for code, _ in page])
+        out = [f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {PAGE_WIDTH} {PAGE_HEIGHT}">']
+        for index, (code, name) in enumerate(page):
+            x, top = sheet.cell(index)
+            glyph = glyphs.get(code)
+            if glyph:
+                sx, sy, w, h = sheet.fit(glyph, symbology)
+                gx = x + (sheet.label_w - w) / 2
+                out.append(
+                    f'<path transform="translate({gx:.2f} {top + 3:.2f}) scale({sx:.4f} {sy:.4f})" '
+                    f'd="{glyph["svg"]}"/>'
+                )
+            else:
+                out.append(f'<text x="{x + 3:.2f}" y="{top + 12:.2f}" font-size="7" fill="red">'
+                           f'รหัสนี้พิมพ์เป็นป้ายไม่ได้</text>')
+            label = _xml(code if not name else f'{code} · {name}')
+            out.append(f'<text x="{x + 3:.2f}" y="{top + sheet.label_h - 4:.2f}" '
+                       f'font-family="sans-serif" font-size="8">{label}</text>')
+        out.append('</svg>\n')
+        yield ''.join(out).encode('utf-8')
+    yield b'</body></html>\n'
+
+
+def stream_labels(assets, fmt='pdf', symbology='code128', sheet=None):
+    if fmt not in FORMATS:
+        raise LabelError(f"ไม่รู้จักรูปแบบไฟล์ '{fmt}'")
+    if symbology not in SYMBOLOGIES:
+        raise LabelError(f"ไม่รองรับชนิดป้าย '{symbology}'")
+    writer = stream_pdf if fmt == 'pdf' else stream_svg
+    return writer(label_rows(assets), symbology=symbology, sheet=sheet)
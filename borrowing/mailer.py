@@ -0,0 +1,134 @@
+# borrowing/mailer.py
+"""
+ช่องทางอีเมลของ Notification (ส่งจาก worker เท่านั้น ไม่ส่งใน request)
+
+- หยิบ Notification ที่ยังไม่ได้ส่งเป็นชุด: claim ด้วย UPDATE แบบมีเงื่อนไข กัน worker สองตัวส่งซ้ำ
+- เปิด SMTP connection เดียวต่อชุด, โหลด template ครั้งเดียวต่อชุด แล้ว render ต่อผู้รับ
+- จำกัดอัตราส่ง (EMAIL_RATE_PER_SECOND); ถ้า SMTP ล่ม คืน claim ที่ยังไม่ส่งแล้วโยน error ให้คิวงาน retry
+- เรียกนอก transaction (งาน notifications.email เป็น atomic=False): claim และ emailed_at ของแต่ละฉบับ
+  commit ทันทีหลังส่ง ฉบับที่ส่งแล้วจึงไม่ถูกย้อนกลับ/ส่งซ้ำเมื่อ SMTP ล่มกลางชุด
+
+- แจ้งเตือนที่ถูกรวมซ้ำ (users/notifications.create_notifications) ล้าง emailed_at ด้วย จึงส่งอีเมลรอบใหม่
+
+ทดสอบกับ SMTP จำลองในเครื่อง:
+    python -m aiosmtpd -n -l localhost:1025
+แล้วตั้ง NOTIFICATION_EMAIL_ENABLED = True และรันด้วย env EMAIL_HOST=localhost EMAIL_PORT=1025
+(borrowing/tests.py มีทั้งแบบ locmem และแบบ aiosmtpd ที่ข้ามเมื่อไม่ได้ติดตั้ง)
+"""
+import logging
+import smtplib
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db.models import Q
+from django.template.loader import get_template
+from django.utils import timezone
+
+from users.models import Notification
+
+logger = logging.getLogger(__name__)
+
+SUBJECT_TEMPLATE = 'borrowing/email/notification_subject.txt'
+BODY_TEMPLATE = 'borrowing/email/notification_body.txt'
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def enabled():
+    return _setting('NOTIFICATION_EMAIL_ENABLED', False)
+
+
+def _claim(batch_size, now):
+    """จองแถวที่ยังไม่ส่ง (รวมแถวที่ claim ค้างเกิน timeout) คืน list ของ Notification ที่จองได้"""
+    stale = now - timedelta(seconds=_setting('JOB_LOCK_TIMEOUT_SECONDS', 600))
+    cutoff = now - timedelta(hours=_setting('NOTIFICATION_EMAIL_MAX_AGE_HOURS', 24))
+    ids = list(
+        Notification.objects.filter(
+            Q(email_claimed_at__isnull=True) | Q(email_claimed_at__lt=stale),
+            emailed_at__isnull=True,
+            created_at__gte=cutoff,
+            user__email__gt='',
+        )
+        .order_by('created_at')
+        .values_list('id', flat=True)[:batch_size]
+    )
+    if not ids:
+        return []
+    Notification.objects.filter(
+        Q(email_claimed_at__isnull=True) | Q(email_claimed_at__lt=stale),
+        pk__in=ids, emailed_at__isnull=True,
+    ).update(email_claimed_at=now)
+    # แถวที่ worker อื่นแย่งไปก่อนจะมีเวลา claim ไม่ตรงกับของเรา
+    return list(
+        Notification.objects.filter(pk__in=ids, email_claimed_at=now, emailed_at__isnull=True)
+        .select_related('user')
+        .order_by('created_at')
+    )
+
+
+def _render(notifications):
+    """template โหลด/compile ครั้งเดียว แล้ว render ด้วย context ของแต่ละผู้รับ"""
+    subject_tpl = get_template(SUBJECT_TEMPLATE)
+    body_tpl = get_template(BODY_TEMPLATE)
+    from_email = settings.DEFAULT_FROM_EMAIL
+    site_url = _setting('SITE_URL', '')
+    for n in notifications:
+        context = {'user': n.user, 'notification': n, 'site_url': site_url}
+        subject = ' '.join(subject_tpl.render(context).split())   # subject ต้องอยู่บรรทัดเดียว
+        yield n, EmailMessage(subject, body_tpl.render(context), from_email, [n.user.email])
+
+
+def deliver_batch(batch_size=None):
+    """ส่งอีเมล 1 ชุด คืน (จำนวนที่หยิบมา, จำนวนที่ส่งสำเร็จ)"""
+    if not enabled():
+        return 0, 0
+    batch_size = batch_size or _setting('EMAIL_BATCH_SIZE', 100)
+    rate = _setting('EMAIL_RATE_PER_SECOND', 10)
+    now = timezone.now()
+    claimed = _claim(batch_size, now)
+    if not claimed:
+        return 0, 0
+
+    sent_ids, refused_ids = [], []
+    connection = get_connection(fail_silently=False)
+    try:
+        connection.open()
+        for n, message in _render(claimed):
+            started = time.monotonic()
+            try:
+                connection.send_messages([message])
+                sent_ids.append(n.pk)
+            except smtplib.SMTPRecipientsRefused:
+                # ที่อยู่ผู้รับเสีย: ลองใหม่ก็ไม่ผ่าน ปิดรายการนี้ไปเลย
+                logger.warning("Email refused for notification %s (%s)", n.pk, n.user.email)
+                refused_ids.append(n.pk)
+            # บันทึกทีละฉบับ (autocommit) ก่อนส่งฉบับถัดไป
+            Notification.objects.filter(pk=n.pk).update(emailed_at=timezone.now())
+            if rate:
+                time.sleep(max(0.0, 1.0 / rate - (time.monotonic() - started)))
+    except (smtplib.SMTPException, OSError):
+        # SMTP ล่มกลางชุด: ปล่อย claim ของที่ยังไม่ได้ส่งให้รอบถัดไป แล้วให้คิวงาน retry ตาม backoff
+        done = set(sent_ids) | set(refused_ids)
+        Notification.objects.filter(
+            pk__in=[n.pk for n in claimed if n.pk not in done], email_claimed_at=now
+        ).update(email_claimed_at=None)
+        raise
+    finally:
+        connection.close()
+    return len(claimed), len(sent_ids)
+
+
+def deliver_pending(max_batches=None):
+    """ส่งจนคิวหมด (หรือครบ max_batches) คืนจำนวนที่ส่งทั้งหมด"""
+    total, batches = 0, 0
+    while max_batches is None or batches < max_batches:
+        claimed, sent = deliver_batch()
+        batches += 1
+        total += sent
+        if not claimed:
+            break
+    return total
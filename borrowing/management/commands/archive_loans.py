@@ -0,0 +1,21 @@
+# borrowing/management/commands/archive_loans.py
+from django.core.management.base import BaseCommand
+from borrowing.archive import archive_loans, archive_after_days
+
+class Command(BaseCommand):
+    help = "ย้ายรายการยืมที่คืน/ปฏิเสธแล้วและเก่ากว่ากำหนดไปตาราง ArchivedLoan ทีละก้อน (รันขณะระบบเปิดอยู่ได้)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, help="อายุขั้นต่ำ (วัน) ค่าเริ่มต้น LOAN_ARCHIVE_AFTER_DAYS")
+        parser.add_argument('--chunk-size', type=int, default=1000, help="จำนวนแถวต่อ transaction")
+        parser.add_argument('--pause', type=float, default=0.0, help="วินาทีที่พักระหว่างก้อน")
+        parser.add_argument('--dry-run', action='store_true', help="นับจำนวนที่จะย้ายโดยไม่ย้ายจริง")
+
+    def handle(self, *args, **options):
+        days = options['days'] if options['days'] is not None else archive_after_days()
+        moved = archive_loans(
+            days=days, chunk_size=options['chunk_size'],
+            pause=options['pause'], dry_run=options['dry_run'],
+        )
+        label = "Loans to archive" if options['dry_run'] else "Loans archived"
+        self.stdout.write(self.style.SUCCESS(f"{label} (older than {days} days): {moved}"))
@@ -0,0 +1,36 @@
+# borrowing/management/commands/export_labels.py
+from django.core.management.base import BaseCommand, CommandError
+from borrowing import labels
+from borrowing.models import Asset
+
+
+class Command(BaseCommand):
+    help = "ส่งออกป้าย QR/บาร์โค้ดของอุปกรณ์เป็นไฟล์ PDF หรือ SVG (เขียนทีละหน้า ใช้กับชุดใหญ่ได้)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help="ไฟล์ปลายทาง")
+        parser.add_argument('--format', choices=labels.FORMATS, default='pdf')
+        parser.add_argument('--symbology', default='code128', help="code128 หรือ qr")
+        parser.add_argument('--org', type=int, help="id องค์กร")
+        parser.add_argument('--item', type=int, help="id ประเภทสิ่งของ")
+        parser.add_argument('--status', help="สถานะอุปกรณ์ เช่น available")
+
+    def handle(self, *args, **options):
+        assets = Asset.objects.all()
+        if options['org']:
+            assets = assets.filter(organization_id=options['org'])
+        if options['item']:
+            assets = assets.filter(item_id=options['item'])
+        if options['status']:
+            assets = assets.filter(status=options['status'])
+
+        try:
+            chunks = labels.stream_labels(assets, fmt=options['format'], symbology=options['symbology'])
+            size = 0
+            with open(options['output'], 'wb') as fh:
+                for chunk in chunks:
+                    fh.write(chunk)
+                    size += len(chunk)
+        except labels.LabelError as exc:
+            raise CommandError(str(exc))
+        self.stdout.write(self.style.SUCCESS(f"Labels written: {options['output']} ({size} bytes)"))
@@ -0,0 +1,163 @@
+# borrowing/management/commands/index_advisor.py
+import json
+import re
+from collections import defaultdict
+
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from borrowing.querylog import log_path
+
+# รูปแบบบรรทัดในแผนการรันที่บอกว่าใช้ index ไหน / สแกนทั้งตาราง
+USED_INDEX = [
+    re.compile(r'USING (?:COVERING )?INDEX (\w+)'),           # SQLite
+    re.compile(r'Index (?:Only )?Scan(?: Backward)? using (\w+)'),  # PostgreSQL
+    re.compile(r'Bitmap Index Scan on (\w+)'),
+]
+FULL_SCAN = [
+    re.compile(r'^SCAN (?:TABLE )?(\w+)(?: AS \w+)?$'),         # SQLite (ไม่มี USING = ไม่ใช้ index)
+    re.compile(r'Seq Scan on (\w+)'),                            # PostgreSQL
+]
+PREDICATE = r'"{table}"\."(\w+)" (=|IN|<=|>=|<|>|IS|LIKE|BETWEEN)'
+EQUALITY_OPS = ('=', 'IN', 'IS')
+
+
+class Command(BaseCommand):
+    help = (
+        "วิเคราะห์ index จาก workload ที่บันทึกโดย SLOW_QUERY_MS (borrowing/querylog.py): "
+        "index ที่ไม่ถูกใช้, index ซ้ำซ้อน และ index ที่ควรเพิ่ม "
+        "(ปิดไว้เป็นค่าเริ่มต้น เก็บ workload ก่อนด้วย env SLOW_QUERY_MS=0)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--log', help="ไฟล์ JSONL ของ query (ค่าเริ่มต้น SLOW_QUERY_LOG_FILE)")
+        parser.add_argument('--apps', nargs='*', default=['borrowing', 'users'], help="แอปที่ต้องการตรวจ")
+        parser.add_argument('--top', type=int, default=10, help="จำนวนข้อเสนอ index ที่แสดง")
+
+    def handle(self, *args, **options):
+        path = options['log'] or log_path()
+        records = self._load(path)
+        tables = self._tables(options['apps'])
+        indexes = self._indexes(tables)
+
+        used, scans, sorts = set(), defaultdict(lambda: [0, 0.0]), defaultdict(int)
+        seen_tables = set()
+        for rec in records:
+            for table in tables:
+                if f'"{table}"' in rec['sql']:
+                    seen_tables.add(table)
+            for line in rec.get('plan', []):
+                for pattern in USED_INDEX:
+                    used.update(pattern.findall(line))
+                for pattern in FULL_SCAN:
+                    match = pattern.search(line)
+                    if match and match.group(1) in tables:
+                        key = (match.group(1), self._predicate(rec['sql'], match.group(1)))
+                        scans[key][0] += 1
+                        scans[key][1] += rec.get('ms', 0)
+                if 'USE TEMP B-TREE FOR ORDER BY' in line:
+                    sorts[rec['fingerprint']] += 1
+
+        self.stdout.write(f"Workload: {len(records)} queries จาก {path}\n")
+        self._report_redundant(tables, indexes)
+        self._report_unused(tables, indexes, used, seen_tables, len(records))
+        self._report_missing(tables, indexes, scans, options['top'])
+        if sorts:
+            self.stdout.write(self.style.MIGRATE_HEADING("\nเรียงลำดับด้วย temp b-tree (ORDER BY ไม่ตรง index)"))
+            for fp, count in sorted(sorts.items(), key=lambda kv: -kv[1])[:options['top']]:
+                self.stdout.write(f"  {count}x  {fp[:160]}")
+
+    # ----------------------------------------------------------------
+    def _load(self, path):
+        try:
+            with open(path, encoding='utf-8') as fh:
+                return [json.loads(line) for line in fh if line.strip()]
+        except FileNotFoundError:
+            raise CommandError(f"ไม่พบไฟล์ {path} (ตั้ง env SLOW_QUERY_MS=0 แล้วใช้งานระบบก่อน)")
+
+    def _tables(self, app_labels):
+        """db_table -> {column: field name} ของโมเดลในแอปที่เลือก"""
+        tables = {}
+        for label in app_labels:
+            for model in apps.get_app_config(label).get_models():
+                tables[model._meta.db_table] = {
+                    f.column: f.name for f in model._meta.concrete_fields
+                }
+        return tables
+
+    def _indexes(self, tables):
+        """db_table -> [(ชื่อ, [คอลัมน์], unique)] จากฐานข้อมูลจริง (ไม่รวม primary key)"""
+        result = {}
+        with connection.cursor() as cursor:
+            existing = set(connection.introspection.table_names(cursor))
+            for table in tables:
+                if table not in existing:
+                    continue
+                constraints = connection.introspection.get_constraints(cursor, table)
+                result[table] = [
+                    (name, c['columns'], bool(c['unique']))
+                    for name, c in constraints.items()
+                    if (c['index'] or c['unique']) and not c['primary_key'] and c['columns']
+                ]
+        return result
+
+    def _predicate(self, sql, table):
+        """คอลัมน์ใน WHERE ของตารางนั้น: คอลัมน์เท่ากับ (=, IN) มาก่อนคอลัมน์ช่วง (<, >)"""
+        where = sql.split(' WHERE ', 1)[1] if ' WHERE ' in sql else ''
+        equality, ranges = [], []
+        for column, op in re.findall(PREDICATE.format(table=re.escape(table)), where):
+            bucket = equality if op in EQUALITY_OPS else ranges
+            if column not in equality and column not in ranges:
+                bucket.append(column)
+        return tuple(equality + ranges)
+
+    def _report_redundant(self, tables, indexes):
+        self.stdout.write(self.style.MIGRATE_HEADING("index ซ้ำซ้อน (คอลัมน์เป็นส่วนต้นของ index อื่น)"))
+        found = False
+        for table, idx in indexes.items():
+            for name, cols, unique in idx:
+                if unique:
+                    continue
+                for other, other_cols, _ in idx:
+                    if other != name and other_cols[:len(cols)] == cols and (
+                        len(other_cols) > len(cols) or other < name
+                    ):
+                        found = True
+                        self.stdout.write(f"  {table}.{name} {cols} ถูกครอบด้วย {other} {other_cols}")
+                        break
+        if not found:
+            self.stdout.write("  (ไม่พบ)")
+
+    def _report_unused(self, tables, indexes, used, seen_tables, total):
+        self.stdout.write(self.style.MIGRATE_HEADING("\nindex ที่ไม่ถูกใช้ใน workload ที่บันทึก"))
+        if total == 0:
+            self.stdout.write("  (ยังไม่มี workload)")
+            return
+        found = False
+        for table in sorted(seen_tables):
+            for name, cols, unique in indexes.get(table, []):
+                if not unique and name not in used:
+                    found = True
+                    self.stdout.write(f"  {table}.{name} {cols}")
+        if not found:
+            self.stdout.write("  (ไม่พบ)")
+        self.stdout.write("  * ตรวจเฉพาะตารางที่ปรากฏใน workload; ควรเก็บ workload ด้วย SLOW_QUERY_MS = 0 ก่อนตัดสินใจลบ")
+
+    def _report_missing(self, tables, indexes, scans, top):
+        self.stdout.write(self.style.MIGRATE_HEADING("\nindex ที่ควรพิจารณาเพิ่ม (query ที่สแกนทั้งตาราง)"))
+        rows = sorted(scans.items(), key=lambda kv: -kv[1][1])
+        shown = 0
+        for (table, cols), (count, ms) in rows:
+            if not cols:
+                continue
+            # มี index ที่ขึ้นต้นด้วยคอลัมน์ชุดนี้อยู่แล้ว -> ปัญหาอยู่ที่อื่น (เช่น selectivity/function)
+            if any(list(c[:len(cols)]) == list(cols) for _, c, _ in indexes.get(table, [])):
+                continue
+            fields = [tables[table].get(c, c) for c in cols]
+            self.stdout.write(f"  {table}: models.Index(fields={fields})  # {count} queries, {ms:.0f} ms")
+            shown += 1
+            if shown >= top:
+                break
+        if not shown:
+            self.stdout.write("  (ไม่พบ)")
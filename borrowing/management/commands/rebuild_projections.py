@@ -0,0 +1,26 @@
+# borrowing/management/commands/rebuild_projections.py
+from django.core.management.base import BaseCommand, CommandError
+from borrowing.projections import rebuild_projections, update_projections, get_projections
+
+class Command(BaseCommand):
+    help = "สร้าง read model (สถิติแดชบอร์ด, สถานะการจองอุปกรณ์, สรุปรายวัน) ใหม่จาก LoanEvent"
+
+    def add_arguments(self, parser):
+        parser.add_argument('names', nargs='*', help="ชื่อ projection (เว้นว่าง = ทั้งหมด)")
+        parser.add_argument('--incremental', action='store_true',
+                            help="ประมวลผลเฉพาะเหตุการณ์ใหม่ ไม่ล้างข้อมูลเดิม")
+        parser.add_argument('--list', action='store_true', help="แสดงชื่อ projection ที่มี")
+
+    def handle(self, *args, **options):
+        if options['list']:
+            for p in get_projections():
+                self.stdout.write(f"{p.name}: {p.__doc__ or ''}".strip())
+            return
+
+        runner = update_projections if options['incremental'] else rebuild_projections
+        try:
+            result = runner(options['names'] or None)
+        except KeyError as e:
+            raise CommandError(str(e))
+        for name, count in result.items():
+            self.stdout.write(self.style.SUCCESS(f"{name}: {count} events"))
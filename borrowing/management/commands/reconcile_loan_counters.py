@@ -0,0 +1,14 @@
+# borrowing/management/commands/reconcile_loan_counters.py
+from django.core.management.base import BaseCommand
+from borrowing.quotas import reconcile
+
+class Command(BaseCommand):
+    help = "นับรายการยืมที่ถืออยู่ของผู้ใช้ (ใช้ตรวจโควตา) ใหม่จากตาราง Loan แล้วแก้ตัวนับที่ไม่ตรง"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="แสดงจำนวนที่ไม่ตรงโดยไม่แก้")
+
+    def handle(self, *args, **options):
+        fixed = reconcile(dry_run=options['dry_run'])
+        label = "Counters out of sync" if options['dry_run'] else "Counters fixed"
+        self.stdout.write(self.style.SUCCESS(f"{label}: {fixed}"))
@@ -0,0 +1,116 @@
+# borrowing/management/commands/run_jobs.py
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+import time
+
+import django
+from django.core.management.base import BaseCommand
+
+
+def _worker_loop(worker_id, stop, poll_interval, once, tick=False):
+    """
+    วนหยิบงานจนกว่าจะสั่งหยุด (หรือคิวว่างในโหมด --once)
+    tick=True (เธรดแรกของแต่ละโปรเซส): ตั้งคิวงานตามรอบ/คืนงานค้างด้วย
+    """
+    from django.db import connection
+    from borrowing import jobs
+
+    last_tick = 0.0
+    try:
+        while not stop.is_set():
+            # ตั้งคิวงานตามรอบ/คืนงานค้าง ทุก poll_interval เฉพาะเธรด t0 (idempotent แม้หลายโปรเซสทำพร้อมกัน)
+            if tick and time.monotonic() - last_tick >= poll_interval:
+                jobs.requeue_stale()
+                jobs.schedule_periodic()
+                last_tick = time.monotonic()
+
+            job_obj = jobs.claim_next(worker_id)
+            if job_obj is None:
+                if once:
+                    return
+                stop.wait(poll_interval)
+                continue
+            jobs.run_job(job_obj)
+    finally:
+        connection.close()   # แต่ละเธรดมี connection ของตัวเอง
+
+
+def _run_threads(prefix, threads, poll_interval, once, stop):
+    workers = [
+        threading.Thread(
+            target=_worker_loop,
+            args=(f"{prefix}-t{i}", stop, poll_interval, once, i == 0),
+            daemon=True,
+        )
+        for i in range(threads)
+    ]
+    for w in workers:
+        w.start()
+    for w in workers:
+        while w.is_alive():
+            w.join(timeout=0.5)
+
+
+def _process_main(prefix, threads, poll_interval, once):
+    # โปรเซสลูก (spawn) ต้อง setup Django เอง; ถ้า fork มาแล้วจะไม่ทำซ้ำ
+    django.setup()
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    try:
+        _run_threads(prefix, threads, poll_interval, once, stop)
+    except KeyboardInterrupt:
+        stop.set()
+
+
+class Command(BaseCommand):
+    help = "รัน worker สำหรับงานเบื้องหลัง (แจ้งเตือน, งานตามรอบ ฯลฯ) จากคิวในฐานข้อมูล"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=1, help="จำนวนโปรเซส worker")
+        parser.add_argument('--threads', type=int, default=1, help="จำนวนเธรดต่อโปรเซส")
+        parser.add_argument('--poll-interval', type=float, default=2.0, help="วินาทีที่รอเมื่อคิวว่าง")
+        parser.add_argument('--once', action='store_true', help="ทำงานที่ค้างให้หมดแล้วออก")
+
+    def handle(self, *args, **options):
+        from django.db import connections
+
+        processes = max(1, options['processes'])
+        threads = max(1, options['threads'])
+        poll_interval = options['poll_interval']
+        once = options['once']
+        prefix = f"{socket.gethostname()}-{os.getpid()}"
+
+        self.stdout.write(f"Job worker: processes={processes} threads={threads}")
+
+        if processes == 1:
+            stop = threading.Event()
+            try:
+                _run_threads(prefix, threads, poll_interval, once, stop)
+            except KeyboardInterrupt:
+                stop.set()
+            self.stdout.write(self.style.SUCCESS("Job worker stopped"))
+            return
+
+        # ปิด connection ก่อนแตกโปรเซส ไม่ให้ลูกใช้ socket/file handle ร่วมกัน
+        connections.close_all()
+        children = [
+            multiprocessing.Process(
+                target=_process_main,
+                args=(f"{prefix}-p{i}", threads, poll_interval, once),
+            )
+            for i in range(processes)
+        ]
+        for child in children:
+            child.start()
+        try:
+            for child in children:
+                child.join()
+        except KeyboardInterrupt:
+            for child in children:
+                child.terminate()
+            for child in children:
+                child.join()
+        self.stdout.write(self.style.SUCCESS("Job worker stopped"))
@@ -0,0 +1,10 @@
+# borrowing/management/commands/send_due_reminders.py
+from django.core.management.base import BaseCommand
+from borrowing.reminders import send_due_reminders
+
+class Command(BaseCommand):
+    help = "ส่งแจ้งเตือนกำหนดคืน (ใกล้ถึง/ครบ/เกินกำหนด) แบบสรุปรวมต่อผู้ใช้ ไม่ส่งซ้ำขั้นที่เคยส่งแล้ว"
+
+    def handle(self, *args, **options):
+        loans, notifications = send_due_reminders()
+        self.stdout.write(self.style.SUCCESS(f"Reminded loans: {loans}, notifications: {notifications}"))
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:48
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('borrowing', '0004_loan_borrowing_l_status_641648_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, verbose_name='ชื่องาน')),
+                ('payload', models.JSONField(blank=True, default=dict, verbose_name='ข้อมูลงาน')),
+                ('status', models.CharField(choices=[('queued', 'รอคิว'), ('running', 'กำลังทำงาน'), ('done', 'สำเร็จ'), ('failed', 'ล้มเหลว')], default='queued', max_length=20, verbose_name='สถานะ')),
+                ('run_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='เวลาที่ให้เริ่มทำ')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='จำนวนครั้งที่ลอง')),
+                ('max_attempts', models.PositiveIntegerField(default=5, verbose_name='ลองได้สูงสุด')),
+                ('idempotency_key', models.CharField(blank=True, max_length=255, null=True, unique=True, verbose_name='คีย์กันซ้ำ')),
+                ('locked_by', models.CharField(blank=True, max_length=100, verbose_name='worker ที่ถือ')),
+                ('locked_at', models.DateTimeField(blank=True, null=True, verbose_name='เวลาที่ถูกหยิบ')),
+                ('last_error', models.TextField(blank=True, verbose_name='ข้อผิดพลาดล่าสุด')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='วันที่สร้าง')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='วันที่เสร็จ')),
+            ],
+            options={
+                'verbose_name': 'งานเบื้องหลัง',
+                'verbose_name_plural': 'งานเบื้องหลัง',
+                'indexes': [models.Index(fields=['status', 'run_at'], name='borrowing_j_status_2bf6a9_idx')],
+            },
+        ),
+    ]
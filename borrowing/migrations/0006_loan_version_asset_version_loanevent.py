@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:49
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('borrowing', '0005_job'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='asset',
+            name='version',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='เวอร์ชัน'),
+        ),
+        migrations.AddField(
+            model_name='loan',
+            name='version',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='เวอร์ชัน'),
+        ),
+        migrations.CreateModel(
+            name='LoanEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('requested', 'ส่งคำขอ'), ('approved', 'อนุมัติ'), ('picked_up', 'รับของ'), ('returned', 'คืนของ'), ('rejected', 'ปฏิเสธ'), ('overdue', 'เกินกำหนด')], max_length=20, verbose_name='เหตุการณ์')),
+                ('from_status', models.CharField(blank=True, max_length=20, verbose_name='สถานะเดิม')),
+                ('to_status', models.CharField(max_length=20, verbose_name='สถานะใหม่')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='เวลา')),
+                ('actor', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='ผู้ดำเนินการ')),
+                ('loan', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='events', to='borrowing.loan', verbose_name='รายการยืม')),
+            ],
+            options={
+                'verbose_name': 'เหตุการณ์รายการยืม',
+                'verbose_name_plural': 'เหตุการณ์รายการยืม',
+                'ordering': ['id'],
+            },
+        ),
+    ]
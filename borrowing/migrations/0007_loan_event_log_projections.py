@@ -0,0 +1,155 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:51
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def seed_loan_events(apps, schema_editor):
+    """
+    เติมคีย์ใหม่ให้ LoanEvent เดิม และสร้างเหตุการณ์ย้อนหลังจาก timestamp
+    ของ Loan ที่ยังไม่มีเหตุการณ์เลย เพื่อให้ rebuild_projections ได้ภาพครบ
+    """
+    Loan = apps.get_model('borrowing', 'Loan')
+    LoanEvent = apps.get_model('borrowing', 'LoanEvent')
+
+    loans = {
+        loan.pk: loan
+        for loan in Loan.objects.select_related('asset__item')
+    }
+
+    for event in LoanEvent.objects.filter(asset__isnull=True):
+        loan = loans.get(event.loan_id)
+        if loan is None:
+            continue
+        event.asset_id = loan.asset_id
+        event.borrower_id = loan.borrower_id
+        event.organization_id = loan.asset.item.organization_id
+        event.save(update_fields=['asset', 'borrower', 'organization'])
+
+    has_events = set(LoanEvent.objects.values_list('loan_id', flat=True))
+    seeded = []
+    for loan in loans.values():
+        if loan.pk in has_events:
+            continue
+
+        def add(kind, from_status, to_status, at):
+            seeded.append(LoanEvent(
+                loan_id=loan.pk, asset_id=loan.asset_id, borrower_id=loan.borrower_id,
+                organization_id=loan.asset.item.organization_id,
+                kind=kind, from_status=from_status, to_status=to_status,
+                payload={
+                    'start_date': loan.start_date.isoformat() if loan.start_date else None,
+                    'due_date': loan.due_date.isoformat() if loan.due_date else None,
+                },
+                created_at=at,
+            ))
+
+        add('requested', '', 'pending', loan.borrow_date)
+        status = 'pending'
+        if loan.approved_at or loan.status in ('approved', 'overdue', 'returned'):
+            add('approved', status, 'approved', loan.approved_at or loan.borrow_date)
+            status = 'approved'
+        if loan.pickup_date:
+            add('picked_up', status, status, loan.pickup_date)
+        last_at = loan.pickup_date or loan.approved_at or loan.borrow_date
+        if loan.status == 'overdue':
+            add('overdue', status, 'overdue', last_at)
+        elif loan.status == 'returned':
+            add('returned', status, 'returned', loan.return_date or last_at)
+        elif loan.status == 'rejected':
+            add('rejected', status, 'rejected', last_at)
+
+    seeded.sort(key=lambda e: (e.created_at, e.loan_id))
+    LoanEvent.objects.bulk_create(seeded, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('borrowing', '0006_loan_version_asset_version_loanevent'),
+        ('users', '0006_organization_logo'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProjectionCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('last_event_id', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='loanevent',
+            name='asset',
+            field=models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='borrowing.asset', verbose_name='อุปกรณ์'),
+        ),
+        migrations.AddField(
+            model_name='loanevent',
+            name='borrower',
+            field=models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='ผู้ยืม'),
+        ),
+        migrations.AddField(
+            model_name='loanevent',
+            name='organization',
+            field=models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='users.organization', verbose_name='องค์กร'),
+        ),
+        migrations.AddField(
+            model_name='loanevent',
+            name='payload',
+            field=models.JSONField(blank=True, default=dict, verbose_name='ข้อมูลเพิ่มเติม'),
+        ),
+        migrations.CreateModel(
+            name='AssetReservationState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('open_loans', models.IntegerField(default=0, verbose_name='คำขอ/การจองที่ยังเปิดอยู่')),
+                ('current_loan_id', models.BigIntegerField(blank=True, null=True, verbose_name='รายการที่กำลังยืมอยู่')),
+                ('last_event_at', models.DateTimeField(blank=True, null=True)),
+                ('asset', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='reservation_state', to='borrowing.asset', verbose_name='อุปกรณ์')),
+            ],
+            options={
+                'verbose_name': 'สถานะการจองอุปกรณ์',
+                'verbose_name_plural': 'สถานะการจองอุปกรณ์',
+            },
+        ),
+        migrations.CreateModel(
+            name='OrgLoanStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pending', models.IntegerField(default=0)),
+                ('approved', models.IntegerField(default=0)),
+                ('overdue', models.IntegerField(default=0)),
+                ('returned', models.IntegerField(default=0)),
+                ('rejected', models.IntegerField(default=0)),
+                ('organization', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='loan_stats', to='users.organization', verbose_name='องค์กร')),
+            ],
+            options={
+                'verbose_name': 'สถิติรายการยืมขององค์กร',
+                'verbose_name_plural': 'สถิติรายการยืมขององค์กร',
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyLoanRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='วันที่')),
+                ('requested', models.IntegerField(default=0)),
+                ('approved', models.IntegerField(default=0)),
+                ('picked_up', models.IntegerField(default=0)),
+                ('returned', models.IntegerField(default=0)),
+                ('rejected', models.IntegerField(default=0)),
+                ('overdue', models.IntegerField(default=0)),
+                ('organization', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='users.organization', verbose_name='องค์กร')),
+            ],
+            options={
+                'verbose_name': 'สรุปรายวัน',
+                'verbose_name_plural': 'สรุปรายวัน',
+                'constraints': [models.UniqueConstraint(fields=('organization', 'day'), name='unique_rollup_per_org_day')],
+            },
+        ),
+        migrations.RunPython(seed_loan_events, migrations.RunPython.noop),
+    ]
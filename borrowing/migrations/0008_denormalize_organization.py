@@ -0,0 +1,63 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:55
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def backfill_organization(apps, schema_editor):
+    Item = apps.get_model('borrowing', 'Item')
+    Asset = apps.get_model('borrowing', 'Asset')
+    Loan = apps.get_model('borrowing', 'Loan')
+    Asset.objects.update(organization_id=Subquery(
+        Item.objects.filter(pk=OuterRef('item_id')).values('organization_id')[:1]
+    ))
+    Loan.objects.update(organization_id=Subquery(
+        Asset.objects.filter(pk=OuterRef('asset_id')).values('organization_id')[:1]
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('borrowing', '0007_loan_event_log_projections'),
+        ('users', '0006_organization_logo'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='asset',
+            name='organization',
+            field=models.ForeignKey(editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='assets', to='users.organization', verbose_name='องค์กร'),
+        ),
+        migrations.AddField(
+            model_name='loan',
+            name='organization',
+            field=models.ForeignKey(editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='loans', to='users.organization', verbose_name='องค์กร'),
+        ),
+        migrations.RunPython(backfill_organization, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='asset',
+            name='organization',
+            field=models.ForeignKey(editable=False, on_delete=django.db.models.deletion.CASCADE, related_name='assets', to='users.organization', verbose_name='องค์กร'),
+        ),
+        migrations.AlterField(
+            model_name='loan',
+            name='organization',
+            field=models.ForeignKey(editable=False, on_delete=django.db.models.deletion.CASCADE, related_name='loans', to='users.organization', verbose_name='องค์กร'),
+        ),
+        migrations.AddIndex(
+            model_name='asset',
+            index=models.Index(fields=['organization', 'status'], name='borrowing_a_organiz_5fdcaf_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='loan',
+            index=models.Index(fields=['organization', 'status', 'borrow_date'], name='borrowing_l_organiz_bf12e9_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='loan',
+            index=models.Index(fields=['organization', 'status', 'due_date'], name='borrowing_l_organiz_b1d0c0_idx'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:01
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('borrowing', '0008_denormalize_organization'),
+        ('users', '0006_organization_logo'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='loan',
+            name='reminder_stage',
+            field=models.PositiveSmallIntegerField(default=0, editable=False, verbose_name='ขั้นการเตือนที่ส่งแล้ว'),
+        ),
+        migrations.AddIndex(
+            model_name='loan',
+            index=models.Index(fields=['status', 'due_date'], name='borrowing_l_status_44505d_idx'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:04
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('borrowing', '0009_loan_reminder_stage'),
+        ('users', '0008_notification_retention'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedLoan',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('borrow_date', models.DateTimeField(verbose_name='วันที่ส่งคำขอ')),
+                ('start_date', models.DateField(blank=True, null=True, verbose_name='วันที่เริ่มใช้ (จอง)')),
+                ('due_date', models.DateField(blank=True, null=True, verbose_name='กำหนดคืน')),
+                ('approved_at', models.DateTimeField(blank=True, null=True, verbose_name='วันที่อนุมัติ')),
+                ('pickup_date', models.DateTimeField(blank=True, null=True, verbose_name='วันที่รับของจริง')),
+                ('return_date', models.DateTimeField(blank=True, null=True, verbose_name='วันที่คืน')),
+                ('status', models.CharField(choices=[('pending', 'รอดำเนินการ'), ('approved', 'อนุมัติแล้ว/จองสำเร็จ'), ('returned', 'คืนแล้ว'), ('rejected', 'ถูกปฏิเสธ'), ('overdue', 'เกินกำหนด')], max_length=20, verbose_name='สถานะ')),
+                ('reason', models.TextField(blank=True, verbose_name='เหตุผลการยืม')),
+                ('archived_at', models.DateTimeField(auto_now_add=True, verbose_name='วันที่ย้ายเข้าคลัง')),
+                ('asset', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='borrowing.asset', verbose_name='อุปกรณ์')),
+                ('borrower', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='ผู้ยืม')),
+                ('organization', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='users.organization', verbose_name='องค์กร')),
+            ],
+            options={
+                'verbose_name': 'คลังรายการยืม',
+                'verbose_name_plural': 'คลังรายการยืม',
+                'ordering': ['-borrow_date'],
+                'indexes': [models.Index(fields=['organization', 'borrow_date'], name='borrowing_a_organiz_5ec01a_idx'), models.Index(fields=['borrower', 'borrow_date'], name='borrowing_a_borrowe_a752b9_idx')],
+            },
+        ),
+    ]
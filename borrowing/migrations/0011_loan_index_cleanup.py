@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:06
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('borrowing', '0010_archived_loan'),
+        ('users', '0008_notification_retention'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='loan',
+            name='borrowing_l_asset_i_13de7f_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='loan',
+            name='borrowing_l_asset_i_e6c999_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='loan',
+            name='borrowing_l_status_641648_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='loan',
+            name='borrowing_l_borrowe_5dfb2c_idx',
+        ),
+        migrations.AddIndex(
+            model_name='loan',
+            index=models.Index(fields=['organization', 'borrow_date'], name='borrowing_l_organiz_d5af31_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='loan',
+            index=models.Index(fields=['asset', 'status', 'start_date', 'due_date'], name='borrowing_l_asset_i_8d315d_idx'),
+        ),
+    ]
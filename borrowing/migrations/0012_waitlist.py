@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:12
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('borrowing', '0011_loan_index_cleanup'),
+        ('users', '0008_notification_retention'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WaitlistEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start_date', models.DateField(verbose_name='วันที่เริ่มใช้')),
+                ('due_date', models.DateField(verbose_name='กำหนดคืน')),
+                ('reason', models.TextField(blank=True, verbose_name='เหตุผลการยืม')),
+                ('priority', models.SmallIntegerField(default=0, verbose_name='ลำดับความสำคัญ')),
+                ('status', models.CharField(choices=[('waiting', 'รอคิว'), ('promoted', 'ได้คิวแล้ว'), ('cancelled', 'ยกเลิก'), ('expired', 'หมดอายุ')], default='waiting', max_length=20, verbose_name='สถานะ')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='วันที่เข้าคิว')),
+                ('promoted_at', models.DateTimeField(blank=True, null=True, verbose_name='วันที่ได้คิว')),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='waitlist', to='borrowing.item', verbose_name='ประเภทสิ่งของ')),
+                ('loan', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='waitlist_entry', to='borrowing.loan', verbose_name='คำขอยืมที่ได้')),
+                ('organization', models.ForeignKey(editable=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='users.organization', verbose_name='องค์กร')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='waitlist_entries', to=settings.AUTH_USER_MODEL, verbose_name='ผู้ขอ')),
+            ],
+            options={
+                'verbose_name': 'คิวรอยืม',
+                'verbose_name_plural': 'คิวรอยืม',
+                'ordering': ['-priority', 'created_at'],
+                'indexes': [models.Index(fields=['item', 'status', '-priority', 'created_at'], name='waitlist_head_idx'), models.Index(fields=['user', 'status'], name='borrowing_w_user_id_0301f8_idx')],
+            },
+        ),
+    ]
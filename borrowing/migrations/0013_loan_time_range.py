@@ -0,0 +1,69 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:14
+
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def backfill_time_range(apps, schema_editor):
+    # จองเดิมเป็นรายวัน: [00:00 ของวันเริ่ม, 00:00 ของวันถัดจากวันคืน) ตามเขตเวลาของระบบ
+    tz = timezone.get_default_timezone()
+    for name in ('Loan', 'ArchivedLoan'):
+        model = apps.get_model('borrowing', name)
+        rows = model.objects.filter(start_date__isnull=False, due_date__isnull=False).only('id', 'start_date', 'due_date')
+        batch = []
+        for row in rows.iterator(chunk_size=1000):
+            row.start_at = timezone.make_aware(datetime.combine(row.start_date, time.min), tz)
+            row.end_at = timezone.make_aware(datetime.combine(row.due_date + timedelta(days=1), time.min), tz)
+            batch.append(row)
+            if len(batch) >= 1000:
+                model.objects.bulk_update(batch, ['start_at', 'end_at'])
+                batch = []
+        model.objects.bulk_update(batch, ['start_at', 'end_at'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('borrowing', '0012_waitlist'),
+        ('users', '0008_notification_retention'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='loan',
+            name='borrowing_l_asset_i_8d315d_idx',
+        ),
+        migrations.AddField(
+            model_name='archivedloan',
+            name='end_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='สิ้นสุด (เวลา)'),
+        ),
+        migrations.AddField(
+            model_name='archivedloan',
+            name='start_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='เริ่มใช้ (เวลา)'),
+        ),
+        migrations.AddField(
+            model_name='loan',
+            name='end_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='สิ้นสุด (เวลา)'),
+        ),
+        migrations.AddField(
+            model_name='loan',
+            name='start_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='เริ่มใช้ (เวลา)'),
+        ),
+        migrations.RunPython(backfill_time_range, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='loan',
+            index=models.Index(fields=['asset', 'status', 'start_at', 'end_at'], name='borrowing_l_asset_i_2ef084_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='loanevent',
+            index=models.Index(fields=['asset', 'id'], name='borrowing_l_asset_i_a43e1c_idx'),
+        ),
+    ]
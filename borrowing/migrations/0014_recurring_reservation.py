@@ -0,0 +1,52 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:16
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('borrowing', '0013_loan_time_range'),
+        ('users', '0008_notification_retention'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecurringReservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('reason', models.TextField(blank=True, verbose_name='เหตุผลการยืม')),
+                ('freq', models.CharField(choices=[('daily', 'ทุกวัน'), ('weekly', 'ทุกสัปดาห์')], default='weekly', max_length=10, verbose_name='ความถี่')),
+                ('interval', models.PositiveSmallIntegerField(default=1, verbose_name='ทุก ๆ (รอบ)')),
+                ('byweekday', models.CharField(blank=True, max_length=20, verbose_name='วันในสัปดาห์')),
+                ('dtstart', models.DateField(verbose_name='เริ่ม')),
+                ('until', models.DateField(verbose_name='สิ้นสุด')),
+                ('start_time', models.TimeField(blank=True, null=True, verbose_name='เวลาเริ่ม')),
+                ('end_time', models.TimeField(blank=True, null=True, verbose_name='เวลาสิ้นสุด')),
+                ('exdates', models.JSONField(blank=True, default=list, verbose_name='วันที่ข้าม')),
+                ('status', models.CharField(choices=[('pending', 'รอดำเนินการ'), ('approved', 'อนุมัติแล้ว'), ('rejected', 'ถูกปฏิเสธ'), ('cancelled', 'ยกเลิก')], default='pending', max_length=20, verbose_name='สถานะ')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='วันที่ส่งคำขอ')),
+                ('approved_at', models.DateTimeField(blank=True, null=True, verbose_name='วันที่อนุมัติ')),
+                ('asset', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recurring_reservations', to='borrowing.asset', verbose_name='อุปกรณ์')),
+                ('borrower', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recurring_reservations', to=settings.AUTH_USER_MODEL, verbose_name='ผู้ยืม')),
+                ('organization', models.ForeignKey(editable=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='users.organization', verbose_name='องค์กร')),
+            ],
+            options={
+                'verbose_name': 'การจองซ้ำ',
+                'verbose_name_plural': 'การจองซ้ำ',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.AddField(
+            model_name='loan',
+            name='recurrence',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='loans', to='borrowing.recurringreservation', verbose_name='การจองซ้ำ'),
+        ),
+        migrations.AddIndex(
+            model_name='recurringreservation',
+            index=models.Index(fields=['organization', 'status', 'created_at'], name='borrowing_r_organiz_4557dc_idx'),
+        ),
+    ]
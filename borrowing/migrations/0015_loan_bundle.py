@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:19
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('borrowing', '0014_recurring_reservation'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LoanBundle',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('reason', models.TextField(blank=True, verbose_name='เหตุผลการยืม')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='วันที่ส่งคำขอ')),
+                ('borrower', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='loan_bundles', to=settings.AUTH_USER_MODEL, verbose_name='ผู้ยืม')),
+            ],
+            options={
+                'verbose_name': 'ชุดคำขอยืม',
+                'verbose_name_plural': 'ชุดคำขอยืม',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.AddField(
+            model_name='loan',
+            name='bundle',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='loans', to='borrowing.loanbundle', verbose_name='ชุดคำขอ'),
+        ),
+    ]
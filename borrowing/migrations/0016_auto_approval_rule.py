@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:21
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('borrowing', '0015_loan_bundle'),
+        ('users', '0008_notification_retention'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AutoApprovalRule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, verbose_name='ชื่อกฎ')),
+                ('is_active', models.BooleanField(default=True, verbose_name='เปิดใช้งาน')),
+                ('order', models.PositiveSmallIntegerField(default=0, verbose_name='ลำดับ')),
+                ('borrower_role', models.CharField(choices=[('any', 'ทุกคน'), ('member', 'สมาชิกขององค์กร'), ('admin', 'แอดมินขององค์กร'), ('external', 'ผู้ใช้นอกองค์กร')], default='any', max_length=10, verbose_name='ผู้ยืม')),
+                ('max_duration_hours', models.PositiveIntegerField(blank=True, null=True, verbose_name='ระยะเวลายืมสูงสุด (ชั่วโมง)')),
+                ('max_active_per_user', models.PositiveSmallIntegerField(blank=True, null=True, verbose_name='ยืมพร้อมกันได้สูงสุด (รายการ/คน)')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='วันที่สร้าง')),
+                ('category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='borrowing.itemcategory', verbose_name='หมวดอุปกรณ์')),
+                ('organization', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='auto_approval_rules', to='users.organization', verbose_name='องค์กร')),
+            ],
+            options={
+                'verbose_name': 'กฎอนุมัติอัตโนมัติ',
+                'verbose_name_plural': 'กฎอนุมัติอัตโนมัติ',
+                'ordering': ['organization', 'order', 'id'],
+            },
+        ),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:23
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_counters(apps, schema_editor):
+    # นับรายการที่ยังกันช่วงอยู่ของแต่ละผู้ใช้ × องค์กร × หมวด ด้วย GROUP BY ครั้งเดียว (การจองซ้ำนับชุดละ 1)
+    Loan = apps.get_model('borrowing', 'Loan')
+    UserLoanCounter = apps.get_model('borrowing', 'UserLoanCounter')
+    rows = (
+        Loan.objects.filter(status__in=('pending', 'approved', 'overdue'))
+        .values('borrower_id', 'organization_id', 'asset__item__category_id')
+        .annotate(n=models.Count('id', filter=models.Q(recurrence__isnull=True))
+                  + models.Count('recurrence', distinct=True))
+    )
+    UserLoanCounter.objects.bulk_create([
+        UserLoanCounter(
+            user_id=row['borrower_id'], organization_id=row['organization_id'],
+            category_key=row['asset__item__category_id'] or 0, active=row['n'],
+        )
+        for row in rows
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('borrowing', '0016_auto_approval_rule'),
+        ('users', '0008_notification_retention'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QuotaPolicy',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('borrower_role', models.CharField(choices=[('any', 'ทุกคน'), ('member', 'สมาชิกขององค์กร'), ('admin', 'แอดมินขององค์กร'), ('external', 'ผู้ใช้นอกองค์กร')], default='any', max_length=10, verbose_name='ผู้ยืม')),
+                ('max_loans', models.PositiveSmallIntegerField(verbose_name='ยืมพร้อมกันได้สูงสุด (รายการ)')),
+                ('is_active', models.BooleanField(default=True, verbose_name='เปิดใช้งาน')),
+                ('category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='borrowing.itemcategory', verbose_name='หมวดอุปกรณ์')),
+                ('organization', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='quota_policies', to='users.organization', verbose_name='องค์กร')),
+            ],
+            options={
+                'verbose_name': 'โควตาการยืม',
+                'verbose_name_plural': 'โควตาการยืม',
+                'ordering': ['organization', 'max_loans'],
+            },
+        ),
+        migrations.CreateModel(
+            name='UserLoanCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('category_key', models.PositiveIntegerField(default=0, verbose_name='หมวด')),
+                ('active', models.IntegerField(default=0, verbose_name='รายการที่ถืออยู่')),
+                ('organization', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='users.organization', verbose_name='องค์กร')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='ผู้ใช้')),
+            ],
+            options={
+                'verbose_name': 'ตัวนับรายการยืมต่อผู้ใช้',
+                'verbose_name_plural': 'ตัวนับรายการยืมต่อผู้ใช้',
+                'constraints': [models.UniqueConstraint(fields=('user', 'organization', 'category_key'), name='unique_loan_counter')],
+            },
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
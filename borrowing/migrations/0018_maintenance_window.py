@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:26
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('borrowing', '0017_loan_quotas'),
+        ('users', '0008_notification_retention'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MaintenanceWindow',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start_at', models.DateTimeField(verbose_name='เริ่ม')),
+                ('end_at', models.DateTimeField(verbose_name='สิ้นสุด')),
+                ('reason', models.CharField(blank=True, max_length=255, verbose_name='รายละเอียด')),
+                ('status', models.CharField(choices=[('scheduled', 'กำหนดไว้'), ('active', 'กำลังบำรุงรักษา'), ('done', 'เสร็จแล้ว'), ('cancelled', 'ยกเลิก')], default='scheduled', max_length=20, verbose_name='สถานะ')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='วันที่สร้าง')),
+                ('asset', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='maintenance_windows', to='borrowing.asset', verbose_name='อุปกรณ์')),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='ผู้กำหนด')),
+                ('organization', models.ForeignKey(editable=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='users.organization', verbose_name='องค์กร')),
+            ],
+            options={
+                'verbose_name': 'ช่วงบำรุงรักษา',
+                'verbose_name_plural': 'ช่วงบำรุงรักษา',
+                'ordering': ['start_at'],
+                'indexes': [models.Index(fields=['asset', 'status', 'start_at', 'end_at'], name='borrowing_m_asset_i_258498_idx'), models.Index(fields=['status', 'start_at'], name='borrowing_m_status_070aa8_idx'), models.Index(fields=['status', 'end_at'], name='borrowing_m_status_7aaa74_idx')],
+            },
+        ),
+    ]
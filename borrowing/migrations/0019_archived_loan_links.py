@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:42
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('borrowing', '0018_maintenance_window'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='archivedloan',
+            name='bundle',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='borrowing.loanbundle', verbose_name='ชุดคำขอ'),
+        ),
+        migrations.AddField(
+            model_name='archivedloan',
+            name='recurrence',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='borrowing.recurringreservation', verbose_name='การจองซ้ำ'),
+        ),
+        migrations.AddField(
+            model_name='archivedloan',
+            name='reminder_stage',
+            field=models.PositiveSmallIntegerField(default=0, verbose_name='ขั้นการเตือนที่ส่งแล้ว'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('borrowing', '0019_archived_loan_links'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='waitlistentry',
+            name='end_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='สิ้นสุด (เวลา)'),
+        ),
+        migrations.AddField(
+            model_name='waitlistentry',
+            name='start_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='เริ่มใช้ (เวลา)'),
+        ),
+    ]
@@ -1,11 +1,39 @@
 # borrowing/models.py
 from django.db import models
 from django.db.models import Q
+from django.utils import timezone
+from datetime import datetime, time, timedelta
 from django.utils.text import slugify
 from django.core.exceptions import ValidationError
 from users.models import Organization, CustomUser
 from uuid import uuid4
 
+def _bump_version(instance, save_kwargs):
+    """ทุกการ save แถวเดิมต้องขยับ version ให้ transition ที่อ่านค่าเก่าไปรู้ตัวแล้วลองใหม่"""
+    instance.version = (instance.version or 0) + 1
+    update_fields = save_kwargs.get('update_fields')
+    if update_fields is not None and 'version' not in update_fields:
+        save_kwargs['update_fields'] = [*update_fields, 'version']
+
+
+def day_range(start_date, due_date):
+    """ช่วงวัน (รวมวันสุดท้าย) -> ช่วงเวลาแบบครึ่งเปิด [00:00 ของวันเริ่ม, 00:00 ของวันถัดจากวันคืน)"""
+    tz = timezone.get_current_timezone()
+    return (
+        timezone.make_aware(datetime.combine(start_date, time.min), tz),
+        timezone.make_aware(datetime.combine(due_date + timedelta(days=1), time.min), tz),
+    )
+
+
+class OrgScopedQuerySet(models.QuerySet):
+    """
+    กรองตามองค์กรด้วยคอลัมน์ organization ของตารางตัวเอง (ไม่ต้อง join Loan→Asset→Item)
+    ใช้: Loan.objects.for_org(org).filter(status='pending')
+    """
+    def for_org(self, org):
+        return self.filter(organization=org)
+
+
 class ItemCategory(models.Model):
     name = models.CharField(max_length=255)
     slug = models.SlugField(unique=True, blank=True)
@@ -51,6 +79,8 @@ class Item(models.Model):
     )
     added_at = models.DateTimeField(auto_now_add=True, verbose_name="วันที่เพิ่ม")
 
+    objects = OrgScopedQuerySet.as_manager()
+
     class Meta:
         verbose_name = "ประเภทสิ่งของ"
         verbose_name_plural = "ประเภทสิ่งของ"
@@ -64,11 +94,36 @@ class Item(models.Model):
     def __str__(self):
         return f"{self.name} ({self.organization.name})"
 
+    def save(self, *args, **kwargs):
+        old_org_id = None
+        if self.pk:
+            old_org_id = Item.objects.filter(pk=self.pk).values_list('organization_id', flat=True).first()
+        super().save(*args, **kwargs)
+        from .catalog import bump_org
+        bump_org(self.organization_id)
+        # ย้ายองค์กร -> ย้ายคีย์ที่ denormalize ไว้ใน Asset/Loan ตามไปด้วย
+        if old_org_id and old_org_id != self.organization_id:
+            Asset.objects.filter(item_id=self.pk).update(organization_id=self.organization_id)
+            Loan.objects.filter(asset__item_id=self.pk).update(organization_id=self.organization_id)
+            bump_org(old_org_id)
+
+    def delete(self, *args, **kwargs):
+        from .catalog import bump_org
+        org_id = self.organization_id
+        result = super().delete(*args, **kwargs)
+        bump_org(org_id)
+        return result
+
 class Asset(models.Model):
     item = models.ForeignKey(
         Item, on_delete=models.CASCADE, related_name='assets',
         verbose_name="ประเภทสิ่งของ", db_index=True
     )
+    # ซ้ำกับ item.organization โดยตั้งใจ (ตั้งค่าให้อัตโนมัติตอน save) เพื่อกรององค์กรได้ในตารางเดียว
+    organization = models.ForeignKey(
+        Organization, on_delete=models.CASCADE, related_name='assets',
+        editable=False, verbose_name="องค์กร"
+    )
     serial_number = models.CharField(max_length=255, blank=True, null=True, unique=True, verbose_name="หมายเลขซีเรียล")
     device_id = models.CharField(max_length=255, blank=True, null=True, unique=True, verbose_name="ID อุปกรณ์")
     location = models.CharField(max_length=255, blank=True, null=True, verbose_name="ตำแหน่ง")
@@ -81,10 +136,17 @@ class Asset(models.Model):
         ('retired', 'ปลดระวาง'),
     ]
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='available', verbose_name="สถานะ", db_index=True)
+    # เวอร์ชันสำหรับ optimistic concurrency (UPDATE ... WHERE version=?) ดู borrowing/services.py
+    version = models.PositiveIntegerField(default=0, editable=False, verbose_name="เวอร์ชัน")
+
+    objects = OrgScopedQuerySet.as_manager()
 
     class Meta:
         verbose_name = "อุปกรณ์"
         verbose_name_plural = "อุปกรณ์"
+        indexes = [
+            models.Index(fields=['organization', 'status']),
+        ]
         constraints = [
             models.CheckConstraint(
                 check=Q(serial_number__isnull=False) | Q(device_id__isnull=False),
@@ -107,19 +169,26 @@ class Asset(models.Model):
             self.serial_number = None
         if self.device_id == '':
             self.device_id = None
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or 'item' in update_fields:
+            self.organization_id = self.item.organization_id
 
         old_item_id, old_status = None, None
         if self.pk:
             old = Asset.objects.only('item_id', 'status').get(pk=self.pk)
             old_item_id, old_status = old.item_id, old.status
+            _bump_version(self, kwargs)
 
         super().save(*args, **kwargs)
 
         affected_item_ids = {self.item_id}
         if old_item_id and old_item_id != self.item_id:
             affected_item_ids.add(old_item_id)
+            Loan.objects.filter(asset_id=self.pk).update(organization_id=self.organization_id)
         if old_status != self.status or len(affected_item_ids) > 1:
+            from .availability import bump_item
             for iid in affected_item_ids:
+                bump_item(iid)
                 total = Asset.objects.filter(item_id=iid).count()
                 available = Asset.objects.filter(item_id=iid, status='available').count()
                 Item.objects.filter(pk=iid).update(
@@ -128,8 +197,10 @@ class Asset(models.Model):
                 )
 
     def delete(self, *args, **kwargs):
+        from .availability import bump_item
         item_id = self.item_id
         super().delete(*args, **kwargs)
+        bump_item(item_id)
         total = Asset.objects.filter(item_id=item_id).count()
         available = Asset.objects.filter(item_id=item_id, status='available').count()
         Item.objects.filter(pk=item_id).update(
@@ -140,10 +211,19 @@ class Asset(models.Model):
 class Loan(models.Model):
     asset = models.ForeignKey('borrowing.Asset', on_delete=models.CASCADE, verbose_name="อุปกรณ์", related_name='loans', db_index=True)
     borrower = models.ForeignKey('users.CustomUser', on_delete=models.CASCADE, verbose_name="ผู้ยืม", related_name='loans', db_index=True)
+    # ซ้ำกับ asset.item.organization (ตั้งให้อัตโนมัติตอน save) ตัด join 2 ชั้นในทุกลิสต์/การนับของแอดมิน
+    organization = models.ForeignKey(
+        Organization, on_delete=models.CASCADE, related_name='loans',
+        editable=False, verbose_name="องค์กร"
+    )
 
     borrow_date = models.DateTimeField(auto_now_add=True, verbose_name="วันที่ส่งคำขอ")
     start_date = models.DateField(null=True, blank=True, verbose_name="วันที่เริ่มใช้ (จอง)")
     due_date = models.DateField(null=True, blank=True, verbose_name="กำหนดคืน")
+    # ช่วงเวลาจริงแบบครึ่งเปิด [start_at, end_at) ใช้ตรวจทับช่วง; จองทั้งวันคือ 00:00 ถึง 00:00 ของวันถัดไป
+    # จองรายชั่วโมงตั้งสองช่องนี้เอง แล้ว start_date/due_date เป็นวันของช่วงนั้น (ดู save())
+    start_at = models.DateTimeField(null=True, blank=True, verbose_name="เริ่มใช้ (เวลา)")
+    end_at = models.DateTimeField(null=True, blank=True, verbose_name="สิ้นสุด (เวลา)")
 
     approved_at = models.DateTimeField(null=True, blank=True, verbose_name="วันที่อนุมัติ")
     pickup_date = models.DateTimeField(null=True, blank=True, verbose_name="วันที่รับของจริง")
@@ -158,17 +238,39 @@ class Loan(models.Model):
     ]
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending', verbose_name="สถานะ", db_index=True)
     reason = models.TextField(blank=True, verbose_name="เหตุผลการยืม")
+    version = models.PositiveIntegerField(default=0, editable=False, verbose_name="เวอร์ชัน")
+    # watermark ของการเตือนกำหนดคืน (ดู borrowing/reminders.py): ส่งแล้วถึงขั้นไหน ไม่ส่งซ้ำเมื่อรันใหม่
+    REMINDER_NONE, REMINDER_DUE_SOON, REMINDER_DUE_TODAY, REMINDER_OVERDUE = 0, 1, 2, 3
+    reminder_stage = models.PositiveSmallIntegerField(default=0, editable=False, verbose_name="ขั้นการเตือนที่ส่งแล้ว")
+    # ครั้งหนึ่งของการจองซ้ำ (สร้างเป็นชุดตอนอนุมัติกฎ)
+    recurrence = models.ForeignKey(
+        'borrowing.RecurringReservation', on_delete=models.SET_NULL, null=True, blank=True,
+        related_name='loans', editable=False, verbose_name="การจองซ้ำ"
+    )
+    # ยืมเป็นชุดจากตะกร้า (หลายอุปกรณ์ในคำขอเดียว)
+    bundle = models.ForeignKey(
+        'borrowing.LoanBundle', on_delete=models.SET_NULL, null=True, blank=True,
+        related_name='loans', editable=False, verbose_name="ชุดคำขอ"
+    )
+
+    objects = OrgScopedQuerySet.as_manager()
 
     class Meta:
         verbose_name = "รายการยืม"
         verbose_name_plural = "รายการยืม"
         ordering = ['-borrow_date']
+        # status/borrower มี index จาก db_index/FK อยู่แล้ว ไม่ต้องประกาศซ้ำ
+        # ตรวจ index กับ workload จริงได้ด้วย `python manage.py index_advisor`
         indexes = [
-            models.Index(fields=['asset', 'status']),
-            models.Index(fields=['asset', 'start_date', 'due_date']),
-            # เสริมให้ค้นไวขึ้นในแดชบอร์ด/ลิสต์
-            models.Index(fields=['status']),
-            models.Index(fields=['borrower']),
+            # ลิสต์/การนับฝั่งแอดมินองค์กร: WHERE organization=? AND status=? ORDER BY ...
+            models.Index(fields=['organization', 'status', 'borrow_date']),
+            models.Index(fields=['organization', 'status', 'due_date']),
+            # รายงาน/ประวัติตามช่วงเวลา: WHERE organization=? AND borrow_date >= ? AND borrow_date < ?
+            models.Index(fields=['organization', 'borrow_date']),
+            # เช็กทับช่วง: WHERE asset=? AND status IN (...) AND start_at < ? AND end_at > ?
+            models.Index(fields=['asset', 'status', 'start_at', 'end_at']),
+            # งานเตือนกำหนดคืน: WHERE status IN (...) AND due_date <= ?
+            models.Index(fields=['status', 'due_date']),
             models.Index(fields=['due_date']),
         ]
 
@@ -178,6 +280,57 @@ class Loan(models.Model):
             rng = f" [{self.start_date} → {self.due_date}]"
         return f"Loan #{self.pk} {self.asset} by {self.borrower}{rng}"
 
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or 'asset' in update_fields:
+            self.organization_id = self.asset.organization_id
+        if update_fields is None:
+            self.sync_range()
+        # แก้ช่วง/สถานะนอก services (เช่นหน้าแอดมิน) ไม่มี LoanEvent ให้ intervals ตาม และไม่ได้ bump ปฏิทินรายวัน
+        # -> ล้างต้นไม้ที่แคชไว้และขยับ stamp ของ item ทั้งฝั่งเดิมและฝั่งใหม่
+        tracked = update_fields is None or not {'asset', 'start_at', 'end_at', 'status'}.isdisjoint(update_fields)
+        old = None
+        if tracked and self.pk:
+            old = Loan.objects.filter(pk=self.pk).values_list(
+                'asset_id', 'start_at', 'end_at', 'status', 'asset__item_id'
+            ).first()
+        if self.pk:
+            _bump_version(self, kwargs)
+        super().save(*args, **kwargs)
+        if tracked and (old and old[:4]) != (self.asset_id, self.start_at, self.end_at, self.status):
+            from .availability import bump_item
+            from .intervals import invalidate
+            for asset_id in {self.asset_id, old and old[0]} - {None}:
+                invalidate(asset_id)
+            for item_id in {self.asset.item_id, old and old[4]} - {None}:
+                bump_item(item_id)
+
+    is_archived = False
+
+    def sync_range(self):
+        """
+        ให้ start_at/end_at กับ start_date/due_date ตรงกัน
+        - มีแต่เวลา (จองรายชั่วโมง) -> คำนวณวันจากเวลา
+        - วันที่ไม่ตรงกับเวลาเดิม (ถูกแก้วันที่ เช่นในหน้าแอดมิน) -> ใช้วันที่ เป็นการจองทั้งวัน
+        """
+        if self.start_at and self.end_at:
+            local_start = timezone.localtime(self.start_at)
+            # end_at เป็นขอบเปิด: 00:00 พอดีแปลว่าใช้ถึงสิ้นวันก่อนหน้า
+            local_last = timezone.localtime(self.end_at) - timedelta(microseconds=1)
+            if self.start_date is None and self.due_date is None:
+                self.start_date, self.due_date = local_start.date(), local_last.date()
+            if (self.start_date, self.due_date) == (local_start.date(), local_last.date()):
+                return
+        if self.start_date and self.due_date:
+            self.start_at, self.end_at = day_range(self.start_date, self.due_date)
+
+    @property
+    def is_hourly(self):
+        return bool(self.start_at and self.end_at and (
+            timezone.localtime(self.start_at).time() != time.min
+            or timezone.localtime(self.end_at).time() != time.min
+        ))
+
     @property
     def is_active(self):
         # กำลังยืมอยู่ (รวมกรณีเกินกำหนด)
@@ -199,14 +352,12 @@ class Loan(models.Model):
                 errors['due_date'] = ValidationError("สถานะนี้ต้องระบุกำหนดคืน")
 
         # กันจอง/อนุมัติทับช่วง (บล็อก pending และ approved ที่คาบเกี่ยวช่วง)
-        if self.start_date and self.due_date and self.asset_id:
-            overlapping_qs = Loan.objects.filter(
-                asset_id=self.asset_id,
-                status__in=['pending', 'approved']
-            ).exclude(pk=self.pk).filter(
-                Q(start_date__lte=self.due_date) & Q(due_date__gte=self.start_date)
-            )
-            if overlapping_qs.exists():
+        # เทียบด้วยช่วงเวลาจริง [start_at, end_at) เหมือน services: จองรายชั่วโมงต่อกันในวันเดียวกันได้
+        self.sync_range()
+        if self.start_at and self.end_at and self.asset_id:
+            from .services import _overlapping
+            if _overlapping(self.asset_id, self.start_at, self.end_at, ('pending', 'approved'),
+                            exclude_pk=self.pk).exists():
                 errors['start_date'] = ValidationError("ช่วงเวลานี้ทับกับการจอง/อนุมัติเดิมของอุปกรณ์ชิ้นนี้")
                 errors['due_date'] = ValidationError("กรุณาเลือกช่วงอื่นที่ไม่ทับซ้อน")
 
@@ -220,4 +371,499 @@ class Loan(models.Model):
                 errors['asset'] = ValidationError("อุปกรณ์นี้ยังไม่ถูกคืน (สถานะเกินกำหนด) กรุณาจัดการรายการที่ค้างก่อน")
 
         if errors:
-            raise ValidationError(errors)
\ No newline at end of file
+            raise ValidationError(errors)
+
+class LoanEvent(models.Model):
+    """
+    เหตุการณ์ของคำขอยืม (append-only) 1 แถวต่อ 1 transition
+    - loan/asset/borrower ไม่ผูก constraint ในฐานข้อมูล เพื่อให้ประวัติอยู่ต่อได้แม้แถวต้นทางถูกลบ/ย้าย
+    - เก็บ asset/borrower/organization ซ้ำไว้ในแถว ให้ projection ไม่ต้อง join กลับไปที่ Loan
+    - read model ทั้งหมดใน borrowing/projections.py สร้างใหม่ได้จากตารางนี้
+    """
+    KIND_CHOICES = [
+        ('requested', 'ส่งคำขอ'),
+        ('approved', 'อนุมัติ'),
+        ('picked_up', 'รับของ'),
+        ('returned', 'คืนของ'),
+        ('rejected', 'ปฏิเสธ'),
+        ('overdue', 'เกินกำหนด'),
+    ]
+    loan = models.ForeignKey(
+        Loan, on_delete=models.DO_NOTHING, db_constraint=False,
+        related_name='events', verbose_name="รายการยืม"
+    )
+    asset = models.ForeignKey(
+        Asset, on_delete=models.DO_NOTHING, db_constraint=False, null=True,
+        related_name='+', verbose_name="อุปกรณ์"
+    )
+    borrower = models.ForeignKey(
+        'users.CustomUser', on_delete=models.DO_NOTHING, db_constraint=False, null=True,
+        related_name='+', verbose_name="ผู้ยืม"
+    )
+    organization = models.ForeignKey(
+        Organization, on_delete=models.DO_NOTHING, db_constraint=False, null=True,
+        related_name='+', verbose_name="องค์กร"
+    )
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES, verbose_name="เหตุการณ์")
+    from_status = models.CharField(max_length=20, blank=True, verbose_name="สถานะเดิม")
+    to_status = models.CharField(max_length=20, verbose_name="สถานะใหม่")
+    actor = models.ForeignKey(
+        'users.CustomUser', on_delete=models.SET_NULL, null=True, blank=True,
+        related_name='+', verbose_name="ผู้ดำเนินการ"
+    )
+    payload = models.JSONField(default=dict, blank=True, verbose_name="ข้อมูลเพิ่มเติม")
+    created_at = models.DateTimeField(default=timezone.now, verbose_name="เวลา")
+
+    class Meta:
+        verbose_name = "เหตุการณ์รายการยืม"
+        verbose_name_plural = "เหตุการณ์รายการยืม"
+        ordering = ['id']
+        indexes = [
+            # ตามเหตุการณ์ใหม่ของอุปกรณ์หนึ่งชิ้น (borrowing/intervals.py): WHERE asset=? AND id > ?
+            models.Index(fields=['asset', 'id']),
+        ]
+
+    def __str__(self):
+        return f"Loan #{self.loan_id} {self.kind} ({self.from_status or '-'} → {self.to_status})"
+
+    def save(self, *args, **kwargs):
+        if self.pk:
+            raise ValueError("LoanEvent เป็น append-only แก้ไขแถวเดิมไม่ได้")
+        super().save(*args, **kwargs)
+
+
+class ArchivedLoan(models.Model):
+    """
+    รายการยืมที่ปิดแล้ว (คืน/ปฏิเสธ) และเก่ากว่า LOAN_ARCHIVE_AFTER_DAYS ย้ายมาจาก Loan (borrowing/archive.py)
+    - รูปร่างเดียวกับ Loan และใช้ id เดิม (LoanEvent ยังอ้างถึงได้) เพิ่มคอลัมน์ใน Loan ต้องเพิ่มที่นี่และใน archive.HISTORY_FIELDS ด้วย
+    - FK ไม่ผูก constraint เหมือน LoanEvent: ลบอุปกรณ์/ผู้ใช้ภายหลังแล้วประวัติยังอยู่
+    """
+    id = models.BigIntegerField(primary_key=True)
+    asset = models.ForeignKey(
+        Asset, on_delete=models.DO_NOTHING, db_constraint=False,
+        related_name='+', verbose_name="อุปกรณ์"
+    )
+    borrower = models.ForeignKey(
+        'users.CustomUser', on_delete=models.DO_NOTHING, db_constraint=False,
+        related_name='+', verbose_name="ผู้ยืม"
+    )
+    organization = models.ForeignKey(
+        Organization, on_delete=models.DO_NOTHING, db_constraint=False,
+        related_name='+', verbose_name="องค์กร"
+    )
+    borrow_date = models.DateTimeField(verbose_name="วันที่ส่งคำขอ")
+    start_date = models.DateField(null=True, blank=True, verbose_name="วันที่เริ่มใช้ (จอง)")
+    due_date = models.DateField(null=True, blank=True, verbose_name="กำหนดคืน")
+    start_at = models.DateTimeField(null=True, blank=True, verbose_name="เริ่มใช้ (เวลา)")
+    end_at = models.DateTimeField(null=True, blank=True, verbose_name="สิ้นสุด (เวลา)")
+    approved_at = models.DateTimeField(null=True, blank=True, verbose_name="วันที่อนุมัติ")
+    pickup_date = models.DateTimeField(null=True, blank=True, verbose_name="วันที่รับของจริง")
+    return_date = models.DateTimeField(null=True, blank=True, verbose_name="วันที่คืน")
+    status = models.CharField(max_length=20, choices=Loan.STATUS_CHOICES, verbose_name="สถานะ")
+    reason = models.TextField(blank=True, verbose_name="เหตุผลการยืม")
+    reminder_stage = models.PositiveSmallIntegerField(default=0, verbose_name="ขั้นการเตือนที่ส่งแล้ว")
+    recurrence = models.ForeignKey(
+        'borrowing.RecurringReservation', on_delete=models.DO_NOTHING, db_constraint=False, null=True, blank=True,
+        related_name='+', verbose_name="การจองซ้ำ"
+    )
+    bundle = models.ForeignKey(
+        'borrowing.LoanBundle', on_delete=models.DO_NOTHING, db_constraint=False, null=True, blank=True,
+        related_name='+', verbose_name="ชุดคำขอ"
+    )
+    archived_at = models.DateTimeField(auto_now_add=True, verbose_name="วันที่ย้ายเข้าคลัง")
+
+    class Meta:
+        verbose_name = "คลังรายการยืม"
+        verbose_name_plural = "คลังรายการยืม"
+        ordering = ['-borrow_date']
+        indexes = [
+            models.Index(fields=['organization', 'borrow_date']),
+            models.Index(fields=['borrower', 'borrow_date']),
+        ]
+
+    def __str__(self):
+        return f"ArchivedLoan #{self.pk} ({self.status})"
+
+    # ให้ template เดียวกับ Loan ใช้ได้
+    is_archived = True
+
+    @property
+    def is_active(self):
+        return False
+
+
+class WaitlistEntry(models.Model):
+    """
+    คิวรอยืมต่อประเภทสิ่งของ (Item) เมื่อช่วงวันที่ที่ต้องการถูกจองหมด
+    เมื่อมีรายการคืน/ถูกปฏิเสธ services จะเลื่อนหัวคิวที่ลงช่วงว่างได้เป็นคำขอยืม (pending)
+    ใน transaction เดียวกับการคืน/ปฏิเสธ เรียงคิวด้วย priority มากก่อน แล้วมาก่อนได้ก่อน
+    """
+    STATUS_CHOICES = [
+        ('waiting', 'รอคิว'),
+        ('promoted', 'ได้คิวแล้ว'),
+        ('cancelled', 'ยกเลิก'),
+        ('expired', 'หมดอายุ'),
+    ]
+    item = models.ForeignKey(Item, on_delete=models.CASCADE, related_name='waitlist', verbose_name="ประเภทสิ่งของ")
+    # ซ้ำกับ item.organization ให้แอดมินกรององค์กรได้ในตารางเดียว (เหมือน Asset/Loan)
+    organization = models.ForeignKey(
+        Organization, on_delete=models.CASCADE, related_name='+', editable=False, verbose_name="องค์กร"
+    )
+    user = models.ForeignKey(
+        'users.CustomUser', on_delete=models.CASCADE, related_name='waitlist_entries', verbose_name="ผู้ขอ"
+    )
+    start_date = models.DateField(verbose_name="วันที่เริ่มใช้")
+    due_date = models.DateField(verbose_name="กำหนดคืน")
+    # เข้าคิวจากคำขอรายชั่วโมง: เก็บช่วงเวลาจริงไว้ให้คำขอที่เลื่อนได้ช่วงเดิม (ว่าง = ทั้งวันตาม start_date/due_date)
+    start_at = models.DateTimeField(null=True, blank=True, verbose_name="เริ่มใช้ (เวลา)")
+    end_at = models.DateTimeField(null=True, blank=True, verbose_name="สิ้นสุด (เวลา)")
+    reason = models.TextField(blank=True, verbose_name="เหตุผลการยืม")
+    priority = models.SmallIntegerField(default=0, verbose_name="ลำดับความสำคัญ")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='waiting', verbose_name="สถานะ")
+    loan = models.OneToOneField(
+        Loan, on_delete=models.SET_NULL, null=True, blank=True, related_name='waitlist_entry', verbose_name="คำขอยืมที่ได้"
+    )
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="วันที่เข้าคิว")
+    promoted_at = models.DateTimeField(null=True, blank=True, verbose_name="วันที่ได้คิว")
+
+    objects = OrgScopedQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = "คิวรอยืม"
+        verbose_name_plural = "คิวรอยืม"
+        ordering = ['-priority', 'created_at']
+        indexes = [
+            # หัวคิว: WHERE item=? AND status='waiting' ORDER BY priority DESC, created_at
+            models.Index(fields=['item', 'status', '-priority', 'created_at'], name='waitlist_head_idx'),
+            models.Index(fields=['user', 'status']),
+        ]
+
+    def __str__(self):
+        return f"{self.item.name} [{self.start_date} → {self.due_date}] by {self.user}"
+
+    def time_range(self):
+        """ช่วงเวลาครึ่งเปิดที่ต้องการ: เวลาที่ขอไว้ หรือทั้งวันของ start_date..due_date"""
+        if self.start_at and self.end_at:
+            return self.start_at, self.end_at
+        return day_range(self.start_date, self.due_date)
+
+    def save(self, *args, **kwargs):
+        self.organization_id = self.item.organization_id
+        super().save(*args, **kwargs)
+
+
+class RecurringReservation(models.Model):
+    """
+    กฎการจองซ้ำ (คล้าย RRULE: ทุก N วัน/สัปดาห์ ในวันที่เลือก ตั้งแต่ dtstart ถึง until)
+    เก็บเป็นแถวเดียว ขยายเป็นรายครั้งเฉพาะช่วงที่ถามใน borrowing/recurrence.py
+    เมื่ออนุมัติจึงสร้าง Loan (approved) ของทุกครั้งพร้อมกันในคำสั่งเดียว
+    """
+    FREQ_CHOICES = [
+        ('daily', 'ทุกวัน'),
+        ('weekly', 'ทุกสัปดาห์'),
+    ]
+    STATUS_CHOICES = [
+        ('pending', 'รอดำเนินการ'),
+        ('approved', 'อนุมัติแล้ว'),
+        ('rejected', 'ถูกปฏิเสธ'),
+        ('cancelled', 'ยกเลิก'),
+    ]
+    asset = models.ForeignKey(Asset, on_delete=models.CASCADE, related_name='recurring_reservations', verbose_name="อุปกรณ์")
+    organization = models.ForeignKey(
+        Organization, on_delete=models.CASCADE, related_name='+', editable=False, verbose_name="องค์กร"
+    )
+    borrower = models.ForeignKey(
+        'users.CustomUser', on_delete=models.CASCADE, related_name='recurring_reservations', verbose_name="ผู้ยืม"
+    )
+    reason = models.TextField(blank=True, verbose_name="เหตุผลการยืม")
+    freq = models.CharField(max_length=10, choices=FREQ_CHOICES, default='weekly', verbose_name="ความถี่")
+    interval = models.PositiveSmallIntegerField(default=1, verbose_name="ทุก ๆ (รอบ)")
+    # วันในสัปดาห์ที่จอง (0=จันทร์ ... 6=อาทิตย์) คั่นด้วยจุลภาค ใช้กับ freq=weekly
+    byweekday = models.CharField(max_length=20, blank=True, verbose_name="วันในสัปดาห์")
+    dtstart = models.DateField(verbose_name="เริ่ม")
+    until = models.DateField(verbose_name="สิ้นสุด")
+    # ว่างทั้งคู่ = จองทั้งวัน
+    start_time = models.TimeField(null=True, blank=True, verbose_name="เวลาเริ่ม")
+    end_time = models.TimeField(null=True, blank=True, verbose_name="เวลาสิ้นสุด")
+    # วันที่ข้าม (เช่น วันหยุด หรือวันที่ชนตอนอนุมัติ) เป็น list ของ 'YYYY-MM-DD'
+    exdates = models.JSONField(default=list, blank=True, verbose_name="วันที่ข้าม")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending', verbose_name="สถานะ")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="วันที่ส่งคำขอ")
+    approved_at = models.DateTimeField(null=True, blank=True, verbose_name="วันที่อนุมัติ")
+
+    objects = OrgScopedQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = "การจองซ้ำ"
+        verbose_name_plural = "การจองซ้ำ"
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['organization', 'status', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.asset} {self.get_freq_display()} {self.dtstart} → {self.until} by {self.borrower}"
+
+    def save(self, *args, **kwargs):
+        self.organization_id = self.asset.organization_id
+        super().save(*args, **kwargs)
+
+    @property
+    def weekdays(self):
+        return sorted({int(d) for d in self.byweekday.split(',') if d.strip()})
+
+
+class LoanBundle(models.Model):
+    """คำขอยืมหลายอุปกรณ์พร้อมกัน (checkout จากตะกร้า) ทุกชิ้นถูกจองในช่วงเดียวกันหรือไม่จองเลย"""
+    borrower = models.ForeignKey(
+        'users.CustomUser', on_delete=models.CASCADE, related_name='loan_bundles', verbose_name="ผู้ยืม"
+    )
+    reason = models.TextField(blank=True, verbose_name="เหตุผลการยืม")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="วันที่ส่งคำขอ")
+
+    class Meta:
+        verbose_name = "ชุดคำขอยืม"
+        verbose_name_plural = "ชุดคำขอยืม"
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"Bundle #{self.pk} by {self.borrower}"
+
+
+class AutoApprovalRule(models.Model):
+    """
+    กฎอนุมัติอัตโนมัติขององค์กร: คำขอที่เข้าเงื่อนไขทุกข้อ (ช่องว่าง = ไม่จำกัด) อนุมัติได้โดยไม่ต้องรอแอดมิน
+    แปลงเป็นเงื่อนไข queryset และรันเป็นชุดใน borrowing/autoapprove.py
+    """
+    ROLE_CHOICES = [
+        ('any', 'ทุกคน'),
+        ('member', 'สมาชิกขององค์กร'),
+        ('admin', 'แอดมินขององค์กร'),
+        ('external', 'ผู้ใช้นอกองค์กร'),
+    ]
+    organization = models.ForeignKey(
+        Organization, on_delete=models.CASCADE, related_name='auto_approval_rules', verbose_name="องค์กร"
+    )
+    name = models.CharField(max_length=255, verbose_name="ชื่อกฎ")
+    is_active = models.BooleanField(default=True, verbose_name="เปิดใช้งาน")
+    # ลำดับน้อยตรวจก่อน: คำขอหนึ่งใช้โควตาของกฎแรกที่เข้าเงื่อนไข
+    order = models.PositiveSmallIntegerField(default=0, verbose_name="ลำดับ")
+    category = models.ForeignKey(
+        ItemCategory, on_delete=models.CASCADE, null=True, blank=True, related_name='+', verbose_name="หมวดอุปกรณ์"
+    )
+    borrower_role = models.CharField(max_length=10, choices=ROLE_CHOICES, default='any', verbose_name="ผู้ยืม")
+    max_duration_hours = models.PositiveIntegerField(null=True, blank=True, verbose_name="ระยะเวลายืมสูงสุด (ชั่วโมง)")
+    max_active_per_user = models.PositiveSmallIntegerField(
+        null=True, blank=True, verbose_name="ยืมพร้อมกันได้สูงสุด (รายการ/คน)"
+    )
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="วันที่สร้าง")
+
+    objects = OrgScopedQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = "กฎอนุมัติอัตโนมัติ"
+        verbose_name_plural = "กฎอนุมัติอัตโนมัติ"
+        ordering = ['organization', 'order', 'id']
+
+    def __str__(self):
+        return f"{self.name} ({self.organization})"
+
+
+class QuotaPolicy(models.Model):
+    """
+    โควตายืมพร้อมกันขององค์กร: ผู้ยืมที่ตรงกลุ่มถือรายการ (รอดำเนินการ/อนุมัติแล้ว/เกินกำหนด)
+    ของหมวดนี้ (ว่าง = ทุกหมวด) ในองค์กรนี้ได้ไม่เกิน max_loans รายการ ตรวจกับ UserLoanCounter
+    การจองซ้ำหนึ่งชุด (RecurringReservation) นับเป็น 1 รายการจนกว่าครั้งสุดท้ายของชุดจะคืน/ถูกปฏิเสธ
+    """
+    organization = models.ForeignKey(
+        Organization, on_delete=models.CASCADE, related_name='quota_policies', verbose_name="องค์กร"
+    )
+    category = models.ForeignKey(
+        ItemCategory, on_delete=models.CASCADE, null=True, blank=True, related_name='+', verbose_name="หมวดอุปกรณ์"
+    )
+    borrower_role = models.CharField(
+        max_length=10, choices=AutoApprovalRule.ROLE_CHOICES, default='any', verbose_name="ผู้ยืม"
+    )
+    max_loans = models.PositiveSmallIntegerField(verbose_name="ยืมพร้อมกันได้สูงสุด (รายการ)")
+    is_active = models.BooleanField(default=True, verbose_name="เปิดใช้งาน")
+
+    objects = OrgScopedQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = "โควตาการยืม"
+        verbose_name_plural = "โควตาการยืม"
+        ordering = ['organization', 'max_loans']
+
+    def __str__(self):
+        scope = self.category or "ทุกหมวด"
+        return f"{scope} / {self.get_borrower_role_display()} ≤ {self.max_loans}"
+
+
+class UserLoanCounter(models.Model):
+    """
+    จำนวนรายการที่ยังกันช่วงอยู่ (pending/approved/overdue) ต่อ ผู้ใช้ × องค์กร × หมวด
+    อัปเดตแบบ delta ใน services ทุกครั้งที่สถานะเข้า/ออกกลุ่มนี้ ตรวจโควตาโดยไม่ต้อง COUNT ตาราง Loan
+    แก้ให้ตรงกับ Loan ได้ด้วย `python manage.py reconcile_loan_counters`
+    """
+    user = models.ForeignKey('users.CustomUser', on_delete=models.CASCADE, related_name='+', verbose_name="ผู้ใช้")
+    organization = models.ForeignKey(Organization, on_delete=models.CASCADE, related_name='+', verbose_name="องค์กร")
+    # id ของหมวด (0 = ไม่มีหมวด) ไม่ใช้ FK ที่เป็น NULL ได้ เพื่อให้ unique ครอบคลุมแถวที่ไม่มีหมวดด้วย
+    category_key = models.PositiveIntegerField(default=0, verbose_name="หมวด")
+    active = models.IntegerField(default=0, verbose_name="รายการที่ถืออยู่")
+
+    class Meta:
+        verbose_name = "ตัวนับรายการยืมต่อผู้ใช้"
+        verbose_name_plural = "ตัวนับรายการยืมต่อผู้ใช้"
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'organization', 'category_key'], name='unique_loan_counter'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id}@{self.organization_id}/{self.category_key}: {self.active}"
+
+
+class MaintenanceWindow(models.Model):
+    """
+    ช่วงบำรุงรักษาที่กำหนดล่วงหน้าของอุปกรณ์ [start_at, end_at) กันช่วงเหมือนการจอง
+    งานเบื้องหลัง (services.sweep_maintenance) เปลี่ยนสถานะอุปกรณ์เป็น/ออกจาก maintenance ตามเวลาเป็นชุด
+    """
+    STATUS_CHOICES = [
+        ('scheduled', 'กำหนดไว้'),
+        ('active', 'กำลังบำรุงรักษา'),
+        ('done', 'เสร็จแล้ว'),
+        ('cancelled', 'ยกเลิก'),
+    ]
+    asset = models.ForeignKey(Asset, on_delete=models.CASCADE, related_name='maintenance_windows', verbose_name="อุปกรณ์")
+    # ซ้ำกับ asset.organization ให้แอดมินกรององค์กรได้ในตารางเดียว (เหมือน Loan)
+    organization = models.ForeignKey(
+        Organization, on_delete=models.CASCADE, related_name='+', editable=False, verbose_name="องค์กร"
+    )
+    start_at = models.DateTimeField(verbose_name="เริ่ม")
+    end_at = models.DateTimeField(verbose_name="สิ้นสุด")
+    reason = models.CharField(max_length=255, blank=True, verbose_name="รายละเอียด")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='scheduled', verbose_name="สถานะ")
+    created_by = models.ForeignKey(
+        'users.CustomUser', on_delete=models.SET_NULL, null=True, blank=True, related_name='+', verbose_name="ผู้กำหนด"
+    )
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="วันที่สร้าง")
+
+    objects = OrgScopedQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = "ช่วงบำรุงรักษา"
+        verbose_name_plural = "ช่วงบำรุงรักษา"
+        ordering = ['start_at']
+        indexes = [
+            # เช็กทับช่วง: WHERE asset=? AND status IN (...) AND start_at < ? AND end_at > ?
+            models.Index(fields=['asset', 'status', 'start_at', 'end_at']),
+            # งาน sweep: WHERE status=? AND start_at <= now / end_at <= now
+            models.Index(fields=['status', 'start_at']),
+            models.Index(fields=['status', 'end_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.asset} {self.start_at:%Y-%m-%d %H:%M} → {self.end_at:%Y-%m-%d %H:%M}"
+
+    def save(self, *args, **kwargs):
+        self.organization_id = self.asset.organization_id
+        super().save(*args, **kwargs)
+
+
+# ---------- Read models (สร้างจาก LoanEvent โดย borrowing/projections.py) ----------
+
+class ProjectionCheckpoint(models.Model):
+    """ตำแหน่งล่าสุดใน LoanEvent ที่ projection แต่ละตัวประมวลผลไปแล้ว"""
+    name = models.CharField(max_length=100, unique=True)
+    last_event_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} @ {self.last_event_id}"
+
+
+class OrgLoanStats(models.Model):
+    """จำนวนรายการยืมแยกตามสถานะของแต่ละองค์กร (ใช้ในแดชบอร์ด)"""
+    organization = models.OneToOneField(
+        Organization, on_delete=models.CASCADE, related_name='loan_stats', verbose_name="องค์กร"
+    )
+    pending = models.IntegerField(default=0)
+    approved = models.IntegerField(default=0)
+    overdue = models.IntegerField(default=0)
+    returned = models.IntegerField(default=0)
+    rejected = models.IntegerField(default=0)
+
+    class Meta:
+        verbose_name = "สถิติรายการยืมขององค์กร"
+        verbose_name_plural = "สถิติรายการยืมขององค์กร"
+
+
+class AssetReservationState(models.Model):
+    """สถานะการจองปัจจุบันของอุปกรณ์แต่ละชิ้น"""
+    asset = models.OneToOneField(
+        Asset, on_delete=models.CASCADE, related_name='reservation_state', verbose_name="อุปกรณ์"
+    )
+    open_loans = models.IntegerField(default=0, verbose_name="คำขอ/การจองที่ยังเปิดอยู่")
+    current_loan_id = models.BigIntegerField(null=True, blank=True, verbose_name="รายการที่กำลังยืมอยู่")
+    last_event_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "สถานะการจองอุปกรณ์"
+        verbose_name_plural = "สถานะการจองอุปกรณ์"
+
+
+class DailyLoanRollup(models.Model):
+    """จำนวนเหตุการณ์รายวันต่อองค์กร (ใช้ทำรายงาน)"""
+    organization = models.ForeignKey(
+        Organization, on_delete=models.CASCADE, related_name='+', verbose_name="องค์กร"
+    )
+    day = models.DateField(verbose_name="วันที่")
+    requested = models.IntegerField(default=0)
+    approved = models.IntegerField(default=0)
+    picked_up = models.IntegerField(default=0)
+    returned = models.IntegerField(default=0)
+    rejected = models.IntegerField(default=0)
+    overdue = models.IntegerField(default=0)
+
+    class Meta:
+        verbose_name = "สรุปรายวัน"
+        verbose_name_plural = "สรุปรายวัน"
+        constraints = [
+            models.UniqueConstraint(fields=['organization', 'day'], name='unique_rollup_per_org_day'),
+        ]
+
+
+class Job(models.Model):
+    """งานเบื้องหลัง (คิวในฐานข้อมูล) ให้ worker `run_jobs` หยิบไปทำ"""
+    STATUS_CHOICES = [
+        ('queued', 'รอคิว'),
+        ('running', 'กำลังทำงาน'),
+        ('done', 'สำเร็จ'),
+        ('failed', 'ล้มเหลว'),
+    ]
+    name = models.CharField(max_length=100, verbose_name="ชื่องาน")
+    payload = models.JSONField(default=dict, blank=True, verbose_name="ข้อมูลงาน")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued', verbose_name="สถานะ")
+    run_at = models.DateTimeField(default=timezone.now, verbose_name="เวลาที่ให้เริ่มทำ")
+
+    attempts = models.PositiveIntegerField(default=0, verbose_name="จำนวนครั้งที่ลอง")
+    max_attempts = models.PositiveIntegerField(default=5, verbose_name="ลองได้สูงสุด")
+    # คีย์กันงานซ้ำ: enqueue ด้วยคีย์เดิมจะได้งานเดิมกลับมา ไม่สร้างใหม่
+    idempotency_key = models.CharField(max_length=255, unique=True, null=True, blank=True, verbose_name="คีย์กันซ้ำ")
+
+    locked_by = models.CharField(max_length=100, blank=True, verbose_name="worker ที่ถือ")
+    locked_at = models.DateTimeField(null=True, blank=True, verbose_name="เวลาที่ถูกหยิบ")
+    last_error = models.TextField(blank=True, verbose_name="ข้อผิดพลาดล่าสุด")
+
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="วันที่สร้าง")
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name="วันที่เสร็จ")
+
+    class Meta:
+        verbose_name = "งานเบื้องหลัง"
+        verbose_name_plural = "งานเบื้องหลัง"
+        indexes = [
+            # worker หาเฉพาะงานที่ถึงเวลา: status='queued' AND run_at <= now
+            models.Index(fields=['status', 'run_at']),
+        ]
+
+    def __str__(self):
+        return f"Job #{self.pk} {self.name} [{self.status}]"
@@ -0,0 +1,232 @@
+# borrowing/profiling.py
+"""
+โปรไฟล์ request ตามคำขอ (เปิดทีละ request ไม่กระทบ request อื่น)
+
+เปิดได้สองทาง:
+- superuser เติม ?_profile=1 ท้าย URL
+- ส่ง header X-Profile-Token ที่ลงลายเซ็นแล้ว (สร้างจากหน้า /borrowing/profiles/ อายุ PROFILE_TOKEN_MAX_AGE)
+  token ผูกกับผู้ใช้ที่สร้าง: ใช้ได้เฉพาะ request ที่ล็อกอินเป็นผู้ใช้คนนั้นและยังเป็น superuser อยู่
+
+ระหว่าง request มีเธรดสุ่มเก็บ stack ของเธรดที่รัน view ทุก PROFILE_SAMPLE_INTERVAL_MS (sampling profiler)
+และ execute wrapper เก็บลำดับเวลา SQL; ผลเป็น JSON ใน PROFILE_DIR (stack แบบ collapsed ใช้กับ
+flamegraph.pl / speedscope ได้) ลบไฟล์เก่าตาม PROFILE_MAX_FILES / PROFILE_MAX_AGE_DAYS
+ไฟล์มี 2 บรรทัด: บรรทัดแรกเป็นสรุป (ไม่มี stack/SQL) ให้หน้ารายการอ่านแค่บรรทัดนั้น บรรทัดที่สองเป็นข้อมูลเต็ม
+"""
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+
+from django.conf import settings
+from django.core import signing
+from django.db import connection
+from django.utils import timezone
+
+TOKEN_SALT = 'borrowing.profiling'
+TOKEN_HEADER = 'HTTP_X_PROFILE_TOKEN'
+QUERY_FLAG = '_profile'
+MAX_STACK_DEPTH = 128
+MAX_SQL_ENTRIES = 2000
+HEAVY_KEYS = ('stacks', 'sql')
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def profile_dir():
+    return str(_setting('PROFILE_DIR', settings.BASE_DIR / 'profiles'))
+
+
+def make_token(user):
+    return signing.TimestampSigner(salt=TOKEN_SALT).sign(str(user.pk))
+
+
+def _token_user_pk(value):
+    """pk ของผู้ใช้ที่ลงลายเซ็นไว้ใน token (None ถ้าลายเซ็นผิด/หมดอายุ)"""
+    try:
+        return signing.TimestampSigner(salt=TOKEN_SALT).unsign(
+            value, max_age=_setting('PROFILE_TOKEN_MAX_AGE', 3600)
+        )
+    except signing.BadSignature:
+        return None
+
+
+def wants_profile(request):
+    # ตรวจสิทธิ์ตอนใช้งานทุกครั้ง: token ที่หลุดไปหรือของผู้ใช้ที่ถูกถอดสิทธิ์แล้วใช้ไม่ได้
+    user = request.user
+    if not getattr(user, 'is_superuser', False):
+        return False
+    if request.GET.get(QUERY_FLAG):
+        return True
+    token = request.META.get(TOKEN_HEADER)
+    return bool(token) and _token_user_pk(token) == str(user.pk)
+
+
+# -------------------------------------------------------------------
+# Sampling profiler
+# -------------------------------------------------------------------
+def _frame_label(code):
+    filename = code.co_filename
+    base = str(settings.BASE_DIR)
+    if filename.startswith(base):
+        filename = filename[len(base) + 1:]
+    elif 'site-packages' in filename:
+        filename = filename.split('site-packages' + os.sep, 1)[1]
+    return f"{filename}:{code.co_name}"
+
+
+class Sampler(threading.Thread):
+    """สุ่มเก็บ stack ของเธรดเป้าหมายเป็น collapsed stack ("root;child;leaf" -> จำนวนครั้ง)"""
+
+    def __init__(self, target_thread_id, interval):
+        super().__init__(daemon=True)
+        self.target = target_thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.target)
+            stack = []
+            while frame is not None and len(stack) < MAX_STACK_DEPTH:
+                stack.append(_frame_label(frame.f_code))
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+class SqlTimeline:
+    """execute wrapper: เก็บ (เริ่มที่ ms, ใช้เวลา ms, sql) ของแต่ละ statement"""
+
+    def __init__(self, started):
+        self.started = started
+        self.entries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        begin = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            if len(self.entries) < MAX_SQL_ENTRIES:
+                self.entries.append({
+                    'at_ms': round((begin - self.started) * 1000, 2),
+                    'ms': round((time.perf_counter() - begin) * 1000, 2),
+                    'sql': sql[:2000],
+                })
+
+
+# -------------------------------------------------------------------
+# การเก็บไฟล์
+# -------------------------------------------------------------------
+def _prune(directory):
+    max_files = _setting('PROFILE_MAX_FILES', 200)
+    max_age = _setting('PROFILE_MAX_AGE_DAYS', 7) * 86400
+    now = time.time()
+    files = sorted(
+        (e for e in os.scandir(directory) if e.name.endswith('.json')),
+        key=lambda e: e.stat().st_mtime, reverse=True,
+    )
+    for index, entry in enumerate(files):
+        if index >= max_files or now - entry.stat().st_mtime > max_age:
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+
+
+def save_profile(record):
+    directory = profile_dir()
+    os.makedirs(directory, exist_ok=True)
+    name = f"{timezone.now():%Y%m%d-%H%M%S}-{uuid.uuid4().hex[:8]}"
+    record['id'] = name
+    summary = {k: v for k, v in record.items() if k not in HEAVY_KEYS}
+    tmp = os.path.join(directory, name + '.tmp')
+    with open(tmp, 'w', encoding='utf-8') as fh:
+        fh.write(json.dumps(summary, ensure_ascii=False) + '\n')
+        fh.write(json.dumps(record, ensure_ascii=False) + '\n')
+    os.replace(tmp, os.path.join(directory, name + '.json'))   # ผู้อ่านไม่เห็นไฟล์ครึ่ง ๆ
+    _prune(directory)
+    return name
+
+
+def load_profile(name):
+    if not name.replace('-', '').isalnum():
+        raise FileNotFoundError(name)
+    with open(os.path.join(profile_dir(), name + '.json'), encoding='utf-8') as fh:
+        lines = [line for line in fh if line.strip()]
+    return json.loads(lines[-1])   # ไฟล์รุ่นเก่ามีบรรทัดเดียว
+
+
+def list_profiles():
+    """สรุปของทุกไฟล์ (อ่านเฉพาะบรรทัดแรก ไม่โหลด stack/SQL) เรียงจากใหม่ไปเก่า"""
+    directory = profile_dir()
+    if not os.path.isdir(directory):
+        return []
+    summaries = []
+    for entry in os.scandir(directory):
+        if not entry.name.endswith('.json'):
+            continue
+        try:
+            with open(entry.path, encoding='utf-8') as fh:
+                data = json.loads(fh.readline())
+        except (OSError, ValueError):
+            continue
+        for key in HEAVY_KEYS:
+            data.pop(key, None)
+        summaries.append(data)
+    return sorted(summaries, key=lambda d: d['id'], reverse=True)
+
+
+def collapsed(record):
+    """ข้อความแบบ collapsed stacks (บรรทัดละ "a;b;c count") สำหรับ flamegraph.pl / speedscope"""
+    return '\n'.join(f"{stack} {count}" for stack, count in record['stacks'].items()) + '\n'
+
+
+# -------------------------------------------------------------------
+# Middleware
+# -------------------------------------------------------------------
+class ProfilerMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not wants_profile(request):
+            return self.get_response(request)
+
+        started = time.perf_counter()
+        sampler = Sampler(threading.get_ident(), _setting('PROFILE_SAMPLE_INTERVAL_MS', 5) / 1000)
+        timeline = SqlTimeline(started)
+        sampler.start()
+        try:
+            with connection.execute_wrapper(timeline):
+                response = self.get_response(request)
+        finally:
+            sampler.stop()
+        elapsed_ms = (time.perf_counter() - started) * 1000
+
+        match = getattr(request, 'resolver_match', None)
+        name = save_profile({
+            'view': (match.view_name if match else None) or request.path,
+            'path': request.get_full_path(),
+            'method': request.method,
+            'status': response.status_code,
+            'user': getattr(request.user, 'username', ''),
+            'at': timezone.now().isoformat(),
+            'ms': round(elapsed_ms, 2),
+            'sql_count': len(timeline.entries),
+            'sql_ms': round(sum(e['ms'] for e in timeline.entries), 2),
+            'samples': sum(sampler.stacks.values()),
+            'stacks': dict(sampler.stacks),
+            'sql': timeline.entries,
+        })
+        response['X-Profile-Id'] = name
+        return response
@@ -0,0 +1,177 @@
+# borrowing/projections.py
+"""
+Projection: อ่าน LoanEvent ตามลำดับ id แล้วสร้าง/อัปเดต read model แบบ incremental
+
+- แต่ละ projection จำตำแหน่งล่าสุดไว้ใน ProjectionCheckpoint
+- update_projections() ประมวลผลเฉพาะเหตุการณ์ใหม่ (เรียกจากงานตามรอบใน tasks.py)
+- rebuild_projections() ล้าง read model แล้ว replay ตั้งแต่เหตุการณ์แรก
+  (`python manage.py rebuild_projections`)
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import (
+    Asset, LoanEvent, ProjectionCheckpoint,
+    OrgLoanStats, AssetReservationState, DailyLoanRollup,
+)
+
+BATCH_SIZE = 1000
+
+# สถานะที่นับว่า "ยังเปิดอยู่" ของอุปกรณ์ (กันช่วงเวลา)
+OPEN_STATUSES = ('pending', 'approved', 'overdue')
+
+_registry = {}
+
+
+def projection(cls):
+    _registry[cls.name] = cls()
+    return cls
+
+
+def get_projections(names=None):
+    if not names:
+        return list(_registry.values())
+    unknown = set(names) - set(_registry)
+    if unknown:
+        raise KeyError(f"ไม่รู้จัก projection: {', '.join(sorted(unknown))}")
+    return [_registry[n] for n in names]
+
+
+class Projection:
+    """ฐานของ projection: override apply(events) และ reset()"""
+    name = None
+
+    def apply(self, events):
+        raise NotImplementedError
+
+    def reset(self):
+        raise NotImplementedError
+
+
+def _add_counts(model, key_field, deltas):
+    """บวกค่าแบบ F() ให้แถวเดียวต่อ key (สร้างแถวถ้ายังไม่มี)"""
+    for key, counts in deltas.items():
+        counts = {f: d for f, d in counts.items() if d}
+        if not counts:
+            continue
+        lookup = {key_field: key} if not isinstance(key, tuple) else dict(zip(key_field, key))
+        model.objects.get_or_create(**lookup)
+        model.objects.filter(**lookup).update(**{f: F(f) + d for f, d in counts.items()})
+
+
+@projection
+class OrgLoanStatsProjection(Projection):
+    """จำนวนรายการยืมตามสถานะขององค์กร (ย้ายจาก from_status -> to_status)"""
+    name = 'org_loan_stats'
+    fields = ('pending', 'approved', 'overdue', 'returned', 'rejected')
+
+    def apply(self, events):
+        deltas = defaultdict(lambda: defaultdict(int))
+        for e in events:
+            if not e.organization_id or e.from_status == e.to_status:
+                continue
+            if e.from_status in self.fields:
+                deltas[e.organization_id][e.from_status] -= 1
+            if e.to_status in self.fields:
+                deltas[e.organization_id][e.to_status] += 1
+        _add_counts(OrgLoanStats, 'organization_id', deltas)
+
+    def reset(self):
+        OrgLoanStats.objects.all().delete()
+
+
+@projection
+class AssetReservationProjection(Projection):
+    """จำนวนคำขอ/การจองที่ยังเปิดของอุปกรณ์ และรายการที่กำลังยืมอยู่"""
+    name = 'asset_reservation_state'
+
+    def apply(self, events):
+        # ข้ามอุปกรณ์ที่ถูกลบไปแล้ว (เหตุการณ์ยังอยู่ แต่ไม่มีแถวให้ผูก read model)
+        asset_ids = set(
+            Asset.objects.filter(pk__in={e.asset_id for e in events if e.asset_id})
+            .values_list('pk', flat=True)
+        )
+        states = AssetReservationState.objects.in_bulk(asset_ids, field_name='asset_id')
+        missing = [AssetReservationState(asset_id=a) for a in asset_ids - set(states)]
+        for state in AssetReservationState.objects.bulk_create(missing):
+            states[state.asset_id] = state
+
+        for e in events:
+            state = states.get(e.asset_id)
+            if state is None:
+                continue
+            state.open_loans += int(e.to_status in OPEN_STATUSES) - int(e.from_status in OPEN_STATUSES)
+            if e.kind == 'picked_up':
+                state.current_loan_id = e.loan_id
+            elif e.kind in ('returned', 'rejected') and state.current_loan_id == e.loan_id:
+                state.current_loan_id = None
+            state.last_event_at = e.created_at
+
+        AssetReservationState.objects.bulk_update(
+            states.values(), ['open_loans', 'current_loan_id', 'last_event_at']
+        )
+
+    def reset(self):
+        AssetReservationState.objects.all().delete()
+
+
+@projection
+class DailyRollupProjection(Projection):
+    """นับเหตุการณ์รายวัน (ตามเวลาท้องถิ่น) ต่อองค์กร"""
+    name = 'daily_loan_rollup'
+    fields = ('requested', 'approved', 'picked_up', 'returned', 'rejected', 'overdue')
+
+    def apply(self, events):
+        deltas = defaultdict(lambda: defaultdict(int))
+        for e in events:
+            if not e.organization_id or e.kind not in self.fields:
+                continue
+            day = timezone.localtime(e.created_at).date()
+            deltas[(e.organization_id, day)][e.kind] += 1
+        _add_counts(DailyLoanRollup, ('organization_id', 'day'), deltas)
+
+    def reset(self):
+        DailyLoanRollup.objects.all().delete()
+
+
+# -------------------------------------------------------------------
+# Runner
+# -------------------------------------------------------------------
+def _run_one(proj, batch_size):
+    processed = 0
+    while True:
+        with transaction.atomic():
+            checkpoint, _ = ProjectionCheckpoint.objects.get_or_create(name=proj.name)
+            events = list(
+                LoanEvent.objects.filter(id__gt=checkpoint.last_event_id).order_by('id')[:batch_size]
+            )
+            if not events:
+                return processed
+            proj.apply(events)
+            # read model และ checkpoint ขยับพร้อมกันใน transaction เดียว: ไม่นับซ้ำ/ไม่ตกหล่น
+            updated = ProjectionCheckpoint.objects.filter(
+                pk=checkpoint.pk, last_event_id=checkpoint.last_event_id
+            ).update(last_event_id=events[-1].id)
+            if not updated:
+                # อีก worker ประมวลผลช่วงเดียวกันไปแล้ว -> ยกเลิกรอบนี้
+                transaction.set_rollback(True)
+                return processed
+        processed += len(events)
+
+
+def update_projections(names=None, batch_size=BATCH_SIZE):
+    """ประมวลผลเหตุการณ์ใหม่ คืน {ชื่อ projection: จำนวนเหตุการณ์}"""
+    return {p.name: _run_one(p, batch_size) for p in get_projections(names)}
+
+
+def rebuild_projections(names=None, batch_size=BATCH_SIZE):
+    """ล้าง read model แล้ว replay จาก LoanEvent ทั้งหมด"""
+    projections = get_projections(names)
+    with transaction.atomic():
+        for p in projections:
+            p.reset()
+            ProjectionCheckpoint.objects.update_or_create(name=p.name, defaults={'last_event_id': 0})
+    return {p.name: _run_one(p, batch_size) for p in projections}
@@ -0,0 +1,111 @@
+# borrowing/querylog.py
+"""
+บันทึก query ที่ช้า พร้อมแผนการรัน (SQLite: EXPLAIN QUERY PLAN, PostgreSQL: EXPLAIN)
+
+- ติดตั้งเป็น execute wrapper ของทุก connection (BorrowingConfig.ready) เมื่อ SLOW_QUERY_MS ไม่เป็น None
+- เขียนเป็น JSON บรรทัดละ query ลง SLOW_QUERY_LOG_FILE ให้ `manage.py index_advisor` อ่านไปวิเคราะห์
+- SLOW_QUERY_MS = 0 คือเก็บทุก query (ใช้ช่วงสั้น ๆ เพื่อเก็บ workload ให้ advisor หา index ที่ไม่ถูกใช้)
+"""
+import json
+import logging
+import re
+import threading
+import time
+
+from django.conf import settings
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+_file_lock = threading.Lock()
+
+EXPLAINABLE = ('SELECT', 'UPDATE', 'DELETE', 'WITH')
+
+
+def threshold_ms():
+    return getattr(settings, 'SLOW_QUERY_MS', None)
+
+
+def log_path():
+    return getattr(settings, 'SLOW_QUERY_LOG_FILE', None) or str(settings.BASE_DIR / 'slow_queries.jsonl')
+
+
+def fingerprint(sql):
+    """รวม query รูปเดียวกัน: ยุบ IN (%s, %s, ...) และค่าคงที่ตัวเลข"""
+    sql = re.sub(r'IN \((?:%s, )*%s\)', 'IN (...)', sql)
+    sql = re.sub(r'\b\d+\b', '?', sql)
+    return re.sub(r'\s+', ' ', sql).strip()
+
+
+def explain(connection, sql, params):
+    """คืนแผนการรันเป็น list ของบรรทัด (ไม่ได้รัน query จริง)"""
+    if connection.vendor == 'sqlite':
+        prefix = 'EXPLAIN QUERY PLAN '
+    elif connection.vendor == 'postgresql':
+        prefix = 'EXPLAIN '
+    else:
+        return []
+    _local.busy = True
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(prefix + sql, params)
+            rows = cursor.fetchall()
+    except Exception:   # แผนเป็นข้อมูลเสริม: ห้ามทำให้ request ล้ม
+        logger.debug("EXPLAIN failed", exc_info=True)
+        return []
+    finally:
+        _local.busy = False
+    if connection.vendor == 'sqlite':
+        return [row[-1] for row in rows]   # (id, parent, notused, detail)
+    return [row[0] for row in rows]
+
+
+def _write(record):
+    line = json.dumps(record, ensure_ascii=False, default=str)
+    with _file_lock:
+        with open(log_path(), 'a', encoding='utf-8') as fh:
+            fh.write(line + '\n')
+
+
+class SlowQueryLogger:
+    """execute wrapper: จับเวลาแล้วบันทึก query ที่ช้ากว่า SLOW_QUERY_MS"""
+
+    def __call__(self, execute, sql, params, many, context):
+        if getattr(_local, 'busy', False):
+            return execute(sql, params, many, context)
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            limit = threshold_ms()
+            if limit is not None and elapsed_ms >= limit:
+                self.record(context['connection'], sql, params, many, elapsed_ms)
+
+    def record(self, connection, sql, params, many, elapsed_ms):
+        plan = []
+        if not many and sql.lstrip().upper().startswith(EXPLAINABLE):
+            plan = explain(connection, sql, params)
+        try:
+            _write({
+                'at': timezone.now().isoformat(),
+                'ms': round(elapsed_ms, 2),
+                'vendor': connection.vendor,
+                'fingerprint': fingerprint(sql),
+                'sql': sql,
+                'plan': plan,
+            })
+        except OSError:
+            logger.warning("Cannot write slow query log to %s", log_path(), exc_info=True)
+
+
+_wrapper = SlowQueryLogger()
+
+
+def install(sender=None, connection=None, **kwargs):
+    """ตัวรับสัญญาณ connection_created: ติด wrapper ให้ connection ใหม่ (ครั้งเดียวต่อ connection)"""
+    if threshold_ms() is None or connection is None:
+        return
+    if _wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_wrapper)
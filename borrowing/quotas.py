@@ -0,0 +1,125 @@
+# borrowing/quotas.py
+"""
+โควตายืมพร้อมกัน (QuotaPolicy) บนตัวนับที่ดูแลต่อเนื่อง (UserLoanCounter)
+
+- shift(): ปรับตัวนับแบบ delta ใน transaction เดียวกับการเปลี่ยนสถานะ (เรียกจาก services เท่านั้น)
+- violations(): อ่านนโยบาย + ตัวนับของผู้ใช้ (2 query ไม่ว่าจะถือกี่รายการ) คืนข้อความของนโยบายที่เกิน
+  ใช้แบบ "เพิ่มตัวนับก่อนแล้วตรวจ": ถ้าเกินให้ rollback ทั้ง transaction คำขอที่แข่งกันจึงไม่หลุดโควตาพร้อมกัน
+- reconcile(): นับใหม่จาก Loan ด้วย GROUP BY แล้วแก้เฉพาะแถวที่ไม่ตรง (หลังแก้ข้อมูลในหน้าแอดมิน ฯลฯ)
+- การจองซ้ำ (RecurringReservation) ทั้งชุดนับเป็น 1 รายการ ตั้งแต่อนุมัติจนครั้งสุดท้ายของชุดออกจากสถานะที่นับ
+  (ผู้ยืมถือครั้งละชิ้นเดียว) -> approve_recurring เพิ่มครั้งเดียว, release() ลดเมื่อไม่เหลือครั้งที่ยังนับในชุด
+"""
+from collections import Counter, defaultdict
+
+from django.db.models import Count, F, Q
+
+from .models import Loan, QuotaPolicy, UserLoanCounter
+
+COUNTED_STATUSES = ('pending', 'approved', 'overdue')
+
+
+def loan_key(loan):
+    """(ผู้ใช้, องค์กร, หมวด) ของ loan (ต้องมี asset.item โหลดอยู่แล้ว)"""
+    return loan.borrower_id, loan.organization_id, loan.asset.item.category_id or 0
+
+
+def shift(keys, delta):
+    """keys: iterable ของ (user_id, organization_id, category_id|0); delta: +1 เข้ากลุ่ม, -1 ออกจากกลุ่ม"""
+    counts = Counter((user_id, org_id, category or 0) for user_id, org_id, category in keys)
+    if not counts:
+        return
+    UserLoanCounter.objects.bulk_create(
+        [UserLoanCounter(user_id=u, organization_id=o, category_key=c) for u, o, c in counts],
+        ignore_conflicts=True,
+    )
+    for (user_id, org_id, category), n in counts.items():
+        UserLoanCounter.objects.filter(
+            user_id=user_id, organization_id=org_id, category_key=category
+        ).update(active=F('active') + n * delta)
+
+
+def release(loans):
+    """
+    ลดตัวนับของรายการที่กำลังออกจากสถานะที่นับ (ปฏิเสธ/คืน)
+    ครั้งของการจองซ้ำลดเฉพาะเมื่อชุดนั้นไม่เหลือครั้งอื่นที่ยังนับอยู่ (query เดียวต่อการเรียก)
+    """
+    loans = list(loans)
+    series = {loan.recurrence_id for loan in loans if loan.recurrence_id}
+    held = set()
+    if series:
+        held = set(
+            Loan.objects.filter(recurrence_id__in=series, status__in=COUNTED_STATUSES)
+            .exclude(pk__in=[loan.pk for loan in loans])
+            .values_list('recurrence_id', flat=True).distinct()
+        )
+    keys, released = [], set()
+    for loan in loans:
+        if loan.recurrence_id:
+            if loan.recurrence_id in held or loan.recurrence_id in released:
+                continue
+            released.add(loan.recurrence_id)
+        keys.append(loan_key(loan))
+    shift(keys, -1)
+
+
+def role_matches(role, user, org_id):
+    member = user.organization_id == org_id
+    return (
+        role == 'any'
+        or (role == 'member' and member)
+        or (role == 'admin' and member and user.is_org_admin)
+        or (role == 'external' and not member)
+    )
+
+
+def violations(users, org_ids):
+    """{user_id: [ข้อความ, ...]} ของผู้ใช้ที่ตัวนับเกินนโยบายใดนโยบายหนึ่งในองค์กรเหล่านี้"""
+    policies = list(
+        QuotaPolicy.objects.filter(organization_id__in=set(org_ids), is_active=True).select_related('category')
+    )
+    if not policies:
+        return {}
+    users = {user.pk: user for user in users}
+    held = defaultdict(dict)   # (user, org) -> {category: active}
+    for user_id, org_id, category, active in UserLoanCounter.objects.filter(
+        user_id__in=users, organization_id__in={p.organization_id for p in policies},
+    ).values_list('user_id', 'organization_id', 'category_key', 'active'):
+        held[(user_id, org_id)][category] = active
+
+    found = defaultdict(list)
+    for user in users.values():
+        for policy in policies:
+            if not role_matches(policy.borrower_role, user, policy.organization_id):
+                continue
+            counts = held.get((user.pk, policy.organization_id), {})
+            used = counts.get(policy.category_id, 0) if policy.category_id else sum(counts.values())
+            if used > policy.max_loans:
+                scope = f'หมวด "{policy.category.name}"' if policy.category_id else "ทุกหมวด"
+                found[user.pk].append(f"เกินโควตา: ยืมพร้อมกันได้ไม่เกิน {policy.max_loans} รายการ ({scope})")
+    return found
+
+
+def reconcile(dry_run=False):
+    """ทำให้ตัวนับตรงกับ Loan คืนจำนวนแถวที่แก้"""
+    actual = {
+        (row['borrower_id'], row['organization_id'], row['asset__item__category_id'] or 0): row['n']
+        for row in Loan.objects.filter(status__in=COUNTED_STATUSES)
+        .values('borrower_id', 'organization_id', 'asset__item__category_id')
+        # การจองซ้ำนับชุดละ 1 (ดู release)
+        .annotate(n=Count('id', filter=Q(recurrence__isnull=True)) + Count('recurrence', distinct=True))
+    }
+    stale, seen = [], set()
+    for counter in UserLoanCounter.objects.all().iterator(chunk_size=2000):
+        key = (counter.user_id, counter.organization_id, counter.category_key)
+        seen.add(key)
+        if counter.active != actual.get(key, 0):
+            counter.active = actual.get(key, 0)
+            stale.append(counter)
+    missing = [
+        UserLoanCounter(user_id=u, organization_id=o, category_key=c, active=n)
+        for (u, o, c), n in actual.items() if (u, o, c) not in seen
+    ]
+    if not dry_run:
+        UserLoanCounter.objects.bulk_update(stale, ['active'], batch_size=1000)
+        UserLoanCounter.objects.bulk_create(missing, batch_size=1000, ignore_conflicts=True)
+    return len(stale) + len(missing)
@@ -0,0 +1,94 @@
+# borrowing/ratelimit.py
+"""
+จำกัดอัตราคำขอแบบ token bucket ต่อผู้ใช้และต่อองค์กร (เก็บสถานะใน cache framework)
+
+- RATE_LIMITS = {scope: {'user': 'N/s|m|h', 'org': 'N/s|m|h'}} (N = ความจุ bucket = จำนวนที่ยิงติดกันได้)
+- เกินโควตาได้ 429 + Retry-After ทันที ก่อนเปิด transaction / select_for_update ใด ๆ
+- RATE_LIMIT_CACHE เลือก alias ของ CACHES (ค่าเริ่มต้น 'default' = local memory ต่อโปรเซส;
+  หลายโปรเซสควรชี้ไป cache ที่ใช้ร่วมกัน) อ่าน-เขียนไม่ atomic จึงอาจปล่อยเกินเล็กน้อยเมื่อชนกันพอดี
+"""
+import math
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600}
+
+DEFAULT_LIMITS = {
+    'borrow': {'user': '10/m', 'org': '300/m'},
+    'loan_admin': {'user': '120/m', 'org': '600/m'},
+}
+
+
+def parse_rate(value):
+    """'10/m' -> (ความจุ, token ต่อวินาที)"""
+    count, _, period = value.partition('/')
+    count = int(count)
+    return count, count / PERIODS[period[:1] or 's']
+
+
+def _limits(scope):
+    return getattr(settings, 'RATE_LIMITS', DEFAULT_LIMITS).get(scope, {})
+
+
+def _cache():
+    return caches[getattr(settings, 'RATE_LIMIT_CACHE', 'default')]
+
+
+def _buckets(request, scope):
+    limits = _limits(scope)
+    keys = []
+    if 'user' in limits:
+        keys.append((f"rl:{scope}:u:{request.user.pk}", limits['user']))
+    org_id = getattr(request.user, 'organization_id', None)
+    if 'org' in limits and org_id:
+        keys.append((f"rl:{scope}:o:{org_id}", limits['org']))
+    return keys
+
+
+def consume(request, scope, now=None):
+    """หัก 1 token จากทุก bucket ที่เกี่ยวข้อง คืน 0 ถ้าผ่าน หรือจำนวนวินาทีที่ต้องรอ"""
+    now = now if now is not None else time.time()
+    buckets = _buckets(request, scope)
+    if not buckets:
+        return 0
+    cache = _cache()
+    stored = cache.get_many([key for key, _ in buckets])
+
+    updates, wait = {}, 0
+    for key, rate in buckets:
+        capacity, per_second = parse_rate(rate)
+        tokens, stamp = stored.get(key, (capacity, now))
+        tokens = min(capacity, tokens + (now - stamp) * per_second)
+        if tokens < 1:
+            wait = max(wait, (1 - tokens) / per_second)
+        updates[key] = (tokens - 1, now, math.ceil(capacity / per_second) + 1)
+
+    # ไม่ผ่านแม้ bucket เดียว -> ไม่หัก bucket อื่น (องค์กรเต็มไม่ควรกินโควตาส่วนตัวของผู้ใช้)
+    if wait:
+        return wait
+    for key, (tokens, stamp, timeout) in updates.items():
+        cache.set(key, (tokens, stamp), timeout)   # หมดอายุเมื่อ bucket เต็มแล้ว: ไม่ค้างในแคช
+    return 0
+
+
+def rate_limit(scope, methods=('POST',)):
+    """ใช้ต่อจาก @login_required (และใต้ @idempotent เพื่อให้คำขอซ้ำที่ replay ได้ไม่เสีย token)"""
+    def decorator(view_func):
+        @wraps(view_func)
+        def _wrapped(request, *args, **kwargs):
+            if request.method in methods:
+                wait = consume(request, scope)
+                if wait:
+                    response = HttpResponse(
+                        'มีคำขอมากเกินไป กรุณารอสักครู่แล้วลองใหม่',
+                        status=429, content_type='text/plain; charset=utf-8',
+                    )
+                    response['Retry-After'] = str(math.ceil(wait))
+                    return response
+            return view_func(request, *args, **kwargs)
+        return _wrapped
+    return decorator
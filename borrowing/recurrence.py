@@ -0,0 +1,170 @@
+# borrowing/recurrence.py
+"""
+การจองซ้ำ (RecurringReservation)
+
+- occurrences(): ขยายกฎเป็นรายครั้งแบบ lazy เฉพาะในหน้าต่างที่ถาม (ไม่สร้างทั้งเทอมถ้าถามแค่สัปดาห์เดียว)
+- preview_conflicts(): ตรวจทุกครั้งกับ interval tree ของอุปกรณ์ในรอบเดียว (แคช ไม่แตะตาราง Loan)
+- approve_recurring(): ใน transaction เดียว: query ช่วงที่ถูกจองครั้งเดียว แล้วเทียบแบบ sweep กับทุกครั้ง
+  จากนั้น bulk_create Loan (approved) + LoanEvent ของทุกครั้ง แทนการขอ/อนุมัติทีละสัปดาห์
+"""
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Asset, Loan, LoanEvent, RecurringReservation, day_range
+from . import availability, intervals, quotas, services
+
+
+def max_occurrences():
+    return getattr(settings, 'RECURRING_MAX_OCCURRENCES', 100)
+
+
+def _occurrence_range(rule, day):
+    if rule.start_time and rule.end_time:
+        tz = timezone.get_current_timezone()
+        return (timezone.make_aware(datetime.combine(day, rule.start_time), tz),
+                timezone.make_aware(datetime.combine(day, rule.end_time), tz))
+    return day_range(day, day)
+
+
+def occurrence_dates(rule, window_start=None, window_end=None):
+    """วันที่ของแต่ละครั้งใน [window_start, window_end] (รวมปลาย) เรียงตามวัน ไม่รวม exdates"""
+    lo = max(rule.dtstart, window_start) if window_start else rule.dtstart
+    hi = min(rule.until, window_end) if window_end else rule.until
+    skip = set(rule.exdates or [])
+    step = max(rule.interval, 1)
+
+    if rule.freq == 'daily':
+        offset = -(-(lo - rule.dtstart).days // step) * step   # ปัดขึ้นให้ตรงรอบ
+        day = rule.dtstart + timedelta(days=offset)
+        while day <= hi:
+            if day.isoformat() not in skip:
+                yield day
+            day += timedelta(days=step)
+        return
+
+    weekdays = rule.weekdays or [rule.dtstart.weekday()]
+    week0 = rule.dtstart - timedelta(days=rule.dtstart.weekday())   # วันจันทร์ของสัปดาห์แรก
+    week = max((lo - week0).days // 7, 0)
+    week += (-week) % step                                           # สัปดาห์แรกที่ตรงรอบ
+    while True:
+        monday = week0 + timedelta(weeks=week)
+        if monday > hi:
+            return
+        for wd in weekdays:
+            day = monday + timedelta(days=wd)
+            if lo <= day <= hi and day.isoformat() not in skip:
+                yield day
+        week += step
+
+
+def occurrences(rule, window_start=None, window_end=None):
+    """(วันที่, start_at, end_at) ของแต่ละครั้งในหน้าต่าง (generator)"""
+    for day in occurrence_dates(rule, window_start, window_end):
+        yield (day, *_occurrence_range(rule, day))
+
+
+def _sweep(ranges, busy):
+    """
+    ranges: ครั้งที่จะจอง (ไม่ทับกันเอง เรียงตามเวลา), busy: (start, end) ที่ถูกจอง เรียงตาม start
+    คืนวันที่ของครั้งที่ทับ: เดินครั้งเดียว O(n + m) โดยจำ end ที่ไกลที่สุดของ busy ที่เริ่มก่อนครั้งนั้นจบ
+    """
+    clashes, j, reach = [], 0, None
+    for day, start_at, end_at in ranges:
+        while j < len(busy) and busy[j][0] < end_at:
+            reach = busy[j][1] if reach is None else max(reach, busy[j][1])
+            j += 1
+        if reach is not None and reach > start_at:
+            clashes.append(day)
+    return clashes
+
+
+def preview_conflicts(rule, ranges=None):
+    """ตรวจเร็วจาก interval tree ที่แคชไว้ (ไม่ใช่ผลสุดท้าย) คืน list วันที่ที่ชน"""
+    ranges = list(occurrences(rule)) if ranges is None else ranges
+    tree = intervals.asset_tree(rule.asset_id)
+    return [
+        day for day, start_at, end_at in ranges
+        if not tree.is_free(int(start_at.timestamp()), int(end_at.timestamp()))
+    ]
+
+
+def conflicts(asset_id, ranges, statuses):
+    """ตรวจจริงจากฐานข้อมูล: query ช่วงที่ถูกจอง (และบำรุงรักษา) ทั้งหน้าต่างครั้งเดียวแล้ว sweep"""
+    if not ranges:
+        return []
+    busy = list(
+        Loan.objects.filter(
+            asset_id=asset_id, status__in=statuses,
+            start_at__lt=ranges[-1][2], end_at__gt=ranges[0][1],
+        ).values_list('start_at', 'end_at')
+    )
+    busy += services._maintenance_overlapping(
+        [asset_id], ranges[0][1], ranges[-1][2]
+    ).values_list('start_at', 'end_at')
+    return _sweep(ranges, sorted(busy))
+
+
+def approve_recurring(rule: RecurringReservation, actor=None, skip_conflicts=False):
+    """
+    อนุมัติกฎ: สร้าง Loan (approved) ของทุกครั้งเป็นชุด คืน (ok, error)
+    skip_conflicts=True: ครั้งที่ชนกับการจองเดิม (รวมคำขอที่รออนุมัติ เหมือน request_loan) ถูกเพิ่มเข้า exdates แทนการล้มทั้งกฎ
+    """
+    def attempt():
+        current = RecurringReservation.objects.select_related('asset__item', 'borrower').get(pk=rule.pk)
+        if current.status != 'pending':
+            return False, "กฎการจองนี้ไม่ได้อยู่ในสถานะรอดำเนินการ"
+        asset = current.asset
+        today = timezone.localdate()
+        ranges = list(occurrences(current, window_start=today))
+        clashes = conflicts(asset.pk, ranges, services.BLOCKING_STATUSES)
+        if clashes and not skip_conflicts:
+            return False, "ชนกับการจองหรือคำขอที่รออนุมัติในวันที่ " + ", ".join(f"{d:%d/%m/%Y}" for d in clashes)
+        if clashes:
+            current.exdates = sorted(set(current.exdates or []) | {d.isoformat() for d in clashes})
+            ranges = [r for r in ranges if r[0] not in set(clashes)]
+        if not ranges:
+            return False, "ไม่มีวันที่ที่จองได้เหลืออยู่"
+
+        now = timezone.now()
+        services._cas_update(Asset, asset.pk, asset.version)
+        loans = []
+        for _, start_at, end_at in ranges:
+            loan = Loan(
+                asset=asset, borrower_id=current.borrower_id, organization_id=asset.organization_id,
+                reason=current.reason, start_at=start_at, end_at=end_at,
+                status='approved', approved_at=now, recurrence=current,
+            )
+            loan.sync_range()   # bulk_create ไม่เรียก save(): ตั้ง start_date/due_date เอง
+            loans.append(loan)
+        Loan.objects.bulk_create(loans)
+        events = []
+        for loan in loans:
+            events.append(LoanEvent(**services._event_fields(loan, 'requested', '', 'pending', current.borrower, now)))
+            events.append(LoanEvent(**services._event_fields(loan, 'approved', 'pending', 'approved', actor, now)))
+        LoanEvent.objects.bulk_create(events)
+        quotas.shift([quotas.loan_key(loans[0])], +1)   # ทั้งชุดนับเป็น 1 รายการ (ดู quotas.release)
+        errors = quotas.violations([current.borrower], [asset.organization_id]).get(current.borrower_id)
+        if errors:
+            transaction.set_rollback(True)
+            return False, errors[0]
+
+        updated = RecurringReservation.objects.filter(pk=current.pk, status='pending').update(
+            status='approved', approved_at=now, exdates=current.exdates
+        )
+        if not updated:
+            raise services.StaleVersion(f"RecurringReservation #{current.pk}")
+        availability.bump_item(asset.item_id)
+        rule.status, rule.approved_at, rule.exdates = 'approved', now, current.exdates
+        return True, None
+
+    return services._with_retry(attempt)
+
+
+def reject_recurring(rule: RecurringReservation):
+    updated = RecurringReservation.objects.filter(pk=rule.pk, status='pending').update(status='rejected')
+    if updated:
+        rule.status = 'rejected'
+    return bool(updated)
@@ -0,0 +1,110 @@
+# borrowing/reminders.py
+"""
+เตือนกำหนดคืนแบบสรุปรวม (digest)
+
+- สแกน Loan ครั้งเดียวด้วย index (status, due_date): ใกล้ถึงกำหนด N วัน / ครบกำหนดวันนี้ / เกินกำหนด
+- รวมเป็นการแจ้งเตือน 1 แถวต่อผู้ยืม และ 1 แถวต่อผู้ดูแลองค์กร (ไม่ใช่ 1 แถวต่อรายการ)
+- Loan.reminder_stage เป็น watermark: ส่งแต่ละขั้นครั้งเดียว รันซ้ำกี่รอบก็ไม่ส่งซ้ำ
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, When, Value, F, IntegerField
+from django.utils import timezone
+
+from users.models import CustomUser
+from users.notifications import create_notifications
+from .models import Loan
+
+ACTIVE_STATUSES = ('approved', 'overdue')
+ADMIN_DIGEST_LINES = 20
+UPDATE_CHUNK = 500
+
+STAGE_LABELS = {
+    Loan.REMINDER_DUE_SOON: "ใกล้ถึงกำหนดคืน",
+    Loan.REMINDER_DUE_TODAY: "ครบกำหนดคืนวันนี้",
+    Loan.REMINDER_OVERDUE: "เกินกำหนดคืน",
+}
+
+
+def days_before():
+    return getattr(settings, 'REMINDER_DAYS_BEFORE', 2)
+
+
+def _due_rows(today, horizon):
+    """รายการที่ถึงขั้นเตือนใหม่ (ขั้นที่คำนวณได้ > watermark) ใน query เดียว"""
+    stage = Case(
+        When(status='overdue', then=Value(Loan.REMINDER_OVERDUE)),
+        When(due_date__lt=today, then=Value(Loan.REMINDER_OVERDUE)),
+        When(due_date=today, then=Value(Loan.REMINDER_DUE_TODAY)),
+        default=Value(Loan.REMINDER_DUE_SOON),
+        output_field=IntegerField(),
+    )
+    return (
+        Loan.objects.filter(status__in=ACTIVE_STATUSES, due_date__lte=horizon)
+        .annotate(stage=stage)
+        .filter(reminder_stage__lt=F('stage'))
+        .values(
+            'id', 'borrower_id', 'organization_id', 'due_date', 'stage',
+            'asset__item__name', 'asset__serial_number', 'asset__device_id',
+            'borrower__username',
+        )
+        .order_by('due_date', 'id')
+    )
+
+
+def _line(row, with_borrower=False):
+    code = row['asset__serial_number'] or row['asset__device_id'] or '-'
+    text = f"- {row['asset__item__name']} ({code}) กำหนดคืน {row['due_date']:%d/%m/%Y} [{STAGE_LABELS[row['stage']]}]"
+    if with_borrower:
+        text += f" ผู้ยืม: {row['borrower__username']}"
+    return text
+
+
+def _borrower_digest(rows):
+    return "แจ้งเตือนกำหนดคืนอุปกรณ์:\n" + "\n".join(_line(r) for r in rows)
+
+
+def _admin_digest(rows):
+    counts = defaultdict(int)
+    for r in rows:
+        counts[r['stage']] += 1
+    summary = ", ".join(f"{STAGE_LABELS[s]} {n} รายการ" for s, n in sorted(counts.items(), reverse=True))
+    lines = [_line(r, with_borrower=True) for r in rows[:ADMIN_DIGEST_LINES]]
+    if len(rows) > ADMIN_DIGEST_LINES:
+        lines.append(f"... และอีก {len(rows) - ADMIN_DIGEST_LINES} รายการ")
+    return f"สรุปกำหนดคืนขององค์กร: {summary}\n" + "\n".join(lines)
+
+
+def send_due_reminders(today=None):
+    """ส่ง digest แล้วขยับ watermark ใน transaction เดียว คืน (จำนวนรายการ, จำนวนการแจ้งเตือน)"""
+    today = today or timezone.localdate()
+    rows = list(_due_rows(today, today + timedelta(days=days_before())))
+    if not rows:
+        return 0, 0
+
+    by_borrower, by_org, by_stage = defaultdict(list), defaultdict(list), defaultdict(list)
+    for r in rows:
+        by_borrower[r['borrower_id']].append(r)
+        by_org[r['organization_id']].append(r)
+        by_stage[r['stage']].append(r['id'])
+
+    notifications = [
+        (uid, _borrower_digest(user_rows)) for uid, user_rows in by_borrower.items()
+    ]
+    admins = CustomUser.objects.filter(
+        is_org_admin=True, organization_id__in=list(by_org)
+    ).values_list('id', 'organization_id')
+    notifications += [(uid, _admin_digest(by_org[org_id])) for uid, org_id in admins]
+
+    with transaction.atomic():
+        for stage, ids in by_stage.items():
+            for i in range(0, len(ids), UPDATE_CHUNK):
+                # เงื่อนไข reminder_stage__lt กันรอบที่รันซ้อนกันเขียน watermark ถอยหลัง
+                Loan.objects.filter(
+                    pk__in=ids[i:i + UPDATE_CHUNK], reminder_stage__lt=stage
+                ).update(reminder_stage=stage)
+        create_notifications(notifications)
+    return len(rows), len(notifications)
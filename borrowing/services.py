@@ -1,42 +1,783 @@
 # borrowing/services.py
+"""
+Loan state machine: ทุกการเปลี่ยนสถานะของ Loan/Asset ต้องผ่านไฟล์นี้
+
+ใช้ optimistic concurrency แทน select_for_update:
+  อ่านแถว (พร้อม version) -> ตรวจเงื่อนไข -> UPDATE ... WHERE id=? AND version=?
+  ถ้า UPDATE ได้ 0 แถว แปลว่ามีคนแก้ไปก่อน -> rollback แล้วอ่านใหม่/ลองใหม่ (สูงสุด MAX_RETRIES)
+ทุก transition ที่สำเร็จจะเขียน LoanEvent 1 แถว (audit) ใน transaction เดียวกัน
+
+ฟังก์ชันสาธารณะคืนค่าแบบเดิมของไฟล์นี้: (ok, error_message)
+"""
+from datetime import timedelta
+
+from django.conf import settings
 from django.utils import timezone
-from django.db import transaction
-from .models import Loan
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q, Count
+from .models import Loan, LoanBundle, Asset, Item, LoanEvent, WaitlistEntry, MaintenanceWindow, day_range
+from .jobs import enqueue
+from . import availability, intervals, quotas
 
-def approve_loan(loan: Loan):
-    """อนุมัติ -> เซ็ต approved และ timestamp; (ถ้าคุณมี field สถานะใน Asset จะไปปรับตอนรับของจริง/หรืออนุมัติเลยก็ได้)"""
-    with transaction.atomic():
-        if loan.status != 'pending':
-            return False, "สถานะไม่ใช่รอดำเนินการ"
-        loan.status = 'approved'
-        if not loan.approved_at:
-            loan.approved_at = timezone.now()
-        loan.save(update_fields=['status', 'approved_at'])
-        # หมายเหตุ: ถ้าต้องการกันของทันทีตั้งแต่อนุมัติ ให้ไปอัพเดต asset.status ที่ view/service อื่นตามนโยบายคุณ
-        return True, None
-
-def reject_loan(loan: Loan):
+MAX_RETRIES = 5
+
+# การกระทำ -> (สถานะต้นทางที่ยอมรับ, สถานะปลายทาง, ชนิดเหตุการณ์)
+TRANSITIONS = {
+    'approve': (('pending',), 'approved', 'approved'),
+    'reject': (('pending', 'approved'), 'rejected', 'rejected'),
+    'pickup': (('approved',), 'approved', 'picked_up'),
+    'return': (('approved', 'overdue'), 'returned', 'returned'),
+    'overdue': (('approved',), 'overdue', 'overdue'),
+}
+
+# สถานะที่ "กันช่วงเวลา" ของอุปกรณ์ไว้แล้ว
+BLOCKING_STATUSES = ('pending', 'approved', 'overdue')
+ACTIVE_STATUSES = ('approved', 'overdue')
+# ช่วงบำรุงรักษาที่ยังกันช่วงเวลา (เสร็จ/ยกเลิกแล้วไม่กัน)
+MAINTENANCE_BLOCKING = ('scheduled', 'active')
+
+
+class StaleVersion(Exception):
+    """UPDATE แบบมีเงื่อนไข version ไม่ตรง -> ให้ตัววน retry อ่านใหม่"""
+
+
+def _cas_update(model, pk, version, **changes):
+    """compare-and-set: อัปเดตเมื่อ version ยังเท่าเดิม และขยับ version +1"""
+    updated = model.objects.filter(pk=pk, version=version).update(
+        version=F('version') + 1, **changes
+    )
+    if not updated:
+        raise StaleVersion(f"{model.__name__} #{pk}")
+
+
+def _shift_available(item_id, delta):
+    # ปรับตัวนับแบบ delta แทนการนับใหม่ทั้ง item เหมือน Asset.save()
+    Item.objects.filter(pk=item_id).update(available_quantity=F('available_quantity') + delta)
+
+
+def recount_items(item_ids):
+    """นับ total/available ของหลาย item ใหม่ด้วย GROUP BY ครั้งเดียว (ใช้หลังอัปเดตอุปกรณ์เป็นชุด)"""
+    item_ids = set(item_ids)
+    if not item_ids:
+        return
+    rows = (
+        Asset.objects.filter(item_id__in=item_ids)
+        .values('item_id')
+        .annotate(total=Count('id'), available=Count('id', filter=Q(status='available')))
+    )
+    counts = {r['item_id']: (r['total'], r['available']) for r in rows}
+    items = [
+        Item(pk=iid, total_quantity=counts.get(iid, (0, 0))[0], available_quantity=counts.get(iid, (0, 0))[1])
+        for iid in item_ids
+    ]
+    Item.objects.bulk_update(items, ['total_quantity', 'available_quantity'])
+    for iid in item_ids:
+        availability.bump_item(iid)
+
+
+def bulk_set_asset_status(assets, status):
+    """
+    เปลี่ยนสถานะอุปกรณ์เป็นชุด: UPDATE ครั้งเดียว + นับตัวนับของ item ครั้งเดียว
+    (ไม่ผ่าน Asset.save() ที่นับใหม่ทีละแถว) ข้ามชิ้นที่กำลังถูกยืม เพราะผูกกับ Loan อยู่
+    คืน (จำนวนที่เปลี่ยน, จำนวนที่ข้าม)
+    """
     with transaction.atomic():
-        if loan.status != 'pending':
-            return False, "สถานะไม่ใช่รอดำเนินการ"
-        loan.status = 'rejected'
-        loan.save(update_fields=['status'])
-        return True, None
-
-def return_loan(loan: Loan):
-    """รับคืน -> returned และ (ถ้าคุณใช้ field สถานะใน Asset) ปล่อยของเป็น available"""
+        targets = assets.exclude(status='on_loan').exclude(status=status)
+        item_ids = set(targets.values_list('item_id', flat=True))
+        skipped = assets.filter(status='on_loan').count()
+        updated = Asset.objects.filter(pk__in=targets.values('pk')).update(
+            status=status, version=F('version') + 1
+        )
+        recount_items(item_ids)
+    return updated, skipped
+
+
+def save_asset_grid(item: Item, updated=(), created=(), deleted=()):
+    """
+    บันทึกแถวที่แก้จากตารางอุปกรณ์ (forms.AssetGrid) ใน transaction เดียว คืน (ok, error)
+    - updated: [(asset, data)] -> bulk_update ครั้งเดียว เงื่อนไข (id, version) ตรงกับตอนเปิดหน้าทุกแถว
+      ถ้ามีแถวที่ถูกแก้ไปก่อน (version เปลี่ยน) ยกเลิกทั้งชุด
+    - created: [data] -> bulk_create, deleted: [(asset, data)] -> DELETE ครั้งเดียว (กันชิ้นที่มีคำขอ/ถูกยืมอยู่)
+    - นับตัวนับของ item ครั้งเดียวท้ายชุด (ไม่ผ่าน Asset.save()/delete() ที่นับใหม่ทีละแถว)
+    """
+    fields = ['serial_number', 'device_id', 'location', 'status']
     with transaction.atomic():
-        if loan.status not in ('approved', 'overdue'):
-            return False, "สถานะนี้คืนไม่ได้"
-        loan.status = 'returned'
-        loan.return_date = timezone.now()
-        loan.save(update_fields=['status', 'return_date'])
-
-        # ถ้าโมเดล Asset ของคุณมีฟิลด์ status ให้ปล่อยของกลับ available ที่นี่
-        if hasattr(loan.asset, 'status'):
+        if deleted:
+            delete_ids = [asset.pk for asset, _ in deleted]
+            busy = set(
+                Loan.objects.filter(asset_id__in=delete_ids, status__in=['pending', 'approved'])
+                .values_list('asset_id', flat=True)
+            ) | {asset.pk for asset, _ in deleted if asset.status == 'on_loan'}
+            if busy:
+                names = ", ".join(
+                    asset.serial_number or asset.device_id or str(asset.pk) for asset, _ in deleted if asset.pk in busy
+                )
+                return False, f"ไม่สามารถลบอุปกรณ์ {names} ได้ เนื่องจากมีการยืมที่ยังใช้งานอยู่"
+            Asset.objects.filter(item=item, pk__in=delete_ids).delete()
+
+        if updated:
+            expected, objs = Q(), []
+            for asset, data in updated:
+                version = data['version'] if data.get('version') is not None else asset.version
+                expected |= Q(pk=asset.pk, version=version)
+                for field in fields:
+                    setattr(asset, field, data[field])
+                asset.version = F('version') + 1
+                objs.append(asset)
+            try:
+                count = Asset.objects.filter(expected, item=item).bulk_update(objs, fields + ['version'])
+            except IntegrityError:   # สลับ SN/ID กันเองในชุดเดียว: ฐานข้อมูลตรวจ unique ทีละแถว
+                transaction.set_rollback(True)
+                return False, "SN/Device ID ซ้ำระหว่างการบันทึก กรุณาบันทึกการสลับค่าทีละขั้น"
+            if count != len(objs):
+                transaction.set_rollback(True)
+                return False, "อุปกรณ์บางชิ้นถูกแก้ไขโดยผู้อื่นระหว่างนี้ กรุณาโหลดหน้าใหม่แล้วแก้อีกครั้ง"
+
+        if created:
             try:
-                loan.asset.status = 'available'
-                loan.asset.save(update_fields=['status'])
-            except Exception:
-                pass
-        return True, None
+                Asset.objects.bulk_create([
+                    Asset(item=item, organization_id=item.organization_id, **{field: data[field] for field in fields})
+                    for data in created
+                ])
+            except IntegrityError:
+                transaction.set_rollback(True)
+                return False, "SN/Device ID ซ้ำกับอุปกรณ์ที่เพิ่งถูกเพิ่ม กรุณาลองใหม่"
+
+        recount_items([item.pk])
+    return True, None
+
+
+def record_event(loan, kind, from_status, to_status, actor=None, at=None):
+    """เขียน LoanEvent (append-only) พร้อมคีย์ที่ projection ใช้ ให้ไม่ต้อง join กลับ"""
+    return LoanEvent.objects.create(**_event_fields(loan, kind, from_status, to_status, actor, at))
+
+
+def _event_fields(loan, kind, from_status, to_status, actor=None, at=None):
+    return dict(
+        loan_id=loan.pk,
+        asset_id=loan.asset_id,
+        borrower_id=loan.borrower_id,
+        organization_id=loan.organization_id,
+        kind=kind,
+        from_status=from_status,
+        to_status=to_status,
+        actor=actor,
+        payload={
+            'start_date': loan.start_date.isoformat() if loan.start_date else None,
+            'due_date': loan.due_date.isoformat() if loan.due_date else None,
+            'start_at': loan.start_at.isoformat() if loan.start_at else None,
+            'end_at': loan.end_at.isoformat() if loan.end_at else None,
+        },
+        created_at=at or timezone.now(),
+    )
+
+
+def _overlapping(asset_id, start_at, end_at, statuses, exclude_pk=None):
+    """รายการที่ทับช่วงเวลาแบบครึ่งเปิด [start_at, end_at) (จองต่อกันพอดีไม่นับว่าทับ)"""
+    qs = Loan.objects.filter(
+        asset_id=asset_id,
+        status__in=statuses,
+        start_at__lt=end_at,
+        end_at__gt=start_at,
+    )
+    if exclude_pk:
+        qs = qs.exclude(pk=exclude_pk)
+    return qs
+
+
+def _maintenance_overlapping(asset_ids, start_at, end_at):
+    """ช่วงบำรุงรักษาที่ทับ [start_at, end_at) ของอุปกรณ์เหล่านี้"""
+    return MaintenanceWindow.objects.filter(
+        asset_id__in=asset_ids, status__in=MAINTENANCE_BLOCKING,
+        start_at__lt=end_at, end_at__gt=start_at,
+    )
+
+
+def _maintenance_error(window):
+    start, end = timezone.localtime(window.start_at), timezone.localtime(window.end_at)
+    return f"อุปกรณ์มีกำหนดบำรุงรักษา {start:%d/%m/%Y %H:%M} ถึง {end:%d/%m/%Y %H:%M} กรุณาเลือกช่วงอื่น"
+
+
+def _with_retry(fn):
+    """รัน fn ใน transaction ใหม่ทุกรอบ จนกว่าจะไม่ชน version"""
+    for _ in range(MAX_RETRIES):
+        try:
+            with transaction.atomic():
+                return fn()
+        except StaleVersion:
+            continue
+    return False, "มีการแก้ไขรายการนี้พร้อมกัน กรุณาลองใหม่อีกครั้ง"
+
+
+# -------------------------------------------------------------------
+# Transition engine
+# -------------------------------------------------------------------
+def transition(loan: Loan, action: str, actor=None):
+    """เปลี่ยนสถานะ loan ตาม action; อัปเดตฟิลด์ของ instance ที่ส่งเข้ามาเมื่อสำเร็จ"""
+    if action not in TRANSITIONS:
+        raise ValueError(f"ไม่รู้จัก transition '{action}'")
+
+    def attempt():
+        current = Loan.objects.select_related('asset__item', 'borrower').get(pk=loan.pk)
+        ok, error = _apply(current, action, actor)
+        if ok:
+            for field in ('status', 'approved_at', 'pickup_date', 'return_date', 'version'):
+                setattr(loan, field, getattr(current, field))
+            loan.asset = current.asset
+        return ok, error
+
+    return _with_retry(attempt)
+
+
+def _apply(loan, action, actor):
+    sources, target, kind = TRANSITIONS[action]
+    if loan.status not in sources:
+        return False, {
+            'approve': "สถานะไม่ใช่รอดำเนินการ",
+            'reject': "คำขอยืมนี้ไม่สามารถปฏิเสธได้",
+            'pickup': "ทำได้เฉพาะรายการที่อนุมัติแล้ว",
+            'return': "สถานะนี้คืนไม่ได้",
+            'overdue': "สถานะนี้เปลี่ยนเป็นเกินกำหนดไม่ได้",
+        }[action]
+
+    now = timezone.now()
+    asset = loan.asset
+    changes = {'status': target}
+
+    if action == 'approve':
+        if not loan.start_at or not loan.end_at:
+            return False, "กรุณาระบุช่วงวันที่ให้ครบก่อนอนุมัติ"
+        if _overlapping(asset.pk, loan.start_at, loan.end_at, ACTIVE_STATUSES, exclude_pk=loan.pk).exists():
+            return False, (f"ไม่สามารถอนุมัติได้: มีการอนุมัติ/จอง '{asset.item.name}' "
+                           f"ทับช่วง {loan.start_date:%d/%m}-{loan.due_date:%d/%m}")
+        window = _maintenance_overlapping([asset.pk], loan.start_at, loan.end_at).first()
+        if window:
+            return False, f"ไม่สามารถอนุมัติได้: {_maintenance_error(window)}"
+        # โควตาถูกนับไว้ตั้งแต่ตอนขอแล้ว: ตรวจซ้ำเผื่อองค์กรลดโควตาลงระหว่างรออนุมัติ
+        errors = quotas.violations([loan.borrower], [loan.organization_id]).get(loan.borrower_id)
+        if errors:
+            return False, errors[0]
+        # ขยับ version ของ asset ด้วย: การอนุมัติสองรายการทับช่วงพร้อมกันจะชนกันที่แถวนี้
+        _cas_update(Asset, asset.pk, asset.version)
+        changes['approved_at'] = loan.approved_at or now
+
+    elif action == 'reject':
+        if loan.pickup_date:
+            return False, "รายการนี้เริ่มยืมแล้ว ไม่สามารถปฏิเสธได้"
+
+    elif action == 'pickup':
+        if loan.pickup_date:
+            return False, "รายการนี้บันทึกการรับของไปแล้ว"
+        if asset.status != 'available':
+            return False, f"อุปกรณ์ไม่พร้อม (สถานะ: {asset.get_status_display()})"
+        _cas_update(Asset, asset.pk, asset.version, status='on_loan')
+        _shift_available(asset.item_id, -1)
+        asset.status = 'on_loan'
+        changes['pickup_date'] = now
+
+    elif action == 'return':
+        changes['return_date'] = now
+        if loan.pickup_date and asset.status == 'on_loan':
+            _cas_update(Asset, asset.pk, asset.version, status='available')
+            _shift_available(asset.item_id, +1)
+            asset.status = 'available'
+
+    from_status = loan.status
+    _cas_update(Loan, loan.pk, loan.version, **changes)
+    for field, value in changes.items():
+        setattr(loan, field, value)
+    loan.version += 1
+    record_event(loan, kind, from_status, target, actor=actor, at=now)
+    if action in ('reject', 'return'):
+        quotas.release([loan])
+        promote_waitlist(asset)   # ช่วงที่ว่างลงส่งต่อให้คิวทันที ใน transaction เดียวกัน
+    availability.bump_item(asset.item_id)
+    return True, None
+
+
+def request_loan(asset: Asset, borrower, start_date, due_date, reason='', start_at=None, end_at=None):
+    """
+    สร้างคำขอยืมใหม่ (pending) คืน (loan, error)
+    จองรายชั่วโมงส่ง start_at/end_at มาด้วย (ไม่ส่ง = ทั้งวันตั้งแต่ start_date ถึง due_date)
+    กันทับช่วงด้วยการขยับ version ของ asset: คำขอที่แข่งกันจะมีเพียงหนึ่งเดียวที่ผ่าน
+    """
+    if start_at is None or end_at is None:
+        start_at, end_at = day_range(start_date, due_date)
+
+    def attempt():
+        current = Asset.objects.only('id', 'version').get(pk=asset.pk)
+        if _overlapping(current.pk, start_at, end_at, BLOCKING_STATUSES).exists():
+            local_start, local_end = timezone.localtime(start_at), timezone.localtime(end_at)
+            return None, (f"มีการจองอุปกรณ์ชิ้นนี้ทับช่วง {local_start:%d/%m/%Y %H:%M} "
+                          f"ถึง {local_end:%d/%m/%Y %H:%M} แล้ว กรุณาเลือกช่วงอื่น")
+        window = _maintenance_overlapping([current.pk], start_at, end_at).first()
+        if window:
+            return None, _maintenance_error(window)
+        loan = Loan.objects.create(
+            asset=asset,
+            borrower=borrower,
+            reason=reason,
+            start_date=start_date,
+            due_date=due_date,
+            start_at=start_at,
+            end_at=end_at,
+            status='pending',
+        )
+        _cas_update(Asset, current.pk, current.version)
+        record_event(loan, 'requested', '', 'pending', actor=borrower)
+        # เพิ่มตัวนับก่อนแล้วตรวจ: เกินโควตา -> rollback ทั้งคำขอ
+        quotas.shift([quotas.loan_key(loan)], +1)
+        errors = quotas.violations([borrower], [loan.organization_id]).get(borrower.pk)
+        if errors:
+            transaction.set_rollback(True)
+            return None, errors[0]
+        availability.bump_item(asset.item_id)
+        return loan, None
+
+    result = _with_retry(attempt)
+    if result[0] is False:   # retry หมดโควตา
+        return None, result[1]
+    return result
+
+
+def request_bundle(assets, borrower, start_date, due_date, reason='', start_at=None, end_at=None):
+    """
+    ยืมหลายอุปกรณ์เป็นชุดเดียว (pending ทั้งชุด) คืน (bundle, error) ชิ้นใดชนช่วง -> ไม่สร้างเลยสักชิ้น
+    - ตรวจทับช่วงของทุกชิ้นด้วย query เดียว (asset_id IN ...)
+    - ขยับ version ของ asset เรียงตาม id เสมอ: สองชุดที่มีอุปกรณ์ซ้ำกันล็อกแถวในลำดับเดียวกัน ไม่ deadlock
+    """
+    if start_at is None or end_at is None:
+        start_at, end_at = day_range(start_date, due_date)
+    asset_ids = sorted({a.pk for a in assets})
+
+    def attempt():
+        current = list(
+            Asset.objects.filter(pk__in=asset_ids).order_by('pk')
+            .select_related('item')
+            .only('id', 'version', 'organization_id', 'serial_number', 'device_id', 'item__id', 'item__name')
+        )
+        if len(current) != len(asset_ids):
+            return None, "มีอุปกรณ์ในตะกร้าที่ไม่มีอยู่แล้ว กรุณาตรวจสอบตะกร้าอีกครั้ง"
+        clashing = set(
+            Loan.objects.filter(
+                asset_id__in=asset_ids, status__in=BLOCKING_STATUSES,
+                start_at__lt=end_at, end_at__gt=start_at,
+            ).values_list('asset_id', flat=True)
+        )
+        clashing |= set(_maintenance_overlapping(asset_ids, start_at, end_at).values_list('asset_id', flat=True))
+        if clashing:
+            names = ", ".join(f"{a.item.name} ({a.serial_number or a.device_id or a.pk})" for a in current if a.pk in clashing)
+            return None, f"อุปกรณ์ต่อไปนี้ถูกจองหรือมีกำหนดบำรุงรักษาทับช่วงแล้ว: {names} กรุณาเลือกช่วงอื่นหรือนำออกจากตะกร้า"
+
+        for asset in current:   # ลำดับ id คงที่
+            _cas_update(Asset, asset.pk, asset.version)
+
+        now = timezone.now()
+        bundle = LoanBundle.objects.create(borrower=borrower, reason=reason)
+        loans = [
+            Loan(
+                asset=asset, borrower=borrower, organization_id=asset.organization_id, reason=reason,
+                start_date=start_date, due_date=due_date, start_at=start_at, end_at=end_at,
+                status='pending', bundle=bundle,
+            )
+            for asset in current
+        ]
+        Loan.objects.bulk_create(loans)
+        LoanEvent.objects.bulk_create([
+            LoanEvent(**_event_fields(loan, 'requested', '', 'pending', borrower, now)) for loan in loans
+        ])
+        quotas.shift([quotas.loan_key(loan) for loan in loans], +1)
+        errors = quotas.violations([borrower], {loan.organization_id for loan in loans}).get(borrower.pk)
+        if errors:
+            transaction.set_rollback(True)
+            return None, errors[0]
+        for item_id in {asset.item_id for asset in current}:
+            availability.bump_item(item_id)
+        return bundle, None
+
+    result = _with_retry(attempt)
+    if result[0] is False:   # retry หมดโควตา
+        return None, result[1]
+    return result
+
+
+def approve_loan(loan: Loan, actor=None):
+    """อนุมัติ -> approved + approved_at (กันทับช่วงกับรายการที่อนุมัติแล้ว)"""
+    return transition(loan, 'approve', actor)
+
+def reject_loan(loan: Loan, actor=None):
+    return transition(loan, 'reject', actor)
+
+def start_loan(loan: Loan, actor=None):
+    """รับของจริง -> pickup_date และ asset เป็น on_loan"""
+    return transition(loan, 'pickup', actor)
+
+def return_loan(loan: Loan, actor=None):
+    """รับคืน -> returned และปล่อย asset กลับ available (ถ้ารับของไปแล้ว)"""
+    return transition(loan, 'return', actor)
+
+
+# -------------------------------------------------------------------
+# บำรุงรักษาตามกำหนด: กันช่วงเหมือนการจอง + sweep เปลี่ยนสถานะอุปกรณ์เป็นชุด
+# -------------------------------------------------------------------
+def schedule_maintenance(asset: Asset, start_at, end_at, reason='', actor=None):
+    """
+    กำหนดช่วงบำรุงรักษา คืน (window, error)
+    ทับกับคำขอ/รายการยืมที่ยังกันช่วงอยู่ไม่ได้ (ให้แอดมินปฏิเสธ/เลื่อนก่อน)
+    ขยับ version ของ asset เหมือน request_loan: คำขอยืมที่แข่งกันจะชนแล้วตรวจใหม่
+    """
+    def attempt():
+        current = Asset.objects.only('id', 'version').get(pk=asset.pk)
+        clashing = _overlapping(current.pk, start_at, end_at, BLOCKING_STATUSES).count()
+        if clashing:
+            return None, f"มีรายการยืม {clashing} รายการทับช่วงนี้ กรุณาปฏิเสธหรือเลื่อนรายการเหล่านั้นก่อน"
+        if _maintenance_overlapping([current.pk], start_at, end_at).exists():
+            return None, "ทับกับช่วงบำรุงรักษาที่กำหนดไว้แล้ว"
+        window = MaintenanceWindow.objects.create(
+            asset=asset, start_at=start_at, end_at=end_at, reason=reason, created_by=actor,
+        )
+        _cas_update(Asset, current.pk, current.version)
+        intervals.invalidate(asset.pk)
+        availability.bump_item(asset.item_id)
+        return window, None
+
+    result = _with_retry(attempt)
+    if result[0] is False:
+        return None, result[1]
+    return result
+
+
+def cancel_maintenance(window: MaintenanceWindow, now=None):
+    """ยกเลิกช่วงที่ยังไม่เริ่ม หรือจบช่วงที่กำลังทำอยู่ทันที (คืนอุปกรณ์ใน sweep)"""
+    now = now or timezone.now()
+    with transaction.atomic():
+        if MaintenanceWindow.objects.filter(pk=window.pk, status='scheduled').update(status='cancelled'):
+            window.status = 'cancelled'
+        elif MaintenanceWindow.objects.filter(pk=window.pk, status='active').update(end_at=now):
+            window.end_at = now
+            sweep_maintenance(now)
+        else:
+            return False
+        intervals.invalidate(window.asset_id)
+        availability.bump_item(window.asset.item_id)
+    return True
+
+
+def sweep_maintenance(now=None):
+    """
+    เปลี่ยนสถานะอุปกรณ์ตามช่วงบำรุงรักษาที่ถึงเวลา ด้วย UPDATE เป็นชุด + นับตัวนับของ item ครั้งเดียว
+    (ไม่ผ่าน Asset.save() ที่นับใหม่ทีละแถว) คืน (จำนวนช่วงที่เริ่ม, จำนวนช่วงที่จบ)
+    - เริ่ม: เฉพาะอุปกรณ์ที่ available อยู่ (ถูกยืมอยู่/ปิดใช้งาน -> รอ sweep รอบถัดไป)
+    - จบ: คืนเป็น available เมื่อไม่มีช่วงอื่นที่ยังทำอยู่ และยังเป็น maintenance (ไม่ทับการแก้ด้วยมือ)
+    """
+    now = now or timezone.now()
+    with transaction.atomic():
+        starting = list(
+            MaintenanceWindow.objects.filter(status='scheduled', start_at__lte=now, end_at__gt=now)
+            .values_list('id', 'asset_id')
+        )
+        free_ids = set(
+            Asset.objects.filter(pk__in={asset_id for _, asset_id in starting}, status='available')
+            .values_list('id', flat=True)
+        )
+        Asset.objects.filter(pk__in=free_ids, status='available').update(
+            status='maintenance', version=F('version') + 1
+        )
+        started = MaintenanceWindow.objects.filter(
+            pk__in=[pk for pk, asset_id in starting if asset_id in free_ids]
+        ).update(status='active')
+
+        ending = list(
+            MaintenanceWindow.objects.filter(status='active', end_at__lte=now).values_list('id', 'asset_id')
+        )
+        MaintenanceWindow.objects.filter(pk__in=[pk for pk, _ in ending]).update(status='done')
+        still_active = set(
+            MaintenanceWindow.objects.filter(asset_id__in={a for _, a in ending}, status='active')
+            .values_list('asset_id', flat=True)
+        )
+        release_ids = {asset_id for _, asset_id in ending} - still_active
+        Asset.objects.filter(pk__in=release_ids, status='maintenance').update(
+            status='available', version=F('version') + 1
+        )
+        # ไม่เคยได้เริ่ม (อุปกรณ์ไม่ว่างตลอดช่วง) -> จบไปเลย
+        MaintenanceWindow.objects.filter(status='scheduled', end_at__lte=now).update(status='done')
+
+        recount_items(Asset.objects.filter(pk__in=free_ids | release_ids).values_list('item_id', flat=True))
+    return started, len(ending)
+
+
+# -------------------------------------------------------------------
+# Waitlist: คิวรอเมื่อช่วงวันที่ถูกจองหมด
+# -------------------------------------------------------------------
+def join_waitlist(item: Item, user, start_date, due_date, reason='', priority=0, start_at=None, end_at=None):
+    """
+    เข้าคิวรอของ item สำหรับช่วงวันที่นี้ คืน (entry, created) เข้าซ้ำช่วงเดิมได้ entry เดิม
+    จองรายชั่วโมงส่ง start_at/end_at มาด้วย ให้คิวที่เลื่อนได้ช่วงเวลาเดิม ไม่ใช่ทั้งวัน
+    """
+    return WaitlistEntry.objects.get_or_create(
+        item=item, user=user, start_date=start_date, due_date=due_date, start_at=start_at, end_at=end_at,
+        status='waiting', defaults={'reason': reason, 'priority': priority},
+    )
+
+
+def cancel_waitlist(entry: WaitlistEntry):
+    return WaitlistEntry.objects.filter(pk=entry.pk, status='waiting').update(status='cancelled') == 1
+
+
+def promote_waitlist(asset: Asset, today=None):
+    """
+    เลื่อนหัวคิวของ item ที่ลงช่วงว่างของ asset ชิ้นนี้ได้ เป็นคำขอยืม (pending) ตามลำดับคิว
+    ต้องเรียกภายใน transaction ของการคืน/ปฏิเสธ คืนจำนวนคิวที่เลื่อน
+    """
+    today = today or timezone.localdate()
+    head = list(
+        WaitlistEntry.objects.filter(item_id=asset.item_id, status='waiting', start_date__gte=today)
+        .select_related('user')
+        .order_by('-priority', 'created_at')[:getattr(settings, 'WAITLIST_PROMOTE_SCAN', 20)]
+    )
+    if not head:
+        return 0
+
+    now = timezone.now()
+    promoted = []
+    for entry in head:
+        start_at, end_at = entry.time_range()
+        if (_overlapping(asset.pk, start_at, end_at, BLOCKING_STATUSES).exists()
+                or _maintenance_overlapping([asset.pk], start_at, end_at).exists()):
+            continue
+        loan = Loan(
+            asset=asset,
+            organization_id=asset.organization_id,
+            borrower_id=entry.user_id,
+            reason=entry.reason,
+            start_date=entry.start_date,
+            due_date=entry.due_date,
+            start_at=start_at,
+            end_at=end_at,
+            status='pending',
+        )
+        # เพิ่มตัวนับก่อนแล้วตรวจเหมือน request_loan: เกินโควตา -> คืนตัวนับ ข้ามคิวนี้ (ยังรออยู่ ไม่สร้าง loan)
+        quotas.shift([quotas.loan_key(loan)], +1)
+        if quotas.violations([entry.user], [asset.organization_id]).get(entry.user_id):
+            quotas.shift([quotas.loan_key(loan)], -1)
+            continue
+        loan.save()
+        record_event(loan, 'requested', '', 'pending', at=now)
+        updated = WaitlistEntry.objects.filter(pk=entry.pk, status='waiting').update(
+            status='promoted', loan=loan, promoted_at=now
+        )
+        if not updated:   # ถูกยกเลิกพร้อมกัน
+            raise StaleVersion(f"WaitlistEntry #{entry.pk}")
+        promoted.append(entry)
+
+    if promoted:
+        # ขยับ version ของ asset: request_loan ที่อ่าน version เดิมไว้จะชนแล้วตรวจทับช่วงใหม่
+        Asset.objects.filter(pk=asset.pk).update(version=F('version') + 1)
+        asset.version += 1
+        enqueue('notifications.send_many', {'pairs': [
+            [entry.user_id,
+             f'ได้คิวยืม "{asset.item.name}" ช่วง {entry.start_date:%d/%m/%Y} - {entry.due_date:%d/%m/%Y} แล้ว '
+             f'ระบบส่งคำขอยืมให้อัตโนมัติ โปรดรอแอดมินอนุมัติ']
+            for entry in promoted
+        ]})
+    return len(promoted)
+
+
+def expire_waitlist(today=None):
+    """คิวที่เลยวันเริ่มใช้ไปแล้วโดยไม่ได้คิว -> expired คืนจำนวนที่เปลี่ยน"""
+    today = today or timezone.localdate()
+    return WaitlistEntry.objects.filter(status='waiting', start_date__lt=today).update(status='expired')
+
+
+def mark_overdue_loans(now=None):
+    """
+    approved ที่เลยกำหนดคืน -> overdue คืนจำนวนที่เปลี่ยน
+    เทียบด้วย end_at: จองรายชั่วโมงเกินกำหนดทันทีที่เลยเวลาสิ้นสุด (จองทั้งวัน end_at คือ 00:00 ของวันถัดจากวันคืน)
+    """
+    now = now or timezone.now()
+    candidates = list(
+        Loan.objects.filter(status='approved', end_at__lt=now)
+        .select_related('asset__item')
+    )
+    events = []
+    with transaction.atomic():
+        for loan in candidates:
+            # แถวที่ถูกแก้พร้อมกัน (เช่น เพิ่งคืน) จะไม่ตรง version/สถานะ ก็ข้ามไป รอบหน้าค่อยดูใหม่
+            updated = Loan.objects.filter(pk=loan.pk, version=loan.version, status='approved').update(
+                status='overdue', version=F('version') + 1
+            )
+            if updated:
+                events.append(LoanEvent(**_event_fields(loan, 'overdue', 'approved', 'overdue', at=now)))
+        LoanEvent.objects.bulk_create(events)
+        for item_id in {loan.asset.item_id for loan in candidates}:
+            availability.bump_item(item_id)
+    return len(events)
+
+
+# -------------------------------------------------------------------
+# Scan station: รับ/คืนเป็นชุดจากการสแกนบาร์โค้ด/QR
+# -------------------------------------------------------------------
+SCAN_MODES = ('auto', 'pickup', 'return')
+
+
+def _scan_result(code, ok, action=None, loan=None, error=None):
+    return {
+        'code': code,
+        'ok': ok,
+        'action': action,
+        'loan_id': loan.pk if loan else None,
+        'item': loan.asset.item.name if loan else None,
+        'borrower': loan.borrower.username if loan else None,
+        'borrower_id': loan.borrower_id if loan else None,
+        'error': error,
+    }
+
+
+def _plan_scans(codes, org, mode, today):
+    """จับคู่รหัสที่สแกนกับ (action, loan) ด้วย query ของ asset 1 ครั้ง + loan 1 ครั้ง"""
+    tolerance = timedelta(days=getattr(settings, 'PICKUP_TOLERANCE_DAYS', 0))
+    # serial_number/device_id เป็น unique (มี index) -> ค้นทั้งชุดใน query เดียว
+    assets = list(
+        Asset.objects.for_org(org)
+        .filter(Q(serial_number__in=codes) | Q(device_id__in=codes))
+        .select_related('item')
+    )
+    by_code, by_pk = {}, {a.pk: a for a in assets}
+    for asset in assets:
+        for code in (asset.serial_number, asset.device_id):
+            if code:
+                by_code[code] = asset
+
+    loans_by_asset = {}
+    open_loans = (
+        Loan.objects.filter(asset_id__in=list(by_pk), status__in=ACTIVE_STATUSES)
+        .select_related('borrower')
+        .order_by('start_date', 'pk')
+    )
+    for loan in open_loans:
+        loan.asset = by_pk[loan.asset_id]
+        loans_by_asset.setdefault(loan.asset_id, []).append(loan)
+
+    plan, seen = [], set()
+    for code in codes:
+        asset = by_code.get(code)
+        if asset is None:
+            plan.append((code, None, None, "ไม่พบอุปกรณ์รหัสนี้ในองค์กร"))
+            continue
+        if asset.pk in seen:
+            plan.append((code, None, None, "สแกนอุปกรณ์ชิ้นนี้ซ้ำในชุดเดียวกัน"))
+            continue
+        seen.add(asset.pk)
+        candidates = loans_by_asset.get(asset.pk, [])
+
+        if asset.status == 'on_loan' and mode in ('auto', 'return'):
+            loan = next((l for l in candidates if l.pickup_date), None)
+            if loan:
+                plan.append((code, 'return', loan, None))
+            else:
+                plan.append((code, None, None, "ไม่พบรายการยืมที่รับของไปแล้วของอุปกรณ์นี้"))
+        elif asset.status == 'available' and mode in ('auto', 'pickup'):
+            loan = next(
+                (l for l in candidates if l.status == 'approved' and not l.pickup_date
+                 and (not l.start_date or today >= l.start_date - tolerance)),
+                None,
+            )
+            if loan:
+                plan.append((code, 'pickup', loan, None))
+            else:
+                plan.append((code, None, None, "ไม่มีรายการที่อนุมัติแล้วและถึงวันรับของสำหรับอุปกรณ์นี้"))
+        else:
+            plan.append((code, None, None, f"สแกนไม่ได้ในสถานะ {asset.get_status_display()}"))
+    return plan
+
+
+def _apply_scans(actions, actor, now):
+    """
+    เขียนทั้งชุดด้วย UPDATE แบบมีเงื่อนไขต่อกลุ่ม (ไม่ใช่ทีละแถว)
+    ถ้าจำนวนแถวที่อัปเดตไม่ครบ แปลว่ามีคนแก้ไปก่อน -> StaleVersion ให้วางแผนใหม่ทั้งชุด
+    """
+    pickups = [loan for action, loan in actions if action == 'pickup']
+    returns = [loan for action, loan in actions if action == 'return']
+
+    def guarded(qs, expected, **changes):
+        if expected and qs.update(version=F('version') + 1, **changes) != expected:
+            raise StaleVersion("scan batch")
+
+    guarded(
+        Loan.objects.filter(pk__in=[l.pk for l in pickups], status='approved', pickup_date__isnull=True),
+        len(pickups), pickup_date=now,
+    )
+    guarded(
+        Asset.objects.filter(pk__in=[l.asset_id for l in pickups], status='available'),
+        len(pickups), status='on_loan',
+    )
+    guarded(
+        Loan.objects.filter(pk__in=[l.pk for l in returns], status__in=ACTIVE_STATUSES,
+                            pickup_date__isnull=False),
+        len(returns), status='returned', return_date=now,
+    )
+    guarded(
+        Asset.objects.filter(pk__in=[l.asset_id for l in returns], status='on_loan'),
+        len(returns), status='available',
+    )
+
+    # ตัวนับของ item: รวม delta ต่อ item แล้ว UPDATE ครั้งเดียวต่อ item
+    deltas = {}
+    for loan in pickups:
+        deltas[loan.asset.item_id] = deltas.get(loan.asset.item_id, 0) - 1
+    for loan in returns:
+        deltas[loan.asset.item_id] = deltas.get(loan.asset.item_id, 0) + 1
+    for item_id, delta in deltas.items():
+        if delta:
+            _shift_available(item_id, delta)
+
+    events = []
+    for action, loan in actions:
+        if action == 'pickup':
+            events.append(LoanEvent(**_event_fields(loan, 'picked_up', 'approved', 'approved', actor, now)))
+        else:
+            events.append(LoanEvent(**_event_fields(loan, 'returned', loan.status, 'returned', actor, now)))
+    LoanEvent.objects.bulk_create(events)
+
+    quotas.release(returns)
+    for loan in returns:
+        promote_waitlist(loan.asset)
+    for item_id in {loan.asset.item_id for _, loan in actions}:
+        availability.bump_item(item_id)
+
+
+def scan_batch(codes, org, actor=None, mode='auto', today=None):
+    """
+    รับรหัส serial_number/device_id ที่สแกนมาเป็นชุด แล้วรับของ/รับคืนทั้งหมดใน transaction เดียว
+    mode: 'auto' (ดูจากสถานะอุปกรณ์), 'pickup' หรือ 'return'
+    คืน list ผลลัพธ์ต่อรหัส (เรียงตามลำดับที่สแกน)
+    """
+    if mode not in SCAN_MODES:
+        raise ValueError(f"ไม่รู้จักโหมด '{mode}'")
+    codes = [c.strip() for c in codes if c and c.strip()]
+    if not codes:
+        return []
+    today = today or timezone.localdate()
+
+    for _ in range(MAX_RETRIES):
+        plan = _plan_scans(codes, org, mode, today)
+        actions = [(action, loan) for _, action, loan, _ in plan if action]
+        now = timezone.now()
+        try:
+            with transaction.atomic():
+                _apply_scans(actions, actor, now)
+            break
+        except StaleVersion:
+            continue
+    else:
+        return [_scan_result(code, False, error="มีการแก้ไขรายการพร้อมกัน กรุณาสแกนชุดนี้ใหม่")
+                for code in codes]
+
+    results = []
+    for code, action, loan, error in plan:
+        if action == 'pickup':
+            loan.pickup_date = now
+        elif action == 'return':
+            loan.status, loan.return_date = 'returned', now
+        results.append(_scan_result(code, bool(action), action, loan, error))
+    return results
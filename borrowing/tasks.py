@@ -0,0 +1,102 @@
+# borrowing/tasks.py
+"""งานเบื้องหลังของระบบยืม-คืน (ลงทะเบียนตอน BorrowingConfig.ready)"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from users.notifications import create_notifications, purge_notifications
+from .jobs import job, enqueue
+from .models import Job
+from . import services, projections, reminders, mailer, autoapprove
+
+
+# -------------------------------------------------------------------
+# แจ้งเตือน
+# -------------------------------------------------------------------
+@job('notifications.send')
+def send_notifications(user_ids, message):
+    create_notifications([(uid, message) for uid in user_ids])
+
+
+def notify(users, message):
+    """ให้ view เรียก: ตั้งคิวส่งแจ้งเตือน (รับ user เดียว, list หรือ queryset)"""
+    if hasattr(users, 'values_list'):
+        user_ids = list(users.values_list('id', flat=True))
+    elif hasattr(users, 'pk'):
+        user_ids = [users.pk]
+    else:
+        user_ids = [getattr(u, 'pk', u) for u in users]
+    if user_ids:
+        enqueue('notifications.send', {'user_ids': user_ids, 'message': message})
+
+
+@job('notifications.send_many')
+def send_notification_batch(pairs):
+    create_notifications(pairs)
+
+
+def notify_many(pairs):
+    """ตั้งคิวแจ้งเตือนหลายข้อความในงานเดียว: pairs = [(user หรือ user_id, message), ...]"""
+    pairs = [[getattr(u, 'pk', u), message] for u, message in pairs]
+    if pairs:
+        enqueue('notifications.send_many', {'pairs': pairs})
+
+
+@job('notifications.email', every=timedelta(minutes=1), atomic=False)
+def email_notifications():
+    """
+    ส่งอีเมลของ Notification ที่ค้าง (ไม่ทำอะไรถ้า NOTIFICATION_EMAIL_ENABLED = False)
+    atomic=False: ไม่ถือ transaction ระหว่างคุยกับ SMTP; รายการที่ส่งแล้วถูกบันทึกทันที ไม่ส่งซ้ำตอน retry
+    """
+    mailer.deliver_pending(max_batches=getattr(settings, 'EMAIL_MAX_BATCHES_PER_RUN', 10))
+
+
+# -------------------------------------------------------------------
+# งานตามรอบ
+# -------------------------------------------------------------------
+@job('loans.mark_overdue', every=timedelta(hours=1))
+def mark_overdue():
+    services.mark_overdue_loans()
+
+
+@job('loans.send_reminders', every=timedelta(hours=1))
+def send_due_reminders():
+    # มี watermark ต่อรายการ จึงรันถี่ได้โดยไม่ส่งซ้ำ
+    reminders.send_due_reminders()
+
+
+@job('loans.auto_approve', every=timedelta(minutes=5))
+def auto_approve_loans():
+    # คำขอที่ส่งมาก่อนสร้างกฎ หรือเคยชนช่วง/เกินโควตาแล้วตอนนี้ผ่านแล้ว
+    autoapprove.run_all()
+
+
+@job('maintenance.sweep', every=timedelta(minutes=5))
+def sweep_maintenance():
+    services.sweep_maintenance()
+
+
+@job('waitlist.expire', every=timedelta(days=1))
+def expire_waitlist():
+    services.expire_waitlist()
+
+
+@job('projections.update', every=timedelta(minutes=1))
+def update_projections():
+    projections.update_projections()
+
+
+@job('notifications.purge', every=timedelta(days=1))
+def purge_old_notifications():
+    """ลบ/ย้ายเข้าคลัง แจ้งเตือนที่อ่านแล้วเก่ากว่า NOTIFICATION_RETENTION_DAYS (ทีละก้อน)"""
+    purge_notifications()
+
+
+@job('jobs.purge', every=timedelta(days=1))
+def purge_finished_jobs():
+    """ลบงานที่เสร็จแล้วเก่ากว่า JOB_RETENTION_DAYS (งานที่ล้มเหลวเก็บไว้ตรวจสอบ)"""
+    days = getattr(settings, 'JOB_RETENTION_DAYS', 7)
+    Job.objects.filter(
+        status='done', finished_at__lt=timezone.now() - timedelta(days=days)
+    ).delete()
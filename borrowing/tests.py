@@ -1,3 +1,412 @@
-from django.test import TestCase
+import smtplib
+import socket
+import unittest
+from datetime import time, timedelta
 
-# Create your tests here.
+from django.core import mail
+from django.core.mail.backends.locmem import EmailBackend
+from django.db import transaction
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from users.models import CustomUser, Notification, Organization
+from users.notifications import create_notifications
+
+from . import jobs, mailer, projections, quotas, recurrence, services
+from .models import (
+    Asset, AssetReservationState, DailyLoanRollup, Item, ItemCategory, Job, Loan, LoanBundle,
+    LoanEvent, OrgLoanStats, QuotaPolicy, RecurringReservation, UserLoanCounter,
+)
+
+try:
+    from aiosmtpd.controller import Controller
+except ImportError:   # ไม่บังคับติดตั้ง: ข้ามเทสต์ที่ใช้ SMTP จำลองจริง
+    Controller = None
+
+
+class FlakyBackend(EmailBackend):
+    """locmem ที่ส่งได้ limit ฉบับแล้ว SMTP ล่ม (จำลองเซิร์ฟเวอร์หลุดกลางชุด)"""
+    limit = 2
+
+    def send_messages(self, messages):
+        if len(mail.outbox) >= self.limit:
+            raise smtplib.SMTPServerDisconnected('down')
+        return super().send_messages(messages)
+
+
+@override_settings(
+    NOTIFICATION_EMAIL_ENABLED=True, EMAIL_RATE_PER_SECOND=0, EMAIL_BATCH_SIZE=10,
+    EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+)
+class MailerTests(TestCase):
+    def setUp(self):
+        org = Organization.objects.create(name='Org', address='-')
+        self.user = CustomUser.objects.create_user('mailuser', email='mailuser@example.com', organization=org)
+        self.no_email = CustomUser.objects.create_user('noemail', email='', organization=org)
+
+    def test_claims_sends_and_marks_each_notification(self):
+        for i in range(3):
+            Notification.objects.create(user=self.user, message=f'ข้อความ {i}')
+        Notification.objects.create(user=self.no_email, message='ไม่มีอีเมล')
+
+        self.assertEqual(mailer.deliver_pending(), 3)
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(mail.outbox[0].to, ['mailuser@example.com'])
+        self.assertFalse(Notification.objects.filter(user=self.user, emailed_at__isnull=True).exists())
+        # รอบถัดไปไม่มีอะไรให้ส่งซ้ำ
+        self.assertEqual(mailer.deliver_pending(), 0)
+        self.assertEqual(len(mail.outbox), 3)
+
+    @override_settings(EMAIL_BACKEND='borrowing.tests.FlakyBackend')
+    def test_smtp_failure_releases_unsent_claims(self):
+        for i in range(5):
+            Notification.objects.create(user=self.user, message=f'ข้อความ {i}')
+
+        with self.assertRaises(smtplib.SMTPServerDisconnected):
+            mailer.deliver_batch()
+        sent = Notification.objects.filter(emailed_at__isnull=False)
+        unsent = Notification.objects.filter(emailed_at__isnull=True)
+        self.assertEqual(sent.count(), 2)
+        # claim ของฉบับที่ยังไม่ส่งถูกปล่อย รอบ retry หยิบได้ทันที
+        self.assertFalse(unsent.filter(email_claimed_at__isnull=False).exists())
+
+        with override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend'):
+            self.assertEqual(mailer.deliver_pending(), 3)
+        self.assertEqual(len(mail.outbox), 5)
+
+    def test_coalesced_repeat_is_emailed_again(self):
+        create_notifications([(self.user.pk, 'ใกล้ถึงกำหนดคืน')])
+        mailer.deliver_pending()
+        create_notifications([(self.user.pk, 'ใกล้ถึงกำหนดคืน')])
+
+        self.assertEqual(mailer.deliver_pending(), 1)
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertIn('แจ้งซ้ำ 2 ครั้ง', mail.outbox[1].body)
+
+    @override_settings(NOTIFICATION_EMAIL_ENABLED=False)
+    def test_disabled_sends_nothing(self):
+        Notification.objects.create(user=self.user, message='x')
+        self.assertEqual(mailer.deliver_pending(), 0)
+        self.assertEqual(mail.outbox, [])
+
+
+@unittest.skipIf(Controller is None, 'ต้องติดตั้ง aiosmtpd')
+@override_settings(
+    NOTIFICATION_EMAIL_ENABLED=True, EMAIL_RATE_PER_SECOND=0,
+    EMAIL_BACKEND='django.core.mail.backends.smtp.EmailBackend',
+    EMAIL_HOST='127.0.0.1', EMAIL_USE_TLS=False, EMAIL_HOST_USER='', EMAIL_HOST_PASSWORD='',
+)
+class MailerSmtpTests(TestCase):
+    """ส่งผ่าน SMTP จริงไปยัง aiosmtpd ในโปรเซสเดียวกัน (เหมือน python -m aiosmtpd -n ตอนพัฒนา)"""
+
+    class Handler:
+        def __init__(self):
+            self.envelopes = []
+
+        async def handle_DATA(self, server, session, envelope):
+            self.envelopes.append(envelope)
+            return '250 OK'
+
+    def setUp(self):
+        self.handler = self.Handler()
+        with socket.socket() as probe:   # หาพอร์ตว่าง (Controller ต้องรู้พอร์ตก่อน start)
+            probe.bind(('127.0.0.1', 0))
+            self.port = probe.getsockname()[1]
+        self.controller = Controller(self.handler, hostname='127.0.0.1', port=self.port)
+        self.controller.start()
+        self.addCleanup(self.controller.stop)
+        org = Organization.objects.create(name='Org', address='-')
+        self.user = CustomUser.objects.create_user('smtpuser', email='smtpuser@example.com', organization=org)
+
+    def test_delivers_over_smtp(self):
+        Notification.objects.create(user=self.user, message='ทดสอบ SMTP')
+        with override_settings(EMAIL_PORT=self.port):
+            self.assertEqual(mailer.deliver_pending(), 1)
+        self.assertEqual(len(self.handler.envelopes), 1)
+        self.assertEqual(self.handler.envelopes[0].rcpt_tos, ['smtpuser@example.com'])
+
+
+# -------------------------------------------------------------------
+# คิวงาน (borrowing/jobs.py)
+# -------------------------------------------------------------------
+@jobs.job('tests.noop')
+def _noop_job():
+    pass
+
+
+@jobs.job('tests.always_fails', max_attempts=2)
+def _failing_job():
+    raise RuntimeError('boom')
+
+
+@override_settings(JOBS_EAGER=False, JOB_RETRY_BASE_SECONDS=10, JOB_RETRY_MAX_SECONDS=3600)
+class JobQueueTests(TestCase):
+    def test_claim_next_takes_due_job_once(self):
+        due = jobs.enqueue('tests.noop')
+        jobs.enqueue('tests.noop', run_at=timezone.now() + timedelta(hours=1))
+
+        claimed = jobs.claim_next('w1')
+        self.assertEqual(claimed.pk, due.pk)
+        self.assertEqual((claimed.status, claimed.locked_by, claimed.attempts), ('running', 'w1', 1))
+        # งานที่ถูกหยิบแล้ว/ยังไม่ถึงเวลา ไม่ถูกหยิบซ้ำ
+        self.assertIsNone(jobs.claim_next('w2'))
+
+        self.assertTrue(jobs.run_job(claimed))
+        self.assertEqual(Job.objects.get(pk=due.pk).status, 'done')
+
+    def test_failed_job_is_retried_with_backoff_then_fails(self):
+        queued = jobs.enqueue('tests.always_fails')
+        before = timezone.now()
+
+        self.assertFalse(jobs.run_job(jobs.claim_next('w1')))
+        retry = Job.objects.get(pk=queued.pk)
+        self.assertEqual((retry.status, retry.attempts, retry.locked_by), ('queued', 1, ''))
+        self.assertGreaterEqual(retry.run_at, before + timedelta(seconds=10))
+        self.assertIn('boom', retry.last_error)
+        self.assertIsNone(jobs.claim_next('w1'))   # ยังไม่ถึงเวลาลองใหม่
+
+        Job.objects.filter(pk=queued.pk).update(run_at=timezone.now())
+        self.assertFalse(jobs.run_job(jobs.claim_next('w1')))
+        final = Job.objects.get(pk=queued.pk)
+        self.assertEqual((final.status, final.attempts), ('failed', 2))
+        self.assertIsNotNone(final.finished_at)
+
+    def test_backoff_delay_doubles_up_to_cap(self):
+        for attempts, low in ((1, 10), (2, 20), (4, 80)):
+            delay = jobs.backoff_delay(attempts).total_seconds()
+            self.assertTrue(low <= delay < low + 10, (attempts, delay))
+        self.assertLess(jobs.backoff_delay(50).total_seconds(), 3600 + 10)
+
+    def test_schedule_periodic_enqueues_once_per_slot(self):
+        now = timezone.now()
+        count = jobs.schedule_periodic(now)
+        self.assertEqual(count, sum(1 for spec in jobs._registry.values() if spec.interval()))
+        self.assertEqual(Job.objects.count(), count)
+
+        # worker อื่นเรียกซ้ำในช่วงเวลาเดียวกัน -> ไม่เกิดงานซ้ำ
+        jobs.schedule_periodic(now)
+        self.assertEqual(Job.objects.count(), count)
+        self.assertEqual(Job.objects.filter(name='notifications.email').count(), 1)
+
+        # ช่วงถัดไปของงานรายนาที -> ตั้งคิวใหม่
+        jobs.schedule_periodic(now + timedelta(minutes=1))
+        self.assertEqual(Job.objects.filter(name='notifications.email').count(), 2)
+
+
+# -------------------------------------------------------------------
+# ข้อมูลตั้งต้นของเทสต์ฝั่งการยืม
+# -------------------------------------------------------------------
+class LoanFixtureMixin:
+    def setUp(self):
+        self.org = Organization.objects.create(name='Lab', address='-')
+        self.admin = CustomUser.objects.create_user('labadmin', email='', organization=self.org, is_org_admin=True)
+        self.user = CustomUser.objects.create_user('borrower', email='', organization=self.org)
+        self.category = ItemCategory.objects.create(name='กล้อง')
+        self.item = Item.objects.create(organization=self.org, name='กล้อง DSLR', category=self.category)
+        self.assets = [
+            Asset.objects.create(item=self.item, serial_number=f'CAM-{i}') for i in range(3)
+        ]
+        self.today = timezone.localdate()
+
+    def days(self, start, length=1):
+        start_date = self.today + timedelta(days=start)
+        return start_date, start_date + timedelta(days=length - 1)
+
+    def request(self, asset, start=1, length=1, user=None):
+        loan, error = services.request_loan(asset, user or self.user, *self.days(start, length))
+        self.assertIsNone(error)
+        return loan
+
+
+@override_settings(JOBS_EAGER=False)
+class OptimisticConcurrencyTests(LoanFixtureMixin, TestCase):
+    def test_cas_update_rejects_lost_update(self):
+        loan = self.request(self.assets[0])
+        first = Loan.objects.get(pk=loan.pk)
+        second = Loan.objects.get(pk=loan.pk)
+
+        services._cas_update(Loan, first.pk, first.version, status='approved')
+        # second อ่านมาก่อนหน้า: เขียนทับไม่ได้
+        with self.assertRaises(services.StaleVersion):
+            services._cas_update(Loan, second.pk, second.version, status='rejected')
+        current = Loan.objects.get(pk=loan.pk)
+        self.assertEqual((current.status, current.version), ('approved', first.version + 1))
+
+    def test_transition_rereads_a_stale_instance(self):
+        loan = self.request(self.assets[0])
+        stale = Loan.objects.get(pk=loan.pk)
+        self.assertEqual(services.approve_loan(loan, actor=self.admin), (True, None))
+
+        # instance เก่ายังเป็น pending แต่ transition อ่านแถวปัจจุบันก่อนตรวจ
+        self.assertEqual(stale.status, 'pending')
+        ok, error = services.approve_loan(stale, actor=self.admin)
+        self.assertFalse(ok)
+        self.assertEqual(error, "สถานะไม่ใช่รอดำเนินการ")
+        self.assertEqual(LoanEvent.objects.filter(loan=loan, kind='approved').count(), 1)
+
+    def test_with_retry_reruns_until_version_matches(self):
+        loan = self.request(self.assets[0])
+        calls = []
+
+        def attempt():
+            current = Loan.objects.get(pk=loan.pk)
+            calls.append(current.version)
+            if len(calls) < 3:
+                # จำลองอีกคำขอแก้แถวไปก่อนระหว่างอ่านกับเขียน
+                Loan.objects.filter(pk=loan.pk).update(version=current.version + 1)
+            services._cas_update(Loan, loan.pk, current.version, reason=f'รอบ {len(calls)}')
+            return True, None
+
+        with transaction.atomic():
+            self.assertEqual(services._with_retry(attempt), (True, None))
+        self.assertEqual(len(calls), 3)
+        self.assertEqual(Loan.objects.get(pk=loan.pk).reason, 'รอบ 3')
+
+    def test_with_retry_gives_up_after_max_retries(self):
+        def attempt():
+            raise services.StaleVersion('always')
+
+        ok, error = services._with_retry(attempt)
+        self.assertFalse(ok)
+        self.assertIn('พร้อมกัน', error)
+
+
+def _snapshot():
+    return (
+        sorted(OrgLoanStats.objects.values_list(
+            'organization_id', 'pending', 'approved', 'overdue', 'returned', 'rejected')),
+        sorted(AssetReservationState.objects.values_list('asset_id', 'open_loans', 'current_loan_id', 'last_event_at')),
+        sorted(DailyLoanRollup.objects.values_list(
+            'organization_id', 'day', 'requested', 'approved', 'picked_up', 'returned', 'rejected', 'overdue')),
+    )
+
+
+@override_settings(JOBS_EAGER=False)
+class ProjectionReplayTests(LoanFixtureMixin, TestCase):
+    def test_incremental_updates_equal_full_replay(self):
+        a, b, c = self.assets
+        picked = self.request(a, start=0)
+        services.approve_loan(picked, actor=self.admin)
+        projections.update_projections(batch_size=2)   # ประมวลผลระหว่างทางเป็นก้อนเล็ก ๆ
+        services.start_loan(picked, actor=self.admin)
+        services.return_loan(picked, actor=self.admin)
+
+        rejected = self.request(b, start=2)
+        services.reject_loan(rejected, actor=self.admin)
+        projections.update_projections(batch_size=3)
+        pending = self.request(c, start=3)
+        approved = self.request(b, start=5)
+        services.approve_loan(approved, actor=self.admin)
+        projections.update_projections(batch_size=2)
+
+        incremental = _snapshot()
+        self.assertEqual(projections.rebuild_projections(), {
+            name: LoanEvent.objects.count() for name in projections._registry
+        })
+        self.assertEqual(_snapshot(), incremental)
+
+        stats = OrgLoanStats.objects.get(organization=self.org)
+        self.assertEqual(
+            (stats.pending, stats.approved, stats.returned, stats.rejected),
+            (1, 1, 1, 1),
+        )
+        self.assertEqual(AssetReservationState.objects.get(asset=c).open_loans, 1)
+        self.assertEqual(pending.status, 'pending')
+
+        # replay ซ้ำอีกรอบต้องได้ค่าเดิม (ไม่นับซ้ำ)
+        projections.rebuild_projections()
+        self.assertEqual(_snapshot(), incremental)
+        self.assertEqual(projections.update_projections(), {name: 0 for name in projections._registry})
+
+
+@override_settings(JOBS_EAGER=False)
+class QuotaCounterTests(LoanFixtureMixin, TestCase):
+    def active(self):
+        return sum(UserLoanCounter.objects.filter(user=self.user).values_list('active', flat=True))
+
+    def test_shift_release_and_reconcile_agree(self):
+        first = self.request(self.assets[0])
+        second = self.request(self.assets[1])
+        self.assertEqual(self.active(), 2)
+        self.assertEqual(quotas.reconcile(dry_run=True), 0)
+
+        services.reject_loan(first, actor=self.admin)
+        self.assertEqual(self.active(), 1)
+        services.approve_loan(second, actor=self.admin)
+        services.return_loan(second, actor=self.admin)
+        self.assertEqual(self.active(), 0)
+        self.assertEqual(quotas.reconcile(dry_run=True), 0)
+
+        # ตัวนับเพี้ยน (เช่นแก้ในหน้าแอดมิน) -> reconcile แก้กลับ
+        quotas.shift([quotas.loan_key(first)], +3)
+        self.assertEqual(quotas.reconcile(), 1)
+        self.assertEqual(self.active(), 0)
+
+    def test_recurring_series_counts_as_one(self):
+        start = self.today + timedelta(days=1)
+        rule = RecurringReservation.objects.create(
+            asset=self.assets[0], organization=self.org, borrower=self.user, freq='daily',
+            dtstart=start, until=start + timedelta(days=3), start_time=time(9), end_time=time(10),
+        )
+        self.assertEqual(recurrence.approve_recurring(rule, actor=self.admin), (True, None))
+        occurrences = list(Loan.objects.filter(recurrence=rule).order_by('start_at'))
+        self.assertEqual(len(occurrences), 4)
+        self.assertEqual(self.active(), 1)
+        self.assertEqual(quotas.reconcile(dry_run=True), 0)
+
+        # ครั้งแรกคืนแล้ว ชุดยังถืออยู่ -> ยังนับ 1
+        services.return_loan(occurrences[0], actor=self.admin)
+        self.assertEqual(self.active(), 1)
+        self.assertEqual(quotas.reconcile(dry_run=True), 0)
+
+        for loan in occurrences[1:]:
+            services.reject_loan(loan, actor=self.admin)
+        self.assertEqual(self.active(), 0)
+        self.assertEqual(quotas.reconcile(dry_run=True), 0)
+
+    def test_quota_blocks_request_over_limit(self):
+        QuotaPolicy.objects.create(organization=self.org, max_loans=1)
+        self.request(self.assets[0])
+        loan, error = services.request_loan(self.assets[1], self.user, *self.days(1))
+        self.assertIsNone(loan)
+        self.assertIn('เกินโควตา', error)
+        self.assertEqual(self.active(), 1)
+
+
+@override_settings(JOBS_EAGER=False)
+class RequestBundleTests(LoanFixtureMixin, TestCase):
+    def assert_nothing_created(self, versions):
+        self.assertFalse(LoanBundle.objects.exists())
+        self.assertFalse(Loan.objects.filter(bundle__isnull=False).exists())
+        self.assertEqual(LoanEvent.objects.filter(loan__bundle__isnull=False).count(), 0)
+        self.assertEqual(dict(Asset.objects.values_list('pk', 'version')), versions)
+
+    def test_bundle_creates_every_loan(self):
+        bundle, error = services.request_bundle(self.assets, self.user, *self.days(1, 2))
+        self.assertIsNone(error)
+        self.assertEqual(bundle.loans.count(), 3)
+        self.assertEqual(LoanEvent.objects.filter(kind='requested').count(), 3)
+
+    def test_conflict_on_one_asset_rolls_back_whole_bundle(self):
+        existing = self.request(self.assets[2], start=2)
+        versions = dict(Asset.objects.values_list('pk', 'version'))
+        events = LoanEvent.objects.count()
+
+        bundle, error = services.request_bundle(self.assets, self.user, *self.days(1, 3))
+        self.assertIsNone(bundle)
+        self.assertIn('CAM-2', error)
+        self.assert_nothing_created(versions)
+        self.assertEqual(list(Loan.objects.values_list('pk', flat=True)), [existing.pk])
+        self.assertEqual(LoanEvent.objects.count(), events)
+
+    def test_quota_violation_rolls_back_whole_bundle(self):
+        QuotaPolicy.objects.create(organization=self.org, category=self.category, max_loans=2)
+        versions = dict(Asset.objects.values_list('pk', 'version'))
+
+        bundle, error = services.request_bundle(self.assets, self.user, *self.days(1))
+        self.assertIsNone(bundle)
+        self.assertIn('เกินโควตา', error)
+        self.assert_nothing_created(versions)
+        self.assertFalse(Loan.objects.exists())
+        self.assertFalse(LoanEvent.objects.exists())
+        self.assertEqual(quotas.reconcile(dry_run=True), 0)
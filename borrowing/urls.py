@@ -12,9 +12,13 @@ urlpatterns = [
 
     path('add-asset/', views.add_asset, name='add_asset'),
     path('delete-asset/<int:asset_id>/', views.delete_asset, name='delete_asset'),
+    path('labels/', views.print_labels, name='print_labels'),
 
     path('approve-loan/<int:loan_id>/', views.approve_loan, name='approve_loan'),
     path('reject-loan/<int:loan_id>/', views.reject_loan, name='reject_loan'),
+    path('scan/', views.scan_station, name='scan_station'),
+    path('auto-approval/', views.auto_approval_rules, name='auto_approval_rules'),
+    path('quotas/', views.quota_policies, name='quota_policies'),
 
     # ---------- หน้ารายการกู้ยืม (ตั้งชื่อให้ตรงกับ base.html) ----------
     # pending
@@ -29,9 +33,25 @@ urlpatterns = [
     path('admin/loan-history/', views.loan_history_admin_view, name='loan_history_admin_view'),
     path('admin/loan-history/', views.loan_history_admin_view, name='loan_history_admin'),  # alias เผื่อชื่อเก่า
 
+    # ---------- โปรไฟล์ request (superuser) ----------
+    path('profiles/', views.profile_list, name='profile_list'),
+    path('profiles/<str:name>/', views.profile_detail, name='profile_detail'),
+
     # ---------- ฝั่งผู้ใช้ทั่วไป ----------
     path('borrow-item/<int:asset_id>/', views.borrow_item, name='borrow_item'),
     path('return-item/<int:loan_id>/', views.return_item, name='return_item'),
+    path('waitlist/<int:entry_id>/cancel/', views.cancel_waitlist, name='cancel_waitlist'),
+    path('borrow-item/<int:asset_id>/recurring/', views.recurring_request, name='recurring_request'),
+    path('catalog/', views.catalog_view, name='catalog_view'),
+    path('cart/', views.cart_view, name='cart_view'),
+    path('cart/add/<int:asset_id>/', views.cart_add, name='cart_add'),
+    path('cart/remove/<int:asset_id>/', views.cart_remove, name='cart_remove'),
+    path('recurring/<int:rule_id>/approve/', views.decide_recurring, {'decision': 'approve'}, name='approve_recurring'),
+    path('recurring/<int:rule_id>/reject/', views.decide_recurring, {'decision': 'reject'}, name='reject_recurring'),
+    path('availability/item/<int:item_id>/', views.item_availability, name='item_availability'),
+    path('availability/asset/<int:asset_id>/', views.asset_availability, name='asset_availability'),
+    path('availability/asset/<int:asset_id>/slots/', views.asset_slots, name='asset_slots'),
+    path('asset/<int:asset_id>/maintenance/', views.asset_maintenance, name='asset_maintenance'),
     path('categories/add/', views.add_category, name='add_category'),
     path('loans/<int:loan_id>/start/', views.start_loan, name='start_loan'),
     
@@ -1,17 +1,33 @@
 # borrowing/views.py
+import json
+from itertools import islice
+
 from django.shortcuts import render, redirect, get_object_or_404
-from django.contrib.auth.decorators import login_required
+from django.http import JsonResponse, StreamingHttpResponse, HttpResponse, Http404
+from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib import messages
 from django.utils import timezone
-from datetime import timedelta
+from datetime import datetime, time, timedelta
 from django.forms import inlineformset_factory
 from django.db import transaction
 from django.db.models import Q, Prefetch
 from django.conf import settings
-
-from .forms import ItemForm, AssetForm, LoanRequestForm, AssetCreateForm, ItemCategoryForm
-from .models import Item, Asset, Loan
-from users.models import Notification, CustomUser
+from django.core.paginator import Paginator
+
+from .forms import (
+    ItemForm, AssetForm, LoanRequestForm, AssetCreateForm, ItemCategoryForm, RecurringReservationForm,
+    AutoApprovalRuleForm, QuotaPolicyForm, MaintenanceWindowForm, AssetGrid,
+)
+from .models import (
+    Item, ItemCategory, Asset, Loan, WaitlistEntry, RecurringReservation, AutoApprovalRule, QuotaPolicy,
+    MaintenanceWindow, day_range,
+)
+from . import services, availability, catalog, intervals, labels, profiling, recurrence, autoapprove
+from .idempotency import idempotent, new_key, succeeded
+from .ratelimit import rate_limit
+from .archive import loan_history, hydrate
+from .tasks import notify, notify_many
+from users.models import CustomUser, Organization
 
 # -------------------------------------------------------------------
 # Utils
@@ -25,6 +41,15 @@ def check_admin_permission(request):
         return redirect('pick_organization')
     return None
 
+def _day_bounds(first_day, last_day):
+    """ช่วงวันที่ (รวมปลาย) -> เงื่อนไขช่วงเวลาของ borrow_date ที่ใช้ index ได้
+    (borrow_date__date ห่อคอลัมน์ด้วยฟังก์ชัน ทำให้ใช้ index ไม่ได้)"""
+    tz = timezone.get_current_timezone()
+    return {
+        'borrow_date__gte': timezone.make_aware(datetime.combine(first_day, time.min), tz),
+        'borrow_date__lt': timezone.make_aware(datetime.combine(last_day + timedelta(days=1), time.min), tz),
+    }
+
 # -------------------------------------------------------------------
 # Dashboard
 # -------------------------------------------------------------------
@@ -36,17 +61,17 @@ def dashboard(request):
 
     org = request.user.organization
 
-    pending_loan_requests = Loan.objects.filter(
-        asset__item__organization=org, status='pending'
+    pending_loan_requests = Loan.objects.for_org(org).filter(
+        status='pending'
     ).count()
 
-    active_loans = Loan.objects.filter(
-        asset__item__organization=org, status='approved'
+    active_loans = Loan.objects.for_org(org).filter(
+        status='approved'
     ).select_related('asset__item', 'borrower').order_by('due_date')
 
-    total_assets = Asset.objects.filter(item__organization=org).count()
-    available_assets_count = Asset.objects.filter(item__organization=org, status='available').count()
-    total_item_types = Item.objects.filter(organization=org).count()
+    total_assets = Asset.objects.for_org(org).count()
+    available_assets_count = Asset.objects.for_org(org).filter(status='available').count()
+    total_item_types = Item.objects.for_org(org).count()
     active_users_count = CustomUser.objects.filter(organization=org, is_active=True).count()
 
     context = {
@@ -108,26 +133,50 @@ def edit_item(request, item_id):
     if redirect_response:
         return redirect_response
 
-    item = get_object_or_404(Item, pk=item_id, organization=request.user.organization)
+    item = get_object_or_404(Item.objects.for_org(request.user.organization), pk=item_id)
 
-    AssetFormSet = inlineformset_factory(Item, Asset, form=AssetForm, extra=0, can_delete=True)
+    # ตารางอุปกรณ์ทีละหน้า + ตัวกรอง (item ที่มีอุปกรณ์หลายพันชิ้นไม่ต้องโหลด/ส่งทั้งหมด)
+    query = request.GET.get('q', '').strip()
+    status = request.GET.get('status', '')
+    assets = (
+        Asset.objects.filter(item=item)
+        .only('id', 'item_id', 'serial_number', 'device_id', 'location', 'status', 'version')
+        .order_by('id')
+    )
+    if query:
+        assets = assets.filter(
+            Q(serial_number__icontains=query) | Q(device_id__icontains=query) | Q(location__icontains=query)
+        )
+    if status in dict(Asset.STATUS_CHOICES):
+        assets = assets.filter(status=status)
+    page = Paginator(assets, getattr(settings, 'ASSET_GRID_PAGE_SIZE', 50)).get_page(request.GET.get('page'))
 
     if request.method == 'POST':
         item_form = ItemForm(request.POST, request.FILES, instance=item)
-        asset_formset = AssetFormSet(request.POST, instance=item, prefix='asset')
-        if item_form.is_valid() and asset_formset.is_valid():
+        grid = AssetGrid(item, page.object_list, request.POST)
+        if item_form.is_valid() and grid.is_valid():
+            ok, error = True, None
             with transaction.atomic():
                 item_form.save()
-                asset_formset.save()
-            messages.success(request, f'ประเภทสิ่งของ "{item.name}" และอุปกรณ์ถูกแก้ไขเรียบร้อยแล้ว')
-            return redirect('item_overview')
+                if grid.has_changes():
+                    ok, error = services.save_asset_grid(item, grid.updated, grid.created, grid.deleted)
+                if not ok:
+                    transaction.set_rollback(True)
+            if ok:
+                messages.success(request, f'ประเภทสิ่งของ "{item.name}" และอุปกรณ์ถูกแก้ไขเรียบร้อยแล้ว')
+                return redirect(request.get_full_path())
+            messages.error(request, error)
     else:
         item_form = ItemForm(instance=item)
-        asset_formset = AssetFormSet(instance=item, prefix='asset')
+        grid = AssetGrid(item, page.object_list)
 
     return render(request, 'borrowing/edit_item.html', {
         'item_form': item_form,
-        'asset_formset': asset_formset,
+        'grid': grid,
+        'page': page,
+        'query': query,
+        'status': status,
+        'status_choices': Asset.STATUS_CHOICES,
         'item': item,
     })
 
@@ -137,7 +186,7 @@ def delete_asset(request, asset_id):
     if redirect_response:
         return redirect_response
 
-    asset = get_object_or_404(Asset, id=asset_id, item__organization=request.user.organization)
+    asset = get_object_or_404(Asset.objects.for_org(request.user.organization), id=asset_id)
     item_id_of_asset = asset.item.id
 
     # กันลบถ้ามีคำขอหรือจอง หรือกำลังยืมจริง
@@ -164,7 +213,7 @@ def delete_item(request, item_id):
     if redirect_response:
         return redirect_response
 
-    item = get_object_or_404(Item, id=item_id, organization=request.user.organization)
+    item = get_object_or_404(Item.objects.for_org(request.user.organization), id=item_id)
 
     if item.assets.exists():
         messages.error(
@@ -185,63 +234,48 @@ def delete_item(request, item_id):
 # Loans (admin actions)
 # -------------------------------------------------------------------
 @login_required
+@idempotent(methods=('GET', 'POST'))
+@rate_limit('loan_admin', methods=('GET', 'POST'))
 def approve_loan(request, loan_id):
     redirect_response = check_admin_permission(request)
     if redirect_response:
         return redirect_response
 
     loan = get_object_or_404(
-        Loan, id=loan_id, asset__item__organization=request.user.organization
+        Loan.objects.for_org(request.user.organization), id=loan_id
     )
 
     if loan.status != 'pending':
         messages.error(request, 'คำขอยืมนี้ไม่สามารถอนุมัติได้')
         return redirect('pending_loans_view')
 
-    if not loan.start_date or not loan.due_date:
-        messages.error(request, 'กรุณาระบุช่วงวันที่ให้ครบก่อนอนุมัติ')
+    ok, error = services.approve_loan(loan, actor=request.user)
+    if not ok:
+        messages.error(request, error)
         return redirect('pending_loans_view')
 
-    with transaction.atomic():
-        loan_locked = Loan.objects.select_for_update().get(id=loan.id)
-        conflict = Loan.objects.filter(
-            asset=loan_locked.asset,
-            status='approved',
-            start_date__lte=loan_locked.due_date,
-            due_date__gte=loan_locked.start_date,
-        ).exclude(id=loan_locked.id).exists()
-        if conflict:
-            messages.error(
-                request,
-                (f"ไม่สามารถอนุมัติได้: มีการอนุมัติ/จอง '{loan_locked.asset.item.name}' "
-                 f"ทับช่วง {loan_locked.start_date:%d/%m}-{loan_locked.due_date:%d/%m}")
-            )
-            return redirect('pending_loans_view')
-
-        loan_locked.status = 'approved'
-        loan_locked.approved_at = timezone.now()
-        loan_locked.save(update_fields=['status', 'approved_at'])
-
-        Notification.objects.create(
-            user=loan_locked.borrower,
-            message=(f'คำขอยืม "{loan_locked.asset.item.name}" ได้รับอนุมัติแล้ว '
-                     f'(ยืม: {loan_locked.start_date:%d/%m} คืน: {loan_locked.due_date:%d/%m})')
-        )
+    notify(
+        loan.borrower,
+        (f'คำขอยืม "{loan.asset.item.name}" ได้รับอนุมัติแล้ว '
+         f'(ยืม: {loan.start_date:%d/%m} คืน: {loan.due_date:%d/%m})')
+    )
 
     messages.success(
         request,
         f'อนุมัติคำขอยืม "{loan.asset.item.name}" แล้ว (จอง {loan.start_date:%d/%m/%Y} ถึง {loan.due_date:%d/%m/%Y})'
     )
-    return redirect('pending_loans_view')
+    return succeeded(redirect('pending_loans_view'))
 
 @login_required
+@idempotent(methods=('GET', 'POST'))
+@rate_limit('loan_admin', methods=('GET', 'POST'))
 def start_loan(request, loan_id):
     redirect_response = check_admin_permission(request)
     if redirect_response:
         return redirect_response
 
     loan = get_object_or_404(
-        Loan, id=loan_id, asset__item__organization=request.user.organization
+        Loan.objects.for_org(request.user.organization), id=loan_id
     )
 
     if loan.status != 'approved':
@@ -255,60 +289,96 @@ def start_loan(request, loan_id):
         messages.error(request, f'ยังไม่ถึงวันเริ่มใช้ ({loan.start_date:%d/%m/%Y})')
         return redirect('active_loans_view')
 
-    with transaction.atomic():
-        asset = Asset.objects.select_for_update().get(id=loan.asset_id)
-        if asset.status != 'available':
-            messages.error(request, f'อุปกรณ์ไม่พร้อม (สถานะ: {asset.get_status_display()})')
-            return redirect('active_loans_view')
-
-        asset.status = 'on_loan'
-        asset.save(update_fields=['status'])
-
-        loan.pickup_date = timezone.now()
-        loan.save(update_fields=['pickup_date'])
+    ok, error = services.start_loan(loan, actor=request.user)
+    if not ok:
+        messages.error(request, error)
+        return redirect('active_loans_view')
 
-        Notification.objects.create(
-            user=loan.borrower,
-            message=f'อุปกรณ์ "{loan.asset.item.name}" ถูกบันทึกว่า "เริ่มยืม" แล้ว'
-        )
+    notify(loan.borrower, f'อุปกรณ์ "{loan.asset.item.name}" ถูกบันทึกว่า "เริ่มยืม" แล้ว')
 
     messages.success(request, f'เริ่มยืม "{loan.asset.item.name}" เรียบร้อย')
-    return redirect('active_loans_view')
+    return succeeded(redirect('active_loans_view'))
 
 @login_required
+@idempotent(methods=('GET', 'POST'))
+@rate_limit('loan_admin', methods=('GET', 'POST'))
 def reject_loan(request, loan_id):
     redirect_response = check_admin_permission(request)
     if redirect_response:
         return redirect_response
 
     loan = get_object_or_404(
-        Loan, id=loan_id, asset__item__organization=request.user.organization
+        Loan.objects.for_org(request.user.organization), id=loan_id
     )
 
     if loan.status not in ['pending', 'approved']:
         messages.error(request, "คำขอยืมนี้ไม่สามารถปฏิเสธได้")
         return redirect('dashboard')
 
-    with transaction.atomic():
-        asset = Asset.objects.select_for_update().get(id=loan.asset_id)
-        if asset.status == 'on_loan':
-            messages.error(request, "รายการนี้เริ่มยืมแล้ว ไม่สามารถปฏิเสธได้")
-            return redirect('active_loans_view')
+    ok, error = services.reject_loan(loan, actor=request.user)
+    if not ok:
+        messages.error(request, error)
+        return redirect('active_loans_view')
 
-        loan.status = 'rejected'
-        loan.save(update_fields=['status'])
+    notify(loan.borrower, f'คำขอยืม "{loan.asset.item.name}" ของคุณถูกปฏิเสธ')
 
-        if asset.status != 'available':
-            asset.status = 'available'
-            asset.save(update_fields=['status'])
+    messages.success(request, f'ปฏิเสธคำขอยืม "{loan.asset.item.name}" แล้ว')
+    return succeeded(redirect('pending_loans_view'))
 
-        Notification.objects.create(
-            user=loan.borrower,
-            message=f'คำขอยืม "{loan.asset.item.name}" ของคุณถูกปฏิเสธ'
-        )
+@login_required
+def scan_station(request):
+    """
+    เคาน์เตอร์รับ/คืนของด้วยเครื่องสแกน: ส่งรหัสเป็นชุด (บรรทัดละรหัส หรือ JSON {"codes": [...]})
+    แล้วบันทึกทั้งชุดใน transaction เดียว
+    """
+    redirect_response = check_admin_permission(request)
+    if redirect_response:
+        return redirect_response
 
-    messages.success(request, f'ปฏิเสธคำขอยืม "{loan.asset.item.name}" แล้ว')
-    return redirect('pending_loans_view')
+    wants_json = request.content_type == 'application/json'
+    mode = request.POST.get('mode') or request.GET.get('mode') or 'auto'
+    if mode not in services.SCAN_MODES:
+        mode = 'auto'
+    results = None
+
+    if request.method == 'POST':
+        if wants_json:
+            try:
+                body = json.loads(request.body or b'{}')
+            except ValueError:
+                return JsonResponse({'error': 'JSON ไม่ถูกต้อง'}, status=400)
+            codes = body.get('codes') or []
+            mode = body.get('mode') if body.get('mode') in services.SCAN_MODES else mode
+        else:
+            codes = request.POST.get('codes', '').splitlines()
+
+        max_codes = getattr(settings, 'SCAN_BATCH_MAX', 500)
+        if len(codes) > max_codes:
+            error = f'สแกนได้ไม่เกิน {max_codes} รายการต่อครั้ง'
+            if wants_json:
+                return JsonResponse({'error': error}, status=400)
+            messages.error(request, error)
+            return redirect('scan_station')
+
+        results = services.scan_batch(codes, request.user.organization, actor=request.user, mode=mode)
+
+        notices = []
+        for r in results:
+            if r['action'] == 'pickup':
+                notices.append((r['borrower_id'], f'อุปกรณ์ "{r["item"]}" ถูกบันทึกว่า "เริ่มยืม" แล้ว'))
+            elif r['action'] == 'return':
+                notices.append((r['borrower_id'], f'บันทึกการคืน "{r["item"]}" เรียบร้อยแล้ว'))
+        notify_many(notices)
+
+        if wants_json:
+            return JsonResponse({'mode': mode, 'results': results})
+
+    return render(request, 'borrowing/scan_station.html', {
+        'mode': mode,
+        'results': results,
+        'done_count': sum(1 for r in results or [] if r['ok']),
+        'organization_name': request.user.organization.name,
+    })
 
 # -------------------------------------------------------------------
 # Reports
@@ -324,20 +394,20 @@ def weekly_report(request):
     start_of_week = today - timedelta(days=today.weekday())
     end_of_week = start_of_week + timedelta(days=6)
 
-    loans = Loan.objects.filter(
-        asset__item__organization=org,
-        borrow_date__date__range=[start_of_week, end_of_week]
-    ).select_related('asset__item', 'borrower').order_by('-borrow_date')
+    # รวมรายการที่ย้ายเข้าคลังแล้วด้วย (รายงานย้อนหลัง)
+    loans = hydrate(loan_history(
+        organization=org, **_day_bounds(start_of_week, end_of_week)
+    ).order_by('-borrow_date'))
 
     context = {
         'report_title': 'รายงานประจำสัปดาห์',
         'report_period': f'{start_of_week:%d/%m/%Y} - {end_of_week:%d/%m/%Y}',
         'loans': loans,
-        'total_loans': loans.count(),
-        'returned_loans': loans.filter(status='returned').count(),
-        'approved_loans': loans.filter(status='approved').count(),
-        'pending_loans': loans.filter(status='pending').count(),
-        'overdue_loans': loans.filter(status='approved', due_date__lt=today).count(),
+        'total_loans': len(loans),
+        'returned_loans': sum(1 for l in loans if l.status == 'returned'),
+        'approved_loans': sum(1 for l in loans if l.status == 'approved'),
+        'pending_loans': sum(1 for l in loans if l.status == 'pending'),
+        'overdue_loans': sum(1 for l in loans if l.status == 'approved' and l.due_date and l.due_date < today),
         'organization_name': org.name,
     }
     return render(request, 'borrowing/weekly_report.html', context)
@@ -356,20 +426,20 @@ def monthly_report(request):
     last_day = (today.replace(year=year + 1, month=1, day=1) - timedelta(days=1)) if month == 12 \
         else (today.replace(month=month + 1, day=1) - timedelta(days=1))
 
-    loans = Loan.objects.filter(
-        asset__item__organization=org,
-        borrow_date__date__range=[first_day, last_day]
-    ).select_related('asset__item', 'borrower').order_by('-borrow_date')
+    # รวมรายการที่ย้ายเข้าคลังแล้วด้วย (รายงานย้อนหลัง)
+    loans = hydrate(loan_history(
+        organization=org, **_day_bounds(first_day, last_day)
+    ).order_by('-borrow_date'))
 
     context = {
         'report_title': 'รายงานประจำเดือน',
         'report_period': f'เดือน {first_day.strftime("%B %Y")}',
         'loans': loans,
-        'total_loans': loans.count(),
-        'returned_loans': loans.filter(status='returned').count(),
-        'approved_loans': loans.filter(status='approved').count(),
-        'pending_loans': loans.filter(status='pending').count(),
-        'overdue_loans': loans.filter(status='approved', due_date__lt=today).count(),
+        'total_loans': len(loans),
+        'returned_loans': sum(1 for l in loans if l.status == 'returned'),
+        'approved_loans': sum(1 for l in loans if l.status == 'approved'),
+        'pending_loans': sum(1 for l in loans if l.status == 'pending'),
+        'overdue_loans': sum(1 for l in loans if l.status == 'approved' and l.due_date and l.due_date < today),
         'organization_name': org.name,
     }
     return render(request, 'borrowing/monthly_report.html', context)
@@ -378,6 +448,8 @@ def monthly_report(request):
 # User-facing loan request/return
 # -------------------------------------------------------------------
 @login_required
+@idempotent(methods=('POST',))
+@rate_limit('borrow', methods=('POST',))
 def borrow_item(request, asset_id):
     """
     ผู้ใช้สามารถยื่นขอยืมอุปกรณ์จาก 'ทุกองค์กร' ได้
@@ -396,83 +468,384 @@ def borrow_item(request, asset_id):
             start_date = form.cleaned_data['start_date']
             due_date = form.cleaned_data['due_date']
             reason = form.cleaned_data['reason']
+            start_at, end_at = form.cleaned_data['start_at'], form.cleaned_data['end_at']
 
-            with transaction.atomic():
-                # ล็อก asset กันแข่งกันยืม
-                asset_locked = Asset.objects.select_for_update().select_related("item__organization").get(id=asset_id)
-
-                # กันทับช่วง (pending/approved/on_loan)
-                conflict = Loan.objects.filter(
-                    asset=asset_locked,
-                    status__in=['pending', 'approved', 'on_loan'],
-                    start_date__lte=due_date,
-                    due_date__gte=start_date,
-                ).exists()
-                if conflict:
-                    messages.error(
-                        request,
-                        f"มีการจองอุปกรณ์ชิ้นนี้ทับช่วงวันที่ {start_date:%d/%m/%Y} ถึง {due_date:%d/%m/%Y} แล้ว กรุณาเลือกช่วงอื่น"
-                    )
-                    return redirect('user_dashboard')
-
-                # สร้างคำขอ
-                Loan.objects.create(
-                    asset=asset_locked,
-                    borrower=request.user,
-                    reason=reason,
-                    start_date=start_date,
-                    due_date=due_date,
-                    status='pending',
+            # ช่วงวันที่เต็ม: เข้าคิวรอแทนการกดส่งซ้ำ (เลื่อนเป็นคำขอยืมให้อัตโนมัติเมื่อมีคนคืน/ถูกปฏิเสธ)
+            if 'join_waitlist' in request.POST:
+                _, created = services.join_waitlist(
+                    asset.item, request.user, start_date, due_date, reason=reason,
+                    start_at=start_at, end_at=end_at,
                 )
+                if created:
+                    messages.success(request, f'เข้าคิวรอยืม "{asset.item.name}" แล้ว ระบบจะส่งคำขอให้อัตโนมัติเมื่อมีช่วงว่าง')
+                else:
+                    messages.info(request, 'คุณอยู่ในคิวของช่วงวันที่นี้แล้ว')
+                return succeeded(redirect('my_borrowed_items_history'))
+
+            # เช็กจากดัชนีที่แคชไว้ก่อน: ชนแน่ ๆ ก็ตอบกลับได้เลยโดยไม่ต้องเปิด transaction
+            # (รายชั่วโมงใช้ interval tree เพราะปฏิทินรายวันนับทั้งวันว่าไม่ว่าง)
+            if start_at:
+                precheck_free = intervals.is_free(asset.pk, start_at, end_at)
+            else:
+                precheck_free = availability.asset_is_free(asset, start_date, due_date) is not False
+            if not precheck_free:
+                form.add_error(None, "ช่วงวันที่เลือกมีการจองแล้ว กรุณาเลือกวันที่ว่างจากปฏิทิน หรือเข้าคิวรอ")
+                return _borrow_form(request, asset, form, offer_waitlist=True)
+
+            # สร้างคำขอผ่าน state machine (กันทับช่วงด้วย version ของ asset แทนการล็อกแถว)
+            loan, error = services.request_loan(
+                asset, request.user, start_date, due_date, reason=reason,
+                start_at=start_at, end_at=end_at,
+            )
+            if error:
+                form.add_error(None, error)
+                return _borrow_form(request, asset, form, offer_waitlist=True)
+
+            # เข้ากฎอนุมัติอัตโนมัติขององค์กร -> อนุมัติทันที ไม่ต้องรอแอดมิน
+            auto_approved, _ = autoapprove.run_batch(loan_ids=[loan.pk], org_ids=[loan.organization_id])
+
+            # ✅ แจ้ง 'แอดมินขององค์กรเจ้าของอุปกรณ์' (ตั้งคิวครั้งเดียว ส่งใน worker)
+            admin_users = CustomUser.objects.filter(
+                organization=asset.item.organization,
+                is_org_admin=True,
+                is_active=True
+            )
+            notify(
+                admin_users,
+                f'คำขอยืมใหม่จาก {request.user.get_full_name() or request.user.username} '
+                f'สำหรับ "{asset.item.name}" (องค์กร: {asset.item.organization.name})'
+                + (' (อนุมัติอัตโนมัติแล้ว)' if auto_approved else '')
+            )
 
-                # ✅ แจ้ง 'แอดมินขององค์กรเจ้าของอุปกรณ์'
-                admin_users = CustomUser.objects.filter(
-                    organization=asset_locked.item.organization,
-                    is_org_admin=True,
-                    is_active=True
+            if auto_approved:
+                messages.success(request, f'คำขอยืม "{asset.item.name}" ได้รับอนุมัติอัตโนมัติแล้ว')
+            else:
+                messages.success(
+                    request,
+                    f'ส่งคำขอยืม "{asset.item.name}" (องค์กร: {asset.item.organization.name}) สำเร็จ โปรดรอแอดมินอนุมัติ'
                 )
-                for admin in admin_users:
-                    Notification.objects.create(
-                        user=admin,
-                        message=f'คำขอยืมใหม่จาก {request.user.get_full_name() or request.user.username} '
-                                f'สำหรับ "{asset_locked.item.name}" (องค์กร: {asset_locked.item.organization.name})'
-                    )
-
-            messages.success(
-                request,
-                f'ส่งคำขอยืม "{asset.item.name}" (องค์กร: {asset.item.organization.name}) สำเร็จ โปรดรอแอดมินอนุมัติ'
-            )
-            return redirect('my_borrowed_items_history')
+            return succeeded(redirect('my_borrowed_items_history'))
     else:
         form = LoanRequestForm()
 
+    return _borrow_form(request, asset, form)
+
+def _borrow_form(request, asset, form, offer_waitlist=False):
     return render(request, 'borrowing/borrow_item.html', {
         'asset': asset,
         'form': form,
         # เผื่อ template อยากแสดงโลโก้/ชื่อองค์กร
         'owner_org': asset.item.organization, 
+        # คีย์ใหม่ทุกครั้งที่แสดงฟอร์ม: ดับเบิลคลิก/ส่งซ้ำจากหน้าเดิมจะได้ผลเดิมกลับไป
+        'idempotency_key': new_key(),
+        'offer_waitlist': offer_waitlist,
     })
 
-@login_required
-def return_item(request, loan_id):
-    loan = get_object_or_404(Loan, id=loan_id, borrower=request.user)
+# -------------------------------------------------------------------
+# ตะกร้ายืม: เก็บ id อุปกรณ์ใน session แล้วส่งคำขอทั้งชุดครั้งเดียว
+# -------------------------------------------------------------------
+CART_SESSION_KEY = 'borrow_cart'
 
-    # คืนได้เมื่ออนุมัติแล้วและอุปกรณ์อยู่สถานะ on_loan
-    if loan.status == 'approved' and loan.asset.status == 'on_loan':
-        loan.status = 'returned'
-        loan.return_date = timezone.now()
-        loan.save(update_fields=['status', 'return_date'])
+def _cart_ids(request):
+    return list(request.session.get(CART_SESSION_KEY, []))
 
-        asset = loan.asset
-        asset.status = 'available'
-        asset.save(update_fields=['status'])
+def _save_cart(request, ids):
+    request.session[CART_SESSION_KEY] = ids
 
-        messages.success(request, f'บันทึกการคืน "{asset.item.name}" เรียบร้อยแล้ว')
+@login_required
+def cart_add(request, asset_id):
+    if request.method != 'POST':
+        return redirect('borrow_item', asset_id=asset_id)
+    asset = get_object_or_404(Asset.objects.select_related('item'), id=asset_id)
+    ids = _cart_ids(request)
+    if asset.pk in ids:
+        messages.info(request, f'"{asset.item.name}" อยู่ในตะกร้าแล้ว')
+    elif len(ids) >= getattr(settings, 'CART_MAX_ITEMS', 20):
+        messages.error(request, 'ตะกร้าเต็มแล้ว กรุณาส่งคำขอชุดนี้ก่อน')
     else:
+        _save_cart(request, ids + [asset.pk])
+        messages.success(request, f'เพิ่ม "{asset.item.name}" ลงตะกร้าแล้ว')
+    return redirect('cart_view')
+
+@login_required
+def cart_remove(request, asset_id):
+    if request.method == 'POST':
+        _save_cart(request, [pk for pk in _cart_ids(request) if pk != asset_id])
+    return redirect('cart_view')
+
+@login_required
+@idempotent(methods=('POST',))
+@rate_limit('borrow', methods=('POST',))
+def cart_view(request):
+    """ตะกร้า + ส่งคำขอยืมทุกชิ้นในช่วงเดียวกัน (จองได้ทั้งชุดหรือไม่ได้เลย แจ้งแอดมินครั้งเดียวต่อชุด)"""
+    ids = _cart_ids(request)
+    assets = list(Asset.objects.filter(pk__in=ids).select_related('item__organization').order_by('item__name', 'pk'))
+    if len(assets) != len(ids):   # อุปกรณ์ถูกลบไประหว่างนั้น
+        _save_cart(request, [a.pk for a in assets])
+
+    form = LoanRequestForm(request.POST or None)
+    if request.method == 'POST' and form.is_valid():
+        if not assets:
+            messages.error(request, 'ตะกร้าว่าง')
+            return redirect('cart_view')
+        start_date, due_date = form.cleaned_data['start_date'], form.cleaned_data['due_date']
+        bundle, error = services.request_bundle(
+            assets, request.user, start_date, due_date, reason=form.cleaned_data['reason'],
+            start_at=form.cleaned_data['start_at'], end_at=form.cleaned_data['end_at'],
+        )
+        if error:
+            form.add_error(None, error)
+        else:
+            bundle_loans = list(bundle.loans.values_list('pk', 'organization_id'))
+            auto_approved, _ = autoapprove.run_batch(
+                loan_ids=[pk for pk, _ in bundle_loans], org_ids={org_id for _, org_id in bundle_loans}
+            )
+            by_org = {}
+            for asset in assets:
+                by_org.setdefault(asset.organization_id, []).append(
+                    f"{asset.item.name} ({asset.serial_number or asset.device_id or asset.pk})"
+                )
+            requester = request.user.get_full_name() or request.user.username
+            admins = CustomUser.objects.filter(
+                organization_id__in=by_org, is_org_admin=True, is_active=True
+            ).values_list('id', 'organization_id')
+            notify_many([
+                (user_id, f'คำขอยืมชุดใหม่ #{bundle.pk} จาก {requester} ({len(by_org[org_id])} รายการ): '
+                          + ", ".join(by_org[org_id]))
+                for user_id, org_id in admins
+            ])
+            _save_cart(request, [])
+            messages.success(
+                request,
+                f'ส่งคำขอยืม {len(assets)} รายการเป็นชุดเดียวแล้ว'
+                + (f' อนุมัติอัตโนมัติ {len(auto_approved)} รายการ' if auto_approved else '')
+                + ('' if len(auto_approved) == len(assets) else ' โปรดรอแอดมินอนุมัติ')
+            )
+            return succeeded(redirect('my_borrowed_items_history'))
+
+    return render(request, 'borrowing/cart.html', {
+        'assets': assets,
+        'form': form,
+        'idempotency_key': new_key(),
+    })
+
+@login_required
+@idempotent(methods=('POST',))
+@rate_limit('borrow', methods=('POST',))
+def recurring_request(request, asset_id):
+    """ขอจองซ้ำ (เช่น ทุกวันอังคาร 13:00-15:00 ทั้งเทอม) ส่งเป็นกฎเดียวให้แอดมินอนุมัติครั้งเดียว"""
+    asset = get_object_or_404(Asset.objects.select_related("item__organization"), id=asset_id)
+    form = RecurringReservationForm(request.POST or None)
+    conflicts = []
+    if request.method == 'POST' and form.is_valid():
+        rule = form.save(commit=False)
+        rule.asset, rule.borrower = asset, request.user
+        limit = recurrence.max_occurrences()
+        ranges = list(islice(recurrence.occurrences(rule), limit + 1))
+        if not ranges:
+            form.add_error(None, "ไม่มีวันที่ตรงกับรูปแบบที่เลือกในช่วงนี้")
+        elif len(ranges) > limit:
+            form.add_error(None, f"จองซ้ำได้ไม่เกิน {limit} ครั้งต่อคำขอ")
+        else:
+            conflicts = recurrence.preview_conflicts(rule, ranges)
+            if conflicts and not form.cleaned_data['skip_conflicts']:
+                form.add_error(None, "บางครั้งชนกับการจองเดิม เลือก “ข้ามวันที่ถูกจองแล้ว” เพื่อส่งเฉพาะวันที่ว่าง")
+            else:
+                rule.exdates = [d.isoformat() for d in conflicts]
+                rule.save()
+                notify(
+                    CustomUser.objects.filter(organization=asset.item.organization, is_org_admin=True, is_active=True),
+                    f'คำขอจองซ้ำ "{asset.item.name}" {len(ranges) - len(conflicts)} ครั้ง '
+                    f'จาก {request.user.get_full_name() or request.user.username}'
+                )
+                messages.success(request, f'ส่งคำขอจองซ้ำ {len(ranges) - len(conflicts)} ครั้งแล้ว โปรดรอแอดมินอนุมัติ')
+                return succeeded(redirect('my_borrowed_items_history'))
+
+    return render(request, 'borrowing/recurring_request.html', {
+        'asset': asset,
+        'form': form,
+        'conflicts': conflicts,
+        'idempotency_key': new_key(),
+    })
+
+@login_required
+@idempotent(methods=('POST',))
+@rate_limit('loan_admin', methods=('POST',))
+def decide_recurring(request, rule_id, decision):
+    """อนุมัติ (สร้างรายการยืมทุกครั้งเป็นชุด ข้ามวันที่ชน) หรือปฏิเสธกฎการจองซ้ำ"""
+    redirect_response = check_admin_permission(request)
+    if redirect_response:
+        return redirect_response
+    rule = get_object_or_404(
+        RecurringReservation.objects.for_org(request.user.organization).select_related('asset__item', 'borrower'), id=rule_id
+    )
+    if request.method != 'POST':
+        return redirect('pending_loans_view')
+
+    if decision == 'approve':
+        skipped_before = len(rule.exdates or [])
+        ok, error = recurrence.approve_recurring(rule, actor=request.user, skip_conflicts=True)
+        if not ok:
+            messages.error(request, error)
+            return redirect('pending_loans_view')
+        count = rule.loans.count()
+        skipped = len(rule.exdates) - skipped_before
+        notify(rule.borrower, f'คำขอจองซ้ำ "{rule.asset.item.name}" ได้รับอนุมัติ {count} ครั้ง')
+        messages.success(
+            request,
+            f'อนุมัติการจองซ้ำ "{rule.asset.item.name}" {count} ครั้ง' + (f' (ข้าม {skipped} วันที่ชน)' if skipped else '')
+        )
+        return succeeded(redirect('pending_loans_view'))
+    if recurrence.reject_recurring(rule):
+        notify(rule.borrower, f'คำขอจองซ้ำ "{rule.asset.item.name}" ของคุณถูกปฏิเสธ')
+        messages.success(request, f'ปฏิเสธคำขอจองซ้ำ "{rule.asset.item.name}" แล้ว')
+        return succeeded(redirect('pending_loans_view'))
+    return redirect('pending_loans_view')
+
+@login_required
+def cancel_waitlist(request, entry_id):
+    entry = get_object_or_404(WaitlistEntry, id=entry_id, user=request.user)
+    if request.method == 'POST' and services.cancel_waitlist(entry):
+        messages.success(request, f'ออกจากคิวรอ "{entry.item.name}" แล้ว')
+    return redirect('my_borrowed_items_history')
+
+@login_required
+@idempotent(methods=('GET', 'POST'))
+def return_item(request, loan_id):
+    loan = get_object_or_404(Loan, id=loan_id, borrower=request.user)
+
+    # คืนได้เมื่อรับของไปแล้ว (approved/overdue ที่มี pickup_date)
+    if not loan.pickup_date:
         messages.error(request, 'ไม่สามารถคืนได้ในขณะนี้')
+        return redirect('my_borrowed_items_history')
 
+    ok, error = services.return_loan(loan, actor=request.user)
+    if ok:
+        messages.success(request, f'บันทึกการคืน "{loan.asset.item.name}" เรียบร้อยแล้ว')
+        return succeeded(redirect('my_borrowed_items_history'))
+    messages.error(request, error or 'ไม่สามารถคืนได้ในขณะนี้')
     return redirect('my_borrowed_items_history')
 
+# -------------------------------------------------------------------
+# แคตตาล็อกรวมทุกองค์กร (borrow_item ยืมข้ามองค์กรได้อยู่แล้ว)
+# -------------------------------------------------------------------
+@login_required
+def catalog_view(request):
+    """ค้นหา item ข้ามองค์กรจาก shard ที่แคชไว้ต่อองค์กร (borrowing/catalog.py) ไม่สแกนทั้งแพลตฟอร์มทุกครั้ง"""
+    organizations = list(Organization.objects.order_by('name').values_list('id', 'name'))
+    selected = {int(v) for v in request.GET.getlist('org') if v.isdigit()}
+    org_ids = [pk for pk, _ in organizations if not selected or pk in selected]
+
+    query = (request.GET.get('q') or '').strip()
+    category = request.GET.get('category', '')
+    category_id = int(category) if category.isdigit() else None
+    available_only = request.GET.get('available') == '1'
+    page = request.GET.get('page', '')
+    page = max(int(page), 1) if page.isdigit() else 1
+
+    size = catalog.page_size()
+    entries, has_next = catalog.search(
+        org_ids, query, category_id=category_id, available_only=available_only,
+        offset=(page - 1) * size, limit=size,
+    )
+    names = dict(organizations)
+    params = request.GET.copy()
+    params.pop('page', None)
+
+    return render(request, 'borrowing/catalog.html', {
+        'results': [(entry, names[entry.organization_id]) for entry in entries],
+        'organizations': organizations,
+        'selected_orgs': selected,
+        'categories': ItemCategory.objects.order_by('name'),
+        'current_query': query,
+        'current_category': category_id,
+        'available_only': available_only,
+        'page_number': page,
+        'has_next': has_next,
+        'querystring': params.urlencode(),
+        'MEDIA_URL': settings.MEDIA_URL,
+    })
+
+# -------------------------------------------------------------------
+# Availability calendar (JSON)
+# -------------------------------------------------------------------
+def _calendar_days(request):
+    try:
+        return int(request.GET.get('days') or availability.default_days())
+    except ValueError:
+        return availability.default_days()
+
+@login_required
+def item_availability(request, item_id):
+    """bitset วันว่าง/ไม่ว่างของอุปกรณ์ทุกชิ้นใน item (ยืมข้ามองค์กรได้ จึงไม่กรององค์กร)"""
+    item = get_object_or_404(Item.objects.only('id'), pk=item_id)
+    cal = availability.item_calendar(item.id, days=_calendar_days(request))
+    return JsonResponse(availability.serialize(cal))
+
+@login_required
+def asset_availability(request, asset_id):
+    asset = get_object_or_404(Asset.objects.only('id', 'item_id'), pk=asset_id)
+    cal = availability.item_calendar(asset.item_id, days=_calendar_days(request))
+    return JsonResponse(availability.serialize(cal, asset_ids={asset.id}))
+
+@login_required
+def asset_slots(request, asset_id):
+    """ช่วงที่ถูกจอง/ช่วงว่างรายชั่วโมงของอุปกรณ์ใน ?date= (ค่าเริ่มต้นวันนี้) ?days= (สูงสุด 14)"""
+    asset = get_object_or_404(Asset.objects.only('id'), id=asset_id)
+    try:
+        first = datetime.strptime(request.GET['date'], '%Y-%m-%d').date() if request.GET.get('date') else timezone.localdate()
+        days = min(max(int(request.GET.get('days', 1)), 1), 14)
+    except ValueError:
+        return JsonResponse({'error': 'invalid date/days'}, status=400)
+    start_at, end_at = day_range(first, first + timedelta(days=days - 1))
+    return JsonResponse({
+        'asset': asset.id,
+        'slot_minutes': intervals.slot_minutes(),
+        'busy': [[s.isoformat(), e.isoformat()] for s, e, _ in intervals.busy(asset.id, start_at, end_at)],
+        'free': [[s.isoformat(), e.isoformat()] for s, e in intervals.free_slots(asset.id, start_at, end_at)],
+    })
+
+# -------------------------------------------------------------------
+# Asset labels (PDF/SVG)
+# -------------------------------------------------------------------
+@login_required
+def print_labels(request):
+    """
+    พิมพ์ป้ายอุปกรณ์ขององค์กร กรองด้วย ?item=, ?status=, ?q= (ค้นรหัส)
+    ?format=pdf|svg และ ?symbology=code128|qr ส่งออกแบบสตรีมทีละหน้า
+    """
+    redirect_response = check_admin_permission(request)
+    if redirect_response:
+        return redirect_response
+
+    fmt = request.GET.get('format', 'pdf')
+    symbology = request.GET.get('symbology', 'code128')
+    if fmt not in labels.FORMATS or symbology not in labels.SYMBOLOGIES:
+        messages.error(request, 'รูปแบบป้ายไม่ถูกต้อง (หากต้องการ QR ต้องติดตั้งแพ็กเกจ qrcode)')
+        return redirect('item_overview')
+
+    item_id = request.GET.get('item', '')
+    if item_id and not item_id.isdigit():
+        messages.error(request, 'รหัสประเภทสิ่งของไม่ถูกต้อง')
+        return redirect('item_overview')
+
+    assets = Asset.objects.for_org(request.user.organization)
+    if item_id:
+        assets = assets.filter(item_id=int(item_id))
+    if request.GET.get('status'):
+        assets = assets.filter(status=request.GET['status'])
+    if request.GET.get('q'):
+        q = request.GET['q'].strip()
+        assets = assets.filter(Q(serial_number__icontains=q) | Q(device_id__icontains=q))
+
+    content_type = 'application/pdf' if fmt == 'pdf' else 'text/html; charset=utf-8'
+    response = StreamingHttpResponse(
+        labels.stream_labels(assets, fmt=fmt, symbology=symbology), content_type=content_type
+    )
+    if fmt == 'pdf':
+        response['Content-Disposition'] = 'inline; filename="asset-labels.pdf"'
+    return response
+
 # -------------------------------------------------------------------
 # Admin lists
 # -------------------------------------------------------------------
@@ -508,12 +881,25 @@ def pending_loans_view(request):
         return redirect_response
 
     org = request.user.organization
-    pending_loans = Loan.objects.filter(
-        asset__item__organization=org, status='pending'
+    pending_loans = Loan.objects.for_org(org).filter(
+        status='pending'
     ).select_related('asset__item', 'borrower').order_by('-borrow_date')
 
+    # กฎจองซ้ำ: ขยายเฉพาะสัปดาห์ข้างหน้าไว้แสดง + นับครั้งที่ชนจาก interval tree (ไม่ query Loan)
+    today = timezone.localdate()
+    pending_rules = list(
+        RecurringReservation.objects.for_org(org).filter(status='pending')
+        .select_related('asset__item', 'borrower').order_by('created_at')
+    )
+    for rule in pending_rules:
+        rule.upcoming = list(islice(recurrence.occurrence_dates(rule, window_start=today), 5))
+        rule.conflict_count = len(recurrence.preview_conflicts(
+            rule, list(recurrence.occurrences(rule, window_start=today))
+        ))
+
     return render(request, 'borrowing/pending_loans.html', {
         'pending_loans': pending_loans,
+        'pending_rules': pending_rules,
         'organization_name': org.name,
     })
 
@@ -524,8 +910,8 @@ def active_loans_view(request):
         return redirect_response
 
     org = request.user.organization
-    active_loans = Loan.objects.filter(
-        asset__item__organization=org, status='approved'
+    active_loans = Loan.objects.for_org(org).filter(
+        status='approved'
     ).select_related('asset__item', 'borrower').order_by('due_date')
 
     return render(request, 'borrowing/active_loans.html', {
@@ -540,12 +926,13 @@ def loan_history_admin_view(request):
         return redirect_response
 
     org = request.user.organization
-    loan_history = Loan.objects.filter(
-        asset__item__organization=org
-    ).exclude(status__in=['pending', 'approved']).select_related('asset__item', 'borrower').order_by('-borrow_date')
+    loan_history_rows = hydrate(
+        loan_history(~Q(status__in=['pending', 'approved']), organization=org)
+        .order_by('-borrow_date')
+    )
 
     return render(request, 'borrowing/loan_history_admin.html', {
-        'loan_history': loan_history,
+        'loan_history': loan_history_rows,
         'organization_name': org.name,
     })
 
@@ -593,3 +980,176 @@ def add_category(request):
     else:
         form = ItemCategoryForm()
     return render(request, 'borrowing/add_category.html', {'form': form})
+
+@login_required
+def auto_approval_rules(request):
+    """แอดมินองค์กร: ตั้งกฎอนุมัติอัตโนมัติ (เพิ่ม/เปิด-ปิด/ลบ)"""
+    redirect_response = check_admin_permission(request)
+    if redirect_response:
+        return redirect_response
+    org = request.user.organization
+    rules = AutoApprovalRule.objects.for_org(org).select_related('category')
+
+    form = AutoApprovalRuleForm(request.POST or None)
+    if request.method == 'POST':
+        action, rule_id = request.POST.get('action'), request.POST.get('rule_id')
+        if action in ('toggle', 'delete'):
+            rule = get_object_or_404(rules, pk=rule_id)
+            if action == 'toggle':
+                rule.is_active = not rule.is_active
+                rule.save(update_fields=['is_active'])
+            else:
+                rule.delete()
+            return redirect('auto_approval_rules')
+        if form.is_valid():
+            rule = form.save(commit=False)
+            rule.organization = org
+            rule.save()
+            approved = autoapprove.run_all(org_ids=[org.pk]) if rule.is_active else 0
+            messages.success(
+                request,
+                f'เพิ่มกฎ "{rule.name}" แล้ว' + (f' อนุมัติคำขอที่รออยู่ {approved} รายการ' if approved else '')
+            )
+            return redirect('auto_approval_rules')
+
+    return render(request, 'borrowing/auto_approval_rules.html', {
+        'rules': rules,
+        'form': form,
+        'organization_name': org.name,
+    })
+
+@login_required
+def quota_policies(request):
+    """แอดมินองค์กร: ตั้งโควตายืมพร้อมกันต่อผู้ใช้ (เพิ่ม/เปิด-ปิด/ลบ)"""
+    redirect_response = check_admin_permission(request)
+    if redirect_response:
+        return redirect_response
+    org = request.user.organization
+    policies = QuotaPolicy.objects.for_org(org).select_related('category')
+
+    form = QuotaPolicyForm(request.POST or None)
+    if request.method == 'POST':
+        action, policy_id = request.POST.get('action'), request.POST.get('policy_id')
+        if action in ('toggle', 'delete'):
+            policy = get_object_or_404(policies, pk=policy_id)
+            if action == 'toggle':
+                policy.is_active = not policy.is_active
+                policy.save(update_fields=['is_active'])
+            else:
+                policy.delete()
+            return redirect('quota_policies')
+        if form.is_valid():
+            policy = form.save(commit=False)
+            policy.organization = org
+            policy.save()
+            messages.success(request, f'เพิ่มโควตา "{policy}" แล้ว')
+            return redirect('quota_policies')
+
+    return render(request, 'borrowing/quota_policies.html', {
+        'policies': policies,
+        'form': form,
+        'organization_name': org.name,
+    })
+
+@login_required
+def asset_maintenance(request, asset_id):
+    """แอดมินองค์กร: กำหนด/ยกเลิกช่วงบำรุงรักษาของอุปกรณ์ (ช่วงนี้ยืม/จองไม่ได้)"""
+    redirect_response = check_admin_permission(request)
+    if redirect_response:
+        return redirect_response
+    org = request.user.organization
+    asset = get_object_or_404(Asset.objects.for_org(org).select_related('item'), pk=asset_id)
+    windows = MaintenanceWindow.objects.filter(asset=asset).select_related('created_by').order_by('-start_at')
+
+    form = MaintenanceWindowForm(request.POST or None)
+    if request.method == 'POST':
+        if request.POST.get('action') == 'cancel':
+            window_id = request.POST.get('window_id', '')
+            if not window_id.isdigit():
+                messages.error(request, "ไม่พบช่วงบำรุงรักษาที่เลือก")
+                return redirect('asset_maintenance', asset_id=asset.pk)
+            # windows กรองด้วย asset นี้อยู่แล้ว: ยกเลิกช่วงของอุปกรณ์อื่นผ่าน URL นี้ไม่ได้
+            window = get_object_or_404(windows, pk=int(window_id))
+            window.asset = asset
+            if services.cancel_maintenance(window):
+                messages.success(request, "ยกเลิกช่วงบำรุงรักษาแล้ว")
+            else:
+                messages.error(request, "ช่วงนี้สิ้นสุดหรือถูกยกเลิกไปแล้ว")
+            return redirect('asset_maintenance', asset_id=asset.pk)
+        if form.is_valid():
+            window, error = services.schedule_maintenance(
+                asset, form.cleaned_data['start_at'], form.cleaned_data['end_at'],
+                reason=form.cleaned_data['reason'], actor=request.user,
+            )
+            if error:
+                messages.error(request, error)
+            else:
+                messages.success(request, "กำหนดช่วงบำรุงรักษาแล้ว")
+                return redirect('asset_maintenance', asset_id=asset.pk)
+
+    return render(request, 'borrowing/asset_maintenance.html', {
+        'asset': asset,
+        'windows': windows,
+        'form': form,
+        'organization_name': org.name,
+    })
+
+
+# -------------------------------------------------------------------
+# Request profiles (superuser เท่านั้น)
+# -------------------------------------------------------------------
+def _is_superuser(user):
+    return user.is_superuser
+
+
+@login_required
+@user_passes_test(_is_superuser)
+def profile_list(request):
+    """โปรไฟล์ล่าสุด จัดกลุ่มตามชื่อ view เรียงจากกลุ่มที่ช้าที่สุด"""
+    groups = {}
+    for p in profiling.list_profiles():
+        groups.setdefault(p['view'], []).append(p)
+    rows = []
+    for view_name, items in groups.items():
+        worst = max(items, key=lambda p: p['ms'])
+        rows.append({
+            'view': view_name,
+            'count': len(items),
+            'worst': worst,
+            'avg_ms': sum(p['ms'] for p in items) / len(items),
+            'recent': items[:5],
+        })
+    rows.sort(key=lambda r: -r['worst']['ms'])
+    page = Paginator(rows, getattr(settings, 'PROFILE_LIST_PAGE_SIZE', 20)).get_page(request.GET.get('page'))
+    return render(request, 'borrowing/profile_list.html', {
+        'rows': page.object_list,
+        'page': page,
+        'token': profiling.make_token(request.user),
+        'token_max_age': getattr(settings, 'PROFILE_TOKEN_MAX_AGE', 3600),
+    })
+
+
+@login_required
+@user_passes_test(_is_superuser)
+def profile_detail(request, name):
+    """stack ที่กินเวลามากที่สุด + ลำดับเวลา SQL; ?download=folded สำหรับ flamegraph.pl/speedscope"""
+    try:
+        record = profiling.load_profile(name)
+    except (OSError, ValueError):
+        raise Http404("ไม่พบโปรไฟล์")
+
+    if request.GET.get('download') == 'folded':
+        response = HttpResponse(profiling.collapsed(record), content_type='text/plain; charset=utf-8')
+        response['Content-Disposition'] = f'attachment; filename="{name}.folded"'
+        return response
+
+    samples = record['samples'] or 1
+    top_stacks = sorted(record['stacks'].items(), key=lambda kv: -kv[1])[:30]
+    return render(request, 'borrowing/profile_detail.html', {
+        'profile': record,
+        'top_stacks': [
+            {'frames': stack.split(';'), 'count': count, 'percent': count * 100 / samples}
+            for stack, count in top_stacks
+        ],
+        'slow_sql': sorted(record['sql'], key=lambda e: -e['ms'])[:10],
+    })
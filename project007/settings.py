@@ -48,6 +48,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'borrowing.profiling.ProfilerMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -151,3 +152,122 @@ LOGOUT_REDIRECT_URL = 'login'
 # settings.py
 LOGIN_REDIRECT_URL = '/pick-organization/'
 
+
+# ---------- งานเบื้องหลัง (borrowing/jobs.py) ----------
+# รัน worker ด้วย: python manage.py run_jobs --processes 1 --threads 2
+# production (DEBUG = False) ต้องมี worker ทำงานตลอด ไม่เช่นนั้นการแจ้งเตือนในระบบ/แจ้งแอดมินจะค้างอยู่ในคิว
+# แดชบอร์ดแอดมินแสดงคำเตือนเมื่องานค้างคิวนานกว่า JOBS_STALL_WARNING_SECONDS
+# JOBS_EAGER = True จะรันงานทันทีหลัง commit (ค่าเริ่มต้นตาม DEBUG: ตอนพัฒนาไม่ต้องเปิด worker)
+JOBS_EAGER = DEBUG
+JOBS_STALL_WARNING_SECONDS = 300
+JOB_RETRY_BASE_SECONDS = 10
+JOB_RETRY_MAX_SECONDS = 3600
+JOB_LOCK_TIMEOUT_SECONDS = 600
+JOB_RETENTION_DAYS = 7
+# ปรับรอบงาน periodic ได้ เช่น {'loans.mark_overdue': 1800}
+JOB_SCHEDULE = {}
+
+# ---------- ปฏิทินว่าง/ไม่ว่าง (borrowing/availability.py) ----------
+# หมายเหตุ: ถ้ารันหลายโปรเซส ควรตั้ง CACHES เป็น cache ที่ใช้ร่วมกัน (เช่น Redis/Memcached)
+# ไม่อย่างนั้นแต่ละโปรเซสจะล้างแคชปฏิทินได้แค่ของตัวเอง
+AVAILABILITY_DAYS = 60
+AVAILABILITY_CACHE_SECONDS = 300
+
+# ---------- กันคำขอซ้ำ (borrowing/idempotency.py) ----------
+# เก็บผลของคำขอยืม/อนุมัติ/ปฏิเสธ/คืน ไว้กี่วินาที (ส่งซ้ำภายในช่วงนี้ได้ redirect เดิม)
+IDEMPOTENCY_TTL = 600
+# คำขอซ้ำที่มาระหว่างคำขอแรกยังทำงาน รอผลได้นานสุดกี่วินาทีก่อนตอบ 409
+IDEMPOTENCY_WAIT_SECONDS = 5
+
+# ---------- จำกัดอัตราคำขอ (borrowing/ratelimit.py) ----------
+# 'N/m' = ยิงติดกันได้ N ครั้ง แล้วเติมคืน N ครั้งต่อนาที; ตัด scope/ระดับไหนออก = ไม่จำกัด
+RATE_LIMITS = {
+    'borrow': {'user': '10/m', 'org': '300/m'},
+    'loan_admin': {'user': '120/m', 'org': '600/m'},
+}
+RATE_LIMIT_CACHE = 'default'
+
+# ---------- คิวรอยืม (borrowing/services.py: promote_waitlist) ----------
+# เมื่อมีการคืน/ปฏิเสธ ตรวจหัวคิวกี่รายการว่าลงช่วงว่างของอุปกรณ์ชิ้นนั้นได้
+WAITLIST_PROMOTE_SCAN = 20
+
+# ---------- จองรายชั่วโมง (borrowing/intervals.py) ----------
+# ขนาดช่องเวลา (นาที) เวลาเริ่ม/สิ้นสุดต้องตรงขอบช่อง
+RESERVATION_SLOT_MINUTES = 60
+# อายุแคช interval tree ต่ออุปกรณ์ (ระหว่างนี้อัปเดตจาก LoanEvent ทีละเหตุการณ์ แล้วสร้างใหม่เมื่อหมดอายุ)
+SLOT_TREE_CACHE_SECONDS = 3600
+
+# ---------- จองซ้ำ (borrowing/recurrence.py) ----------
+# จำนวนครั้งสูงสุดต่อคำขอ และช่วงวันที่ยาวสุด (วัน) ของกฎเดียว
+RECURRING_MAX_OCCURRENCES = 100
+RECURRING_MAX_DAYS = 200
+
+# ---------- ตะกร้ายืม (borrowing/views.py: cart_view) ----------
+# จำนวนอุปกรณ์สูงสุดต่อหนึ่งชุดคำขอ
+CART_MAX_ITEMS = 20
+
+# ---------- ตารางแก้อุปกรณ์ (borrowing/views.py: edit_item) ----------
+# จำนวนอุปกรณ์ต่อหน้าในหน้าแก้ไขประเภทสิ่งของ
+ASSET_GRID_PAGE_SIZE = 50
+
+# ---------- แคตตาล็อกรวมทุกองค์กร (borrowing/catalog.py) ----------
+# อายุสูงสุดของ shard ต่อองค์กร (ล้างก่อนหน้านั้นด้วย stamp) และจำนวนรายการต่อหน้า
+CATALOG_CACHE_SECONDS = 600
+CATALOG_PAGE_SIZE = 24
+
+# ---------- อนุมัติอัตโนมัติ (borrowing/autoapprove.py) ----------
+# จำนวนคำขอ pending ที่ประเมินต่อหนึ่งชุด (หนึ่ง transaction)
+AUTO_APPROVE_BATCH = 200
+
+# ---------- สแกนรับ/คืน (borrowing/views.py: scan_station) ----------
+SCAN_BATCH_MAX = 500
+
+# ---------- เตือนกำหนดคืน (borrowing/reminders.py) ----------
+# เตือนล่วงหน้ากี่วันก่อนกำหนดคืน
+REMINDER_DAYS_BEFORE = 2
+
+# ---------- อีเมลแจ้งเตือน (borrowing/mailer.py) ----------
+# ส่งโดยงานเบื้องหลัง notifications.email; SMTP อ่านจาก env (ไม่ตั้ง = ค่าเริ่มต้นของ Django: localhost:25)
+# ทดสอบด้วย SMTP จำลองในเครื่อง: python -m aiosmtpd -n -l localhost:1025 แล้วรันด้วย EMAIL_PORT=1025
+NOTIFICATION_EMAIL_ENABLED = False
+EMAIL_HOST = os.environ.get('EMAIL_HOST', 'localhost')
+EMAIL_PORT = int(os.environ.get('EMAIL_PORT', 25))
+EMAIL_HOST_USER = os.environ.get('EMAIL_HOST_USER', '')
+EMAIL_HOST_PASSWORD = os.environ.get('EMAIL_HOST_PASSWORD', '')
+EMAIL_USE_TLS = os.environ.get('EMAIL_USE_TLS', '') == '1'
+DEFAULT_FROM_EMAIL = 'no-reply@localhost'
+EMAIL_BATCH_SIZE = 100
+EMAIL_RATE_PER_SECOND = 10
+EMAIL_MAX_BATCHES_PER_RUN = 10
+# ไม่ส่งอีเมลย้อนหลังของแจ้งเตือนที่เก่ากว่านี้ (ชั่วโมง)
+NOTIFICATION_EMAIL_MAX_AGE_HOURS = 24
+
+# ---------- เก็บรักษาการแจ้งเตือน (users/notifications.py) ----------
+NOTIFICATIONS_PER_PAGE = 20
+# ข้อความเดิมที่ยังไม่อ่านภายในกี่ชั่วโมง ให้รวมเป็นแถวเดียว (นับ repeat_count)
+NOTIFICATION_COALESCE_HOURS = 24
+# ลบแจ้งเตือนที่อ่านแล้วเก่ากว่ากี่วัน; NOTIFICATION_ARCHIVE = True จะย้ายเข้า NotificationArchive แทนการทิ้ง
+NOTIFICATION_RETENTION_DAYS = 90
+NOTIFICATION_ARCHIVE = False
+NOTIFICATION_PURGE_CHUNK = 1000
+
+# ---------- คลังรายการยืม (borrowing/archive.py) ----------
+# รายการที่คืน/ปฏิเสธแล้วเก่ากว่ากี่วันจะถูกย้ายไป ArchivedLoan เมื่อรัน manage.py archive_loans
+LOAN_ARCHIVE_AFTER_DAYS = 180
+
+# ---------- บันทึก query ช้า (borrowing/querylog.py) ----------
+# None = ปิด (ค่าเริ่มต้น: ไม่ครอบทุก query ของทุกโปรเซสรวมถึง worker ของ run_jobs และไฟล์ไม่โตเรื่อย ๆ)
+# เปิดชั่วคราวเพื่อเก็บ workload: SLOW_QUERY_MS=0 python manage.py runserver (0 = เก็บทุก query)
+# ใช้ระบบตามปกติสักพัก ปิดแล้วรัน `manage.py index_advisor` จากนั้นลบ/ย้ายไฟล์ log ทิ้งได้
+_slow_query_ms = os.environ.get('SLOW_QUERY_MS', '')
+SLOW_QUERY_MS = int(_slow_query_ms) if _slow_query_ms.isdigit() else None
+SLOW_QUERY_LOG_FILE = BASE_DIR / 'slow_queries.jsonl'
+
+# ---------- โปรไฟล์ request ตามคำขอ (borrowing/profiling.py) ----------
+# เปิดด้วย ?_profile=1 (superuser) หรือ header X-Profile-Token จากหน้า /borrowing/profiles/ (ผูกกับผู้ใช้ที่สร้าง)
+PROFILE_DIR = BASE_DIR / 'profiles'
+PROFILE_SAMPLE_INTERVAL_MS = 5
+PROFILE_TOKEN_MAX_AGE = 3600
+PROFILE_MAX_FILES = 200
+PROFILE_MAX_AGE_DAYS = 7
+PROFILE_LIST_PAGE_SIZE = 20
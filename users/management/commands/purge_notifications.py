@@ -0,0 +1,19 @@
+# users/management/commands/purge_notifications.py
+from django.core.management.base import BaseCommand
+from users.notifications import purge_notifications
+
+class Command(BaseCommand):
+    help = "ลบ (หรือย้ายเข้าคลังด้วย --archive) การแจ้งเตือนที่อ่านแล้วและเก่ากว่าช่วงเก็บรักษา ทีละก้อน"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, help="เก็บไว้กี่วัน (ค่าเริ่มต้น NOTIFICATION_RETENTION_DAYS)")
+        parser.add_argument('--archive', action='store_true', default=None, help="ย้ายเข้า NotificationArchive ก่อนลบ")
+        parser.add_argument('--chunk-size', type=int, help="จำนวนแถวต่อ transaction")
+        parser.add_argument('--pause', type=float, default=0.0, help="วินาทีที่พักระหว่างก้อน")
+
+    def handle(self, *args, **options):
+        purged = purge_notifications(
+            days=options['days'], archive=options['archive'],
+            chunk_size=options['chunk_size'], pause=options['pause'],
+        )
+        self.stdout.write(self.style.SUCCESS(f"Notifications purged: {purged}"))
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0006_organization_logo'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='email_claimed_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='เริ่มส่งอีเมล'),
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='emailed_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='ส่งอีเมลแล้ว'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['emailed_at', 'created_at'], name='users_notif_emailed_e70d68_idx'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0007_notification_email'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('user_id', models.IntegerField(db_index=True, verbose_name='ผู้รับ')),
+                ('message', models.TextField(verbose_name='ข้อความแจ้งเตือน')),
+                ('repeat_count', models.PositiveIntegerField(default=1, verbose_name='จำนวนครั้ง')),
+                ('created_at', models.DateTimeField(verbose_name='วันที่สร้าง')),
+                ('archived_at', models.DateTimeField(auto_now_add=True, verbose_name='วันที่ย้ายเข้าคลัง')),
+            ],
+            options={
+                'verbose_name': 'คลังการแจ้งเตือน',
+                'verbose_name_plural': 'คลังการแจ้งเตือน',
+            },
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='repeat_count',
+            field=models.PositiveIntegerField(default=1, verbose_name='จำนวนครั้ง'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['user', '-created_at'], name='users_notif_user_id_c37f16_idx'),
+        ),
+    ]
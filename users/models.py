@@ -52,6 +52,11 @@ class Notification(models.Model):
     message = models.TextField(verbose_name="ข้อความแจ้งเตือน")
     is_read = models.BooleanField(default=False, verbose_name="อ่านแล้ว")
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="วันที่สร้าง")
+    # ข้อความซ้ำที่ยังไม่ได้อ่านรวมเป็นแถวเดียว (users/notifications.py) นับจำนวนครั้งไว้ที่นี่
+    repeat_count = models.PositiveIntegerField(default=1, verbose_name="จำนวนครั้ง")
+    # ช่องทางอีเมล (borrowing/mailer.py): เวลาที่ worker หยิบไปส่ง และเวลาที่ส่งสำเร็จ
+    email_claimed_at = models.DateTimeField(null=True, blank=True, editable=False, verbose_name="เริ่มส่งอีเมล")
+    emailed_at = models.DateTimeField(null=True, blank=True, editable=False, verbose_name="ส่งอีเมลแล้ว")
     # คุณสามารถเพิ่มฟิลด์อื่นๆ เช่น type_of_notification (loan_request, loan_approved, etc.)
     # หรือ related_object (ForeignKey ไปยัง Loan/Item) ได้ในอนาคต
 
@@ -59,8 +64,28 @@ class Notification(models.Model):
         verbose_name = "การแจ้งเตือน"
         verbose_name_plural = "การแจ้งเตือน"
         ordering = ['-created_at'] # เรียงลำดับจากใหม่ไปเก่า
+        indexes = [
+            # หน้าแจ้งเตือน/กระดิ่ง: WHERE user=? ORDER BY created_at DESC
+            models.Index(fields=['user', '-created_at']),
+            # outbox ของอีเมล: WHERE emailed_at IS NULL AND created_at >= ? ORDER BY created_at
+            models.Index(fields=['emailed_at', 'created_at']),
+        ]
 
     def __str__(self):
         return f"Notification for {self.user.username}: {self.message[:50]}..."
+
+
+class NotificationArchive(models.Model):
+    """แจ้งเตือนที่อ่านแล้วและพ้นช่วงเก็บรักษา (ย้ายมาจาก Notification เมื่อตั้ง NOTIFICATION_ARCHIVE = True)"""
+    # ไม่ผูก FK: ผู้ใช้ถูกลบแล้วประวัติยังอยู่
+    user_id = models.IntegerField(db_index=True, verbose_name="ผู้รับ")
+    message = models.TextField(verbose_name="ข้อความแจ้งเตือน")
+    repeat_count = models.PositiveIntegerField(default=1, verbose_name="จำนวนครั้ง")
+    created_at = models.DateTimeField(verbose_name="วันที่สร้าง")
+    archived_at = models.DateTimeField(auto_now_add=True, verbose_name="วันที่ย้ายเข้าคลัง")
+
+    class Meta:
+        verbose_name = "คลังการแจ้งเตือน"
+        verbose_name_plural = "คลังการแจ้งเตือน"
     
     
@@ -0,0 +1,90 @@
+# users/notifications.py
+"""
+สร้าง/เก็บรักษาการแจ้งเตือน
+
+- create_notifications(): ข้อความเดียวกันที่ผู้ใช้ยังไม่ได้อ่าน (ภายใน NOTIFICATION_COALESCE_HOURS)
+  ไม่สร้างแถวใหม่ แต่เพิ่ม repeat_count ดันขึ้นบนสุด และล้าง emailed_at ให้ช่องทางอีเมลแจ้งรอบใหม่ด้วย
+- purge_notifications(): ลบ (หรือย้ายเข้าคลัง) แจ้งเตือนที่อ่านแล้วและเก่ากว่า NOTIFICATION_RETENTION_DAYS
+  ทีละก้อนใน transaction สั้น ๆ ไม่ล็อกตารางนาน
+"""
+import time
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Notification, NotificationArchive
+
+
+def create_notifications(pairs):
+    """pairs = [(user_id, message), ...] คืนจำนวนแถวใหม่ที่สร้าง"""
+    counts = Counter((uid, message) for uid, message in pairs)
+    if not counts:
+        return 0
+    now = timezone.now()
+    window = now - timedelta(hours=getattr(settings, 'NOTIFICATION_COALESCE_HOURS', 24))
+
+    existing = {}
+    for pk, uid, message in (
+        Notification.objects.filter(
+            user_id__in={uid for uid, _ in counts},
+            message__in={message for _, message in counts},
+            is_read=False,
+            created_at__gte=window,
+        )
+        .order_by('created_at')
+        .values_list('pk', 'user_id', 'message')
+    ):
+        existing[(uid, message)] = pk   # ถ้ามีหลายแถว ใช้แถวล่าสุด
+
+    with transaction.atomic():
+        # รวม UPDATE ตามจำนวนที่เพิ่ม (ส่วนใหญ่เพิ่มทีละ 1 -> UPDATE เดียว)
+        by_increment = {}
+        for key, pk in existing.items():
+            by_increment.setdefault(counts[key], []).append(pk)
+        for increment, pks in by_increment.items():
+            Notification.objects.filter(pk__in=pks).update(
+                repeat_count=F('repeat_count') + increment, created_at=now,
+                emailed_at=None, email_claimed_at=None,
+            )
+        Notification.objects.bulk_create([
+            Notification(user_id=uid, message=message, repeat_count=n)
+            for (uid, message), n in counts.items() if (uid, message) not in existing
+        ])
+    return len(counts) - len(existing)
+
+
+def purge_notifications(days=None, archive=None, chunk_size=None, pause=0.0):
+    """ลบ/ย้ายแจ้งเตือนที่อ่านแล้วเก่ากว่า days วัน คืนจำนวนแถวที่จัดการ"""
+    days = days if days is not None else getattr(settings, 'NOTIFICATION_RETENTION_DAYS', 90)
+    archive = archive if archive is not None else getattr(settings, 'NOTIFICATION_ARCHIVE', False)
+    chunk_size = chunk_size or getattr(settings, 'NOTIFICATION_PURGE_CHUNK', 1000)
+    cutoff = timezone.now() - timedelta(days=days)
+
+    total, last_pk = 0, 0
+    while True:
+        # เดินตาม pk ไปข้างหน้า: ไม่ต้องสแกนแถวที่ผ่านไปแล้วซ้ำในแต่ละก้อน
+        rows = list(
+            Notification.objects.filter(pk__gt=last_pk, is_read=True, created_at__lt=cutoff)
+            .order_by('pk')
+            .values('pk', 'user_id', 'message', 'repeat_count', 'created_at')[:chunk_size]
+        )
+        if not rows:
+            return total
+        with transaction.atomic():
+            if archive:
+                NotificationArchive.objects.bulk_create([
+                    NotificationArchive(
+                        user_id=r['user_id'], message=r['message'],
+                        repeat_count=r['repeat_count'], created_at=r['created_at'],
+                    )
+                    for r in rows
+                ])
+            Notification.objects.filter(pk__in=[r['pk'] for r in rows]).delete()
+        total += len(rows)
+        last_pk = rows[-1]['pk']
+        if pause:
+            time.sleep(pause)   # เว้นช่วงให้ query อื่นได้ใช้ตาราง
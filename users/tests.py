@@ -1,3 +1,43 @@
-from django.test import TestCase
+from datetime import timedelta
 
-# Create your tests here.
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from borrowing import jobs
+from borrowing.models import Job
+
+from .models import CustomUser, Organization
+
+STALL_BANNER = 'งานเบื้องหลังค้างคิวมาแล้ว'
+
+
+@override_settings(JOBS_EAGER=False, JOBS_STALL_WARNING_SECONDS=300)
+class JobStallBannerTests(TestCase):
+    def setUp(self):
+        self.org = Organization.objects.create(name='Org', address='-')
+        self.org_admin = CustomUser.objects.create_user('orgadmin', email='', organization=self.org, is_org_admin=True)
+        self.superuser = CustomUser.objects.create_superuser('root', email='root@example.com', password='x')
+
+    def queue_job(self, age):
+        job = jobs.enqueue('notifications.send_many', {'pairs': []})
+        Job.objects.filter(pk=job.pk).update(run_at=timezone.now() - age)
+
+    def test_no_banner_while_queue_keeps_up(self):
+        self.queue_job(timedelta(seconds=30))
+        self.assertIsNone(jobs.stalled_minutes())
+        self.client.force_login(self.org_admin)
+        self.assertNotContains(self.client.get(reverse('dashboard')), STALL_BANNER)
+
+    def test_banner_when_worker_is_not_running(self):
+        self.queue_job(timedelta(minutes=12))
+        self.assertEqual(jobs.stalled_minutes(), 12)
+
+        self.client.force_login(self.org_admin)
+        self.assertContains(self.client.get(reverse('dashboard')), f'{STALL_BANNER} 12 นาที')
+        self.client.force_login(self.superuser)
+        self.assertContains(self.client.get(reverse('superuser_dashboard')), f'{STALL_BANNER} 12 นาที')
+
+    def test_jobs_eager_defaults_to_debug(self):
+        from project007 import settings as project_settings
+        self.assertEqual(project_settings.JOBS_EAGER, project_settings.DEBUG)
@@ -4,13 +4,15 @@ from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib.auth.views import LoginView
+from django.core.paginator import Paginator
 from django.db import transaction
 from django.db.models import Q, Count
 from django.http import JsonResponse
 from django.shortcuts import render, redirect, get_object_or_404
 from django.urls import reverse_lazy
 
-from django.db.models import Q, Count, Exists, OuterRef
+from django.db.models import Q, Count, Exists, OuterRef, Sum
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 
 from .forms import (
@@ -19,7 +21,9 @@ from .forms import (
     LinkBasedUserRegistrationForm,
 )
 from .models import CustomUser, Organization, Notification
-from borrowing.models import Item, Asset, Loan
+from borrowing.models import Item, Asset, Loan, OrgLoanStats, WaitlistEntry
+from borrowing.archive import loan_history, hydrate
+from borrowing import jobs
 
 
 # -------------------------------
@@ -96,17 +100,17 @@ def dashboard(request):
     if request.user.is_org_admin:
         organization = request.user.organization
 
-        total_item_types = Item.objects.filter(organization=organization).count()
-        total_assets = Asset.objects.filter(item__organization=organization).count()
-        available_assets_count = Asset.objects.filter(item__organization=organization, status='available').count()
-        on_loan_assets_count = Asset.objects.filter(item__organization=organization, status='on_loan').count()
+        total_item_types = Item.objects.for_org(organization).count()
+        total_assets = Asset.objects.for_org(organization).count()
+        available_assets_count = Asset.objects.for_org(organization).filter(status='available').count()
+        on_loan_assets_count = Asset.objects.for_org(organization).filter(status='on_loan').count()
 
-        pending_loan_requests = Loan.objects.filter(
-            asset__item__organization=organization, status='pending'
+        pending_loan_requests = Loan.objects.for_org(organization).filter(
+            status='pending'
         ).count()
 
-        overdue_count = Loan.objects.filter(
-            asset__item__organization=organization, status='overdue'
+        overdue_count = Loan.objects.for_org(organization).filter(
+            status='overdue'
         ).count()
 
         active_users_count = CustomUser.objects.filter(
@@ -116,14 +120,16 @@ def dashboard(request):
         # ⬇️ ปรับ: active = approved + overdue
         active_loans = (
             Loan.objects
-            .filter(asset__item__organization=organization, status__in=['approved', 'overdue'])
+            .for_org(organization)
+            .filter(status__in=['approved', 'overdue'])
             .select_related('asset__item', 'borrower')
             .order_by('due_date')
         )
 
         pending_loans = (
             Loan.objects
-            .filter(asset__item__organization=organization, status='pending')
+            .for_org(organization)
+            .filter(status='pending')
             .select_related('asset__item', 'borrower')
             .order_by('-borrow_date')
         )
@@ -131,7 +137,7 @@ def dashboard(request):
         # ⬇️ ปรับ: ย้าย overdue ออกไปจาก history (เพราะยังไม่ปิด)
         loan_history = (
             Loan.objects
-            .filter(asset__item__organization=organization)
+            .for_org(organization)
             .exclude(status__in=['pending', 'approved', 'overdue'])
             .select_related('asset__item', 'borrower')
             .order_by('-borrow_date')
@@ -150,6 +156,7 @@ def dashboard(request):
             'pending_loans': pending_loans,
             'active_loans': active_loans,
             'loan_history': loan_history,
+            'job_stalled_minutes': jobs.stalled_minutes(),
         }
         return render(request, 'users/dashboard.html', context)
 
@@ -167,7 +174,7 @@ def user_dashboard(request):
         return redirect('pick_organization')
 
     queryset = Asset.objects.filter(
-        item__organization_id=current_org_id
+        organization_id=current_org_id
     ).select_related('item')
 
     query = (request.GET.get('q') or '').strip()
@@ -347,17 +354,31 @@ def deactivate_user(request, user_id):
 # -------------------------------------------------------------------
 @login_required
 def my_borrowed_items_history(request):
-    my_loans = Loan.objects.filter(borrower=request.user).order_by('-borrow_date')
-    return render(request, 'users/my_borrowed_items_history.html', {'my_loans': my_loans})
+    # รวมประวัติที่ย้ายเข้าคลังแล้ว (borrowing/archive.py)
+    my_loans = hydrate(loan_history(borrower=request.user).order_by('-borrow_date'))
+    waitlist = (
+        WaitlistEntry.objects.filter(user=request.user, status='waiting')
+        .select_related('item__organization').order_by('start_date')
+    )
+    return render(request, 'users/my_borrowed_items_history.html', {
+        'my_loans': my_loans,
+        'waitlist': waitlist,
+    })
 
 
 @login_required
 def user_notifications(request):
     notifications = Notification.objects.filter(user=request.user).order_by('-created_at')
-    unread_notifications = notifications.filter(is_read=False)
-    if unread_notifications.exists():
-        unread_notifications.update(is_read=True)
-    return render(request, 'users/notifications.html', {'notifications': notifications})
+    page = Paginator(notifications, getattr(settings, 'NOTIFICATIONS_PER_PAGE', 20)).get_page(request.GET.get('page'))
+    # อ่านแล้วเฉพาะรายการที่แสดงในหน้านี้ (ไม่ UPDATE ทั้งประวัติทุกครั้งที่เปิดหน้า)
+    unread_ids = [n.pk for n in page if not n.is_read]
+    if unread_ids:
+        Notification.objects.filter(pk__in=unread_ids).update(is_read=True)
+    return render(request, 'users/notifications.html', {
+        'notifications': page,
+        'page_obj': page,
+        'unread_ids': set(unread_ids),
+    })
 
 
 @login_required
@@ -386,19 +407,27 @@ def superuser_dashboard(request):
     item_count = Item.objects.count()
     asset_count = Asset.objects.count()
 
-    loans_total = Loan.objects.count()
-    loans_pending = Loan.objects.filter(status='pending').count()
-    loans_approved = Loan.objects.filter(status='approved').count()
-    loans_overdue = Loan.objects.filter(status='overdue').count()
-    loans_returned = Loan.objects.filter(status='returned').count()
-    loans_rejected = Loan.objects.filter(status='rejected').count()
+    # จำนวนตามสถานะอ่านจาก read model (OrgLoanStats) แทนการ COUNT ทั้งตาราง Loan 6 รอบ
+    loan_stats = OrgLoanStats.objects.aggregate(
+        pending=Coalesce(Sum('pending'), 0),
+        approved=Coalesce(Sum('approved'), 0),
+        overdue=Coalesce(Sum('overdue'), 0),
+        returned=Coalesce(Sum('returned'), 0),
+        rejected=Coalesce(Sum('rejected'), 0),
+    )
+    loans_pending = loan_stats['pending']
+    loans_approved = loan_stats['approved']
+    loans_overdue = loan_stats['overdue']
+    loans_returned = loan_stats['returned']
+    loans_rejected = loan_stats['rejected']
+    loans_total = sum(loan_stats.values())
 
     recent_orgs = Organization.objects.order_by('-id')[:8]
     recent_users = CustomUser.objects.order_by('-date_joined')[:8]
     recent_loans = Loan.objects.select_related('asset__item', 'borrower').order_by('-borrow_date')[:10]
 
     top_orgs_by_loans = (
-        Loan.objects.values('asset__item__organization__name')
+        Loan.objects.values('organization__name')
         .annotate(total_loans=Count('id')).order_by('-total_loans')[:5]
     )
     top_items_by_loans = (
@@ -423,6 +452,7 @@ def superuser_dashboard(request):
         'recent_loans': recent_loans,
         'top_orgs_by_loans': top_orgs_by_loans,
         'top_items_by_loans': top_items_by_loans,
+        'job_stalled_minutes': jobs.stalled_minutes(),
     })
 
 